@@ -0,0 +1,149 @@
+"""
+Estimate memory per million documents and the recall cost of compact storage.
+
+Vector encodings (float32, float16, int8 scalar quantization as in IVF_SQ8, and product
+quantization as in IVF_PQ) are simulated in NumPy on clustered random vectors, with and
+without the float re-rank RAGService applies to quantized indexes. Text size is measured
+on real sentences, raw and as stored by ``compress_text``. No Milvus server is needed.
+
+    python benchmarks/bench_compact.py --size 100000 --rerank-factor 4
+"""
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from bench_index import exact_top_k, make_vectors  # noqa: E402
+from rag import compress_text  # noqa: E402
+
+README = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "README.md")
+
+
+def quantize_sq8(vectors):
+    """
+    Per-dimension min/max int8 scalar quantization; returns the decoded approximation.
+    """
+    low, high = vectors.min(axis=0), vectors.max(axis=0)
+    scale = np.where(high > low, (high - low) / 255, 1)
+    codes = np.round((vectors - low) / scale).astype(np.uint8)
+    return codes.astype(np.float32) * scale + low
+
+
+def train_pq(vectors, m, iterations, rng, sample_size=20000):
+    """
+    K-means codebooks with 256 centroids for each of ``m`` subspaces.
+    """
+    sample = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+    sub_dim = vectors.shape[1] // m
+    codebooks = []
+    for j in range(m):
+        part = sample[:, j * sub_dim:(j + 1) * sub_dim]
+        centroids = part[rng.choice(len(part), 256, replace=False)]
+        for _ in range(iterations):
+            assignment = nearest(part, centroids)
+            for c in range(256):
+                members = part[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+        codebooks.append(centroids)
+    return codebooks
+
+
+def nearest(points, centroids):
+    distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)
+    return distances.argmin(axis=1)
+
+
+def encode_pq(vectors, codebooks):
+    sub_dim = vectors.shape[1] // len(codebooks)
+    return np.stack(
+        [nearest(vectors[:, j * sub_dim:(j + 1) * sub_dim], centroids) for j, centroids in enumerate(codebooks)],
+        axis=1
+    ).astype(np.uint8)
+
+
+def pq_scores(queries, codes, codebooks):
+    """
+    Asymmetric inner products: per-subspace lookup tables summed over the codes.
+    """
+    sub_dim = queries.shape[1] // len(codebooks)
+    scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+    for j, centroids in enumerate(codebooks):
+        table = queries[:, j * sub_dim:(j + 1) * sub_dim] @ centroids.T
+        scores += table[:, codes[:, j]]
+    return scores
+
+
+def recall(scores, vectors, queries, truth, k, rerank_factor):
+    """
+    Recall@k of the approximate scores, and after re-ranking ``rerank_factor * k`` candidates exactly.
+    """
+    approximate = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidates = np.argpartition(-scores, k * rerank_factor - 1, axis=1)[:, :k * rerank_factor]
+    exact = np.einsum("qd,qcd->qc", queries, vectors[candidates])
+    reranked = np.take_along_axis(candidates, np.argsort(-exact, axis=1)[:, :k], axis=1)
+
+    def hits(found):
+        return np.mean([len(set(row) & set(expected)) / k for row, expected in zip(found, truth)])
+
+    return hits(approximate), hits(reranked)
+
+
+def text_sizes(path):
+    with open(path, encoding="utf-8") as f:
+        content = re.sub(r"[#*`>\-]", " ", f.read())
+    texts = [" ".join(part.split()) for part in re.split(r"\n\s*\n", content)]
+    texts = [text for text in texts if len(text) > 20]
+    raw = np.mean([len(text.encode("utf-8")) for text in texts])
+    stored = np.mean([len(compress_text(text).encode("utf-8")) for text in texts])
+    return raw, stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--pq-m", type=int, default=96)
+    parser.add_argument("--pq-iterations", type=int, default=8)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--text-file", default=README)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = make_vectors(args.size, args.dim, args.clusters, rng)
+    queries = make_vectors(args.queries, args.dim, args.clusters, rng)
+    truth = exact_top_k(vectors, queries, args.top_k)
+
+    codebooks = train_pq(vectors, args.pq_m, args.pq_iterations, rng)
+    encodings = {
+        "float32": (args.dim * 4, queries @ vectors.T),
+        "float16": (args.dim * 2, queries.astype(np.float16).astype(np.float32) @
+                    vectors.astype(np.float16).astype(np.float32).T),
+        "IVF_SQ8": (args.dim, queries @ quantize_sq8(vectors).T),
+        "IVF_PQ": (args.pq_m, pq_scores(queries, encode_pq(vectors, codebooks), codebooks)),
+    }
+
+    million = 1_000_000
+    print(f"{'vectors':>8} {'bytes/vec':>9} {'MB per 1M':>10} {'recall@' + str(args.top_k):>10} "
+          f"{'reranked':>9}")
+    for name, (bytes_per_vector, scores) in encodings.items():
+        plain, reranked = recall(scores, vectors, queries, truth, args.top_k, args.rerank_factor)
+        print(f"{name:>8} {bytes_per_vector:>9} {bytes_per_vector * million / 2 ** 20:>10.0f} "
+              f"{plain:>10.3f} {reranked:>9.3f}")
+
+    raw, stored = text_sizes(args.text_file)
+    print(f"\ntext: {raw:.0f} B raw, {stored:.0f} B stored compressed "
+          f"({raw * million / 2 ** 20:.0f} -> {stored * million / 2 ** 20:.0f} MB per 1M documents)")
+    print("The re-rank reads the stored vectors of the candidates, so quantized indexes keep "
+          "full-precision (or float16) vectors on disk but only the codes in memory.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark recall@k and search latency of the supported vector index types.
+
+Random clustered vectors are inserted into a scratch collection, each index type is
+built in turn, and every query is compared against exact (brute force) neighbours.
+
+    python benchmarks/bench_index.py --uri http://localhost:19530 --token root:Milvus
+    python benchmarks/bench_index.py --sizes 10000 --index-types FLAT IVF_FLAT  # Milvus Lite
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from pymilvus import DataType, MilvusClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from rag import INDEX_DEFAULTS, build_index_params  # noqa: E402
+
+COLLECTION_NAME = "bench_index"
+
+
+def make_vectors(n, dim, n_clusters, rng):
+    """
+    Draw normalized vectors around random centroids, closer to real embeddings than pure noise.
+    """
+    centroids = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    vectors = centroids[rng.integers(0, n_clusters, n)]
+    vectors += 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def exact_top_k(vectors, queries, k, chunk_size=100000):
+    """
+    Brute-force cosine top-k ids (vectors are normalized, so inner product == cosine).
+    """
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        scores = queries @ vectors[start:start + chunk_size].T
+        ids = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids
+
+
+def create_collection(client, dim):
+    if client.has_collection(COLLECTION_NAME):
+        client.drop_collection(COLLECTION_NAME)
+    schema = client.create_schema(auto_id=False, enable_dynamic_field=False)
+    schema.add_field("id", DataType.INT64, is_primary=True)
+    schema.add_field("vector", DataType.FLOAT_VECTOR, dim=dim)
+    client.create_collection(COLLECTION_NAME, schema=schema)
+
+
+def insert_vectors(client, vectors, batch_size):
+    for start in range(0, len(vectors), batch_size):
+        chunk = vectors[start:start + batch_size]
+        client.insert(COLLECTION_NAME, [
+            {"id": start + i, "vector": vector} for i, vector in enumerate(chunk)
+        ])
+
+
+def build(client, index_type, params):
+    client.release_collection(COLLECTION_NAME)
+    if client.list_indexes(COLLECTION_NAME):
+        client.drop_index(COLLECTION_NAME, "vector")
+    started = time.perf_counter()
+    client.create_index(COLLECTION_NAME, build_index_params(index_type, params=params))
+    client.load_collection(COLLECTION_NAME)
+    return time.perf_counter() - started
+
+
+def run_queries(client, queries, truth, k, search_params):
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = client.search(
+            COLLECTION_NAME,
+            data=[query],
+            limit=k,
+            search_params={"metric_type": "COSINE", "params": search_params}
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len({item["id"] for item in result[0]} & set(expected.tolist()))
+    latencies = np.array(latencies)
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=os.getenv("MILVUS_URI", ""))
+    parser.add_argument("--token", default=os.getenv("MILVUS_TOKEN", ""))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_DEFAULTS))
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.uri:
+        client = MilvusClient(uri=args.uri, token=args.token)
+    else:
+        client = MilvusClient("bench_index.db")
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'vectors':>9} {'index':>9} {'build_s':>8} {'recall@' + str(args.top_k):>10} {'p50_ms':>8} {'p99_ms':>8}")
+    for size in args.sizes:
+        vectors = make_vectors(size, args.dim, args.clusters, rng)
+        queries = make_vectors(args.queries, args.dim, args.clusters, rng)
+        truth = exact_top_k(vectors, queries, args.top_k)
+
+        create_collection(client, args.dim)
+        insert_vectors(client, vectors, args.batch_size)
+        for index_type in args.index_types:
+            try:
+                build_seconds = build(client, index_type, INDEX_DEFAULTS[index_type][0])
+                stats = run_queries(client, queries, truth, args.top_k, INDEX_DEFAULTS[index_type][1])
+            except Exception as e:
+                print(f"{size:>9} {index_type:>9} failed: {e}")
+                continue
+            print(
+                f"{size:>9} {index_type:>9} {build_seconds:>8.2f} {stats['recall']:>10.3f} "
+                f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f}"
+            )
+        client.drop_collection(COLLECTION_NAME)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Offline load test of /process and /query with per-stage latency and baseline checks.
+
+Everything runs in-process: the LLM is replaced by a deterministic fake with a
+configurable delay, Redis by fakeredis (or a real server with --redis-url), Milvus by
+Milvus Lite in a scratch directory and the embedding model by the hashing backend (pass
+--embedding-backend default to time the real model). Stage timings come from wrapping
+the service methods each request goes through.
+
+    python benchmarks/load_test.py --documents 2000 --queries 2000 --concurrency 16
+    python benchmarks/load_test.py --save-baseline benchmarks/load_test_baseline.json
+    python benchmarks/load_test.py --baseline benchmarks/load_test_baseline.json  # exits 1 on regression
+
+Baselines are machine-specific: record one on the machine that runs the comparison.
+"""
+import argparse
+import inspect
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from loguru import logger
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+SUBJECTS = ["OpenAI", "Milvus", "Redis", "Quantum mechanics", "The Eiffel Tower", "Python", "Mount Everest",
+            "The Moon landing", "Schrodinger's equation", "The Copenhagen interpretation"]
+PREDICATES = ["was founded in", "was first described in", "became popular in", "was measured in",
+              "was revised in"]
+CHATTER = ["I just had a coffee", "The weather is nice today", "Remind me to call mom", "I like this song",
+           "Lunch was great", "I am a bit tired"]
+
+
+FACT = re.compile(r" in \d{4}\b")
+
+
+class FakeLLM:
+    def __init__(self, latency_ms=0.0):
+        """
+        Stand-in for ``LLM``: scores facts (texts mentioning a year) as important and
+        everything else as chatter, after sleeping ``latency_ms`` to mimic the API round-trip.
+        """
+        self.latency = latency_ms / 1000
+
+    def generate_response(self, system_prompt, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        if FACT.search(prompt):
+            return str(70 + zlib.crc32(prompt.encode("utf-8")) % 30)
+        return str(10 + zlib.crc32(prompt.encode("utf-8")) % 40)
+
+
+class StageRecorder:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def instrument(self, obj, attribute, stage):
+        """
+        Replace ``obj.attribute`` with a wrapper that records its duration under ``stage``.
+        """
+        original = getattr(obj, attribute)
+
+        if inspect.iscoroutinefunction(original):
+            async def timed_async(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - started)
+
+            setattr(obj, attribute, timed_async)
+            return
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+
+        setattr(obj, attribute, timed)
+
+    def summary(self):
+        summary = {}
+        for stage, samples in sorted(self.samples.items()):
+            milliseconds = np.array(samples) * 1000
+            summary[stage] = {
+                "count": len(samples),
+                "mean_ms": float(milliseconds.mean()),
+                "p50_ms": float(np.percentile(milliseconds, 50)),
+                "p95_ms": float(np.percentile(milliseconds, 95)),
+                "p99_ms": float(np.percentile(milliseconds, 99)),
+            }
+        return summary
+
+
+def make_workload(documents, queries, rng):
+    """
+    Facts (long-term) mixed with chatter (short-term), then queries that repeat chatter
+    exactly, ask about stored facts, or ask about nothing stored.
+    """
+    inputs = []
+    for i in range(documents):
+        if rng.random() < 0.6:
+            subject = SUBJECTS[rng.integers(len(SUBJECTS))]
+            predicate = PREDICATES[rng.integers(len(PREDICATES))]
+            inputs.append(f"{subject} {predicate} {1900 + int(rng.integers(125))} (record {i})")
+        else:
+            inputs.append(f"{CHATTER[rng.integers(len(CHATTER))]} (note {i})")
+
+    facts = [text for text in inputs if FACT.search(text)]
+    chatter = [text for text in inputs if not FACT.search(text)]
+    questions = []
+    for _ in range(queries):
+        roll = rng.random()
+        if roll < 0.4 and chatter:
+            questions.append(chatter[rng.integers(len(chatter))])
+        elif roll < 0.8 and facts:
+            fact = facts[rng.integers(len(facts))]
+            questions.append(f"When {fact.split(' (')[0].replace(' in ', ' ', 1)}?")
+        else:
+            questions.append(f"What is the capital of planet {int(rng.integers(10 ** 6))}?")
+    return inputs, questions
+
+
+def setup_services(args, recorder):
+    """
+    Import the app with offline settings and instrument its stages.
+    """
+    os.environ.update({
+        "MILVUS_URI": "",
+        "MILVUS_INDEX_TYPE": "FLAT",
+        "MILVUS_RESET_COLLECTION": "true",
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "offline"),
+        "EMBEDDING_BACKEND": args.embedding_backend,
+        "EMBEDDING_CACHE_REDIS": "false",
+        "BACKGROUND_JOBS": "false",
+        "REDIS_URL": args.redis_url or "redis://localhost:6379/0",
+        # The app's file log goes to the scratch directory, not the repository
+        "LOG_FILE": os.path.abspath(os.path.join("logs", "app.log")),
+    })
+    sys.path.insert(0, SRC)
+    logger.remove()
+    import main
+    from short_term_store import ShortTermStore
+    logger.remove()  # main adds a file sink
+    logger.add(sys.stderr, level="WARNING")
+
+    if not args.redis_url:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        main.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        main.short_term_store = ShortTermStore(
+            main.redis_client, async_redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        )
+        main.memory_service.short_term_store = main.consolidation_engine.short_term_store = main.short_term_store
+    main.importance_scorer.llm = FakeLLM(args.llm_latency_ms)
+
+    recorder.instrument(main.importance_scorer, "score", "importance")
+    recorder.instrument(main.rag_service, "encode_documents", "embed_documents")
+    recorder.instrument(main.rag_service, "encode_queries", "embed_query")
+    recorder.instrument(main.rag_service, "_insert_rows", "milvus_insert")
+    recorder.instrument(main.rag_service, "_dense_search", "milvus_search")
+    recorder.instrument(main.rag_service, "lexical_search", "lexical_search")
+    recorder.instrument(main.memory_service, "lookup_short_term", "redis_lookup")
+    recorder.instrument(main.memory_service, "alookup_short_term", "redis_lookup")
+
+    deadline = time.monotonic() + 120
+    while not (main.rag_service.is_ready and main.rag_service.embedder_ready) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    return main
+
+
+def make_client(args, main):
+    if args.app == "asgi":
+        from starlette.testclient import TestClient
+        import asgi
+        client = TestClient(asgi.app)
+        client.__enter__()
+
+        def post(path, body):
+            response = client.post(path, json=body)
+            return response.status_code, response.json()
+
+        return post, lambda: client.__exit__(None, None, None)
+
+    flask_client = main.app.test_client()
+
+    def post(path, body):
+        response = flask_client.post(path, json=body)
+        return response.status_code, response.json
+
+    return post, lambda: None
+
+
+def run_phase(name, requests, post, concurrency, recorder):
+    """
+    Send ``(path, body)`` requests from ``concurrency`` threads; returns phase statistics.
+    """
+    errors = []
+    sources = {}
+
+    def send(request):
+        path, body = request
+        started = time.perf_counter()
+        status, payload = post(path, body)
+        recorder.record(name, time.perf_counter() - started)
+        if status >= 400:
+            errors.append(status)
+        elif isinstance(payload, dict) and "source" in payload:
+            sources[payload["source"]] = sources.get(payload["source"], 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, requests))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(requests),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "throughput_rps": len(requests) / elapsed if elapsed else 0.0,
+        "sources": sources,
+    }
+
+
+def compare(result, baseline, tolerance, min_delta_ms):
+    """
+    List regressions: p95 latency above, or throughput below, the baseline by more than
+    ``tolerance``. Latency changes under ``min_delta_ms`` are treated as noise.
+    """
+    regressions = []
+    differing = [key for key, value in baseline.get("config", {}).items() if result["config"].get(key) != value]
+    if differing:
+        print(f"Warning: baseline was recorded with different settings: {', '.join(differing)}")
+    for stage, stats in baseline.get("stages", {}).items():
+        current = result["stages"].get(stage)
+        if current and current["p95_ms"] > max(stats["p95_ms"] * (1 + tolerance), stats["p95_ms"] + min_delta_ms):
+            regressions.append(f"{stage}: p95 {current['p95_ms']:.2f} ms vs baseline {stats['p95_ms']:.2f} ms")
+    for phase, stats in baseline.get("phases", {}).items():
+        current = result["phases"].get(phase)
+        if current and current["throughput_rps"] < stats["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{phase}: {current['throughput_rps']:.1f} req/s vs baseline {stats['throughput_rps']:.1f} req/s"
+            )
+    return regressions
+
+
+def print_report(result):
+    for phase, stats in result["phases"].items():
+        print(f"{phase}: {stats['requests']} requests in {stats['seconds']:.2f}s "
+              f"({stats['throughput_rps']:.1f} req/s, {stats['errors']} errors) {stats['sources'] or ''}")
+    print(f"\n{'stage':>16} {'count':>7} {'mean_ms':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:>16} {stats['count']:>7} {stats['mean_ms']:>8.2f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=0, help="send inputs through /process/batch")
+    parser.add_argument("--async-ingest", action="store_true",
+                        help="queue inputs (202) and time draining the ingest queue as its own phase")
+    parser.add_argument("--app", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--preload", help="import a long-term memory snapshot before the run")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embedding-backend", default="hashing")
+    parser.add_argument("--redis-url", default="", help="use a real Redis instead of fakeredis")
+    parser.add_argument("--workdir", help="where Milvus Lite keeps its files (default: a temporary directory)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare against a results JSON and exit 1 on regressions")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for option in ("output", "baseline", "save_baseline", "preload"):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="memory-load-test-"))
+
+    recorder = StageRecorder()
+    app_main = setup_services(args, recorder)
+    if args.preload:
+        from snapshots import import_snapshot
+        print(f"Preloaded {import_snapshot(app_main.rag_service, args.preload)} documents from {args.preload}")
+        recorder.samples.clear()  # the run's stages only
+    post, close = make_client(args, app_main)
+    inputs, questions = make_workload(args.documents, args.queries, np.random.default_rng(args.seed))
+
+    if args.batch_size:
+        process_requests = [
+            ("/process/batch", {"inputs": inputs[start:start + args.batch_size], "async": args.async_ingest})
+            for start in range(0, len(inputs), args.batch_size)
+        ]
+    else:
+        process_requests = [("/process", {"input": text, "async": args.async_ingest}) for text in inputs]
+    phases = {"process": run_phase("process", process_requests, post, args.concurrency, recorder)}
+    if args.async_ingest:
+        phases["drain"] = run_phase("drain", [("/process/flush", {"timeout": 600})], post, 1, recorder)
+    phases.update({
+        "query": run_phase(
+            "query", [("/query", {"query": question}) for question in questions], post, args.concurrency, recorder
+        ),
+    })
+    close()
+
+    result = {
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("output", "baseline", "save_baseline", "workdir", "tolerance", "min_delta_ms")},
+        "phases": phases,
+        "stages": recorder.summary(),
+    }
+    print_report(result)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Asyncio serving mode: the same endpoints as main.py as an ASGI app.
+
+Redis is queried through the async client, while embedding and Milvus calls run in
+thread pools so the event loop keeps serving other requests. Start it with serve.py.
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Match, Route
+from ingest_queue import QueueFullError
+from main import (INGEST_ASYNC, INGEST_RETRY_AFTER, PROCESS_BATCH_MAX_SIZE, embedding_cache, importance_scorer,
+                  ingest_queue, llm, rag_service, request_tenant_id, request_tracker, short_term_store,
+                  sleep_like_processing, tenants)
+from metrics import registry
+from rag import SEARCH_MODES
+from tenants import DEFAULT_TENANT, InvalidTenantError
+
+ASYNC_EMBED_WORKERS = int(os.getenv('ASYNC_EMBED_WORKERS', str(os.cpu_count() or 4)))
+ASYNC_BLOCKING_WORKERS = int(os.getenv('ASYNC_BLOCKING_WORKERS', '32'))
+BACKGROUND_JOBS = os.getenv('BACKGROUND_JOBS', 'true').lower() == 'true'
+
+# Embedding is CPU-bound and gets its own pool; LLM and Milvus calls mostly wait on I/O
+embed_executor = ThreadPoolExecutor(max_workers=ASYNC_EMBED_WORKERS, thread_name_prefix="embed")
+blocking_executor = ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry the request trace over to the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, lambda: context.run(fn, *args, **kwargs))
+
+
+def route_template(scope):
+    """
+    Path template of the route matching ``scope``, or None when no route matches.
+    """
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return None
+
+
+class RequestTraceMiddleware:
+    """
+    Time every HTTP request and record its stage breakdown (see ``metrics.SlowRequestTracker``).
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        # Label by route template, not the raw path, to keep metric label values bounded
+        trace, token = request_tracker.start(route_template(scope))
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException:
+            request_tracker.finish(trace, token, status="error")
+            raise
+        request_tracker.finish(trace, token, status=str(status["code"]))
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def home(request):
+    return JSONResponse({"message": "Welcome to the Enhanced Memory Management System!"})
+
+
+async def health(request):
+    long_term_ready = rag_service.is_ready
+    embedder_ready = rag_service.embedder_ready
+    ready = long_term_ready and embedder_ready
+    return JSONResponse(
+        {"status": "ok" if ready else "loading", "long_term_ready": long_term_ready,
+         "embedder_ready": embedder_ready},
+        status_code=200 if ready else 503
+    )
+
+
+async def stats(request):
+    return JSONResponse({
+        "embedding_cache": embedding_cache.stats(),
+        "importance": importance_scorer.stats(),
+        "llm": llm.stats(),
+        "long_term_dedup": rag_service.dedup_stats(),
+        "ingest_queue": await run_blocking(blocking_executor, ingest_queue.stats),
+        "short_term": await run_blocking(blocking_executor, short_term_store.stats),
+        "tenants": tenants.stats()
+    })
+
+
+async def resolve_tenant(request, data=None):
+    tenant_id = request_tenant_id(request.headers, data)
+    # Creating or loading a tenant talks to Milvus, so only warm tenants skip the thread pool
+    return tenants.get_loaded(tenant_id) or await run_blocking(blocking_executor, tenants.get, tenant_id)
+
+
+async def invalid_tenant(request, error):
+    logger.error(f"Invalid tenant: {str(error)}")
+    return JSONResponse({"error": str(error)}, status_code=400)
+
+
+async def metrics(request):
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+async def process_input(request):
+    data = await read_json(request)
+    if not data or 'input' not in data:
+        logger.error("No input provided in request")
+        return JSONResponse({"error": "No input provided"}, status_code=400)
+
+    input_text = data['input']
+    if data.get('async', INGEST_ASYNC):
+        return await enqueue_inputs([input_text], tenants.validate(request_tenant_id(request.headers, data)),
+                                    single=True)
+    logger.info(f"Processing new input: {input_text[:50]}...")
+    tenant = await resolve_tenant(request, data)
+    return JSONResponse(await run_blocking(blocking_executor, tenant.memory_service.process, input_text))
+
+
+async def process_batch(request):
+    data = await read_json(request)
+    if not data or not isinstance(data.get('inputs'), list):
+        logger.error("No inputs provided in batch request")
+        return JSONResponse({"error": "No inputs provided"}, status_code=400)
+
+    inputs = data['inputs']
+    if len(inputs) > PROCESS_BATCH_MAX_SIZE:
+        logger.error(f"Batch of {len(inputs)} exceeds limit of {PROCESS_BATCH_MAX_SIZE}")
+        return JSONResponse({"error": f"Batch size exceeds limit of {PROCESS_BATCH_MAX_SIZE}"}, status_code=413)
+    if not all(isinstance(item, str) for item in inputs):
+        logger.error("Batch inputs must be strings")
+        return JSONResponse({"error": "Inputs must be strings"}, status_code=400)
+
+    if data.get('async', INGEST_ASYNC):
+        return await enqueue_inputs(inputs, tenants.validate(request_tenant_id(request.headers, data)))
+    logger.info(f"Processing batch of {len(inputs)} inputs")
+    tenant = await resolve_tenant(request, data)
+    results = await run_blocking(blocking_executor, tenant.memory_service.process_batch, inputs)
+    return JSONResponse({"results": results})
+
+
+async def enqueue_inputs(inputs, tenant_id, single=False):
+    try:
+        ids = await run_blocking(blocking_executor, ingest_queue.enqueue, inputs, tenant=tenant_id)
+    except QueueFullError as e:
+        logger.warning(str(e))
+        return JSONResponse({"error": "Ingest queue is full, retry later"}, status_code=429,
+                            headers={"Retry-After": str(INGEST_RETRY_AFTER)})
+    logger.info(f"Queued {len(ids)} inputs for ingestion")
+    if single:
+        return JSONResponse({"id": ids[0], "status": "queued"}, status_code=202)
+    return JSONResponse({"ids": ids, "status": "queued"}, status_code=202)
+
+
+async def ingest_status(request):
+    item_id = request.path_params['item_id']
+    item = (await run_blocking(blocking_executor, ingest_queue.status, [item_id])).get(item_id)
+    # Ids are only visible to the tenant that queued them, named by header or ?tenant=
+    if item is None or (item["tenant"] or DEFAULT_TENANT) != request_tenant_id(request.headers, request.query_params):
+        return JSONResponse({"error": "Unknown id"}, status_code=404)
+    return JSONResponse(item)
+
+
+async def flush_ingest_queue(request):
+    data = await read_json(request) or {}
+    drained = await run_blocking(blocking_executor, ingest_queue.flush, timeout=data.get('timeout', 30))
+    stats = await run_blocking(blocking_executor, ingest_queue.stats)
+    return JSONResponse({"drained": drained, **stats}, status_code=200 if drained else 504)
+
+
+async def query_memory(request):
+    data = await read_json(request)
+    if not data or 'query' not in data:
+        logger.error("No query provided in request")
+        return JSONResponse({"error": "No query provided"}, status_code=400)
+
+    query_text = data['query']
+    search_mode = data.get('mode')
+    if search_mode is not None and search_mode not in SEARCH_MODES:
+        logger.error(f"Unsupported search mode: {search_mode}")
+        return JSONResponse({"error": f"Mode must be one of {', '.join(SEARCH_MODES)}"}, status_code=400)
+    logger.info(f"Processing query: {query_text[:50]}...")
+    tenant = await resolve_tenant(request, data)
+    rag_service, memory_service = tenant.rag_service, tenant.memory_service
+    search_mode = rag_service.effective_search_mode(search_mode)
+
+    # Start the short-term lookup together with a keyword search (lexical and auto
+    # modes, which may make embedding unnecessary) and the query embedding, which the
+    # semantic short-term tier needs whenever it holds items. While the model is still
+    # loading, encoding would block, so it is not started then.
+    semantic_short_term = memory_service.short_term_index is not None and len(memory_service.short_term_index) > 0
+    short_term_task = asyncio.create_task(memory_service.alookup_short_term(query_text))
+    lexical_task = None
+    if search_mode in ("lexical", "auto") and rag_service.is_ready:
+        lexical_task = asyncio.create_task(
+            run_blocking(blocking_executor, rag_service.try_lexical_search, query_text, mode=search_mode)
+        )
+    embed_task = None
+    if rag_service.embedder_ready and (lexical_task is None or semantic_short_term):
+        embed_task = asyncio.create_task(run_blocking(embed_executor, rag_service.encode_queries, [query_text]))
+
+    try:
+        # Both short-term tiers are consulted before any long-term result is returned
+        short_term_hit = await short_term_task
+        if not short_term_hit and semantic_short_term and embed_task:
+            query_vector = (await embed_task)[0]
+            short_term_hit = await memory_service.alookup_similar_short_term(query_vector)
+        if short_term_hit:
+            # A short-term hit makes the long-term search unnecessary
+            for task in (lexical_task, embed_task):
+                if task:
+                    task.cancel()
+            return JSONResponse({
+                "source": "short_term",
+                **short_term_hit
+            })
+        long_term_results = await lexical_task if lexical_task else None
+    except BaseException:
+        for task in (lexical_task, embed_task):
+            if task:
+                task.cancel()
+        raise
+
+    if long_term_results is None:
+        if embed_task is None and rag_service.embedder_ready:
+            embed_task = asyncio.create_task(run_blocking(embed_executor, rag_service.encode_queries, [query_text]))
+        if not rag_service.is_ready or embed_task is None:
+            if embed_task:
+                embed_task.cancel()
+            logger.warning("Long-term memory is still loading")
+            return JSONResponse({
+                "source": "none",
+                "message": "Long-term memory is still loading"
+            }, status_code=503)
+
+        query_vector = (await embed_task)[0]
+        long_term_results = await run_blocking(
+            blocking_executor, rag_service.search_by_vector, query_vector,
+            nprobe=data.get('nprobe'), ef=data.get('ef'),
+            lexical_query=None if search_mode == "dense" else query_text
+        )
+    elif embed_task:
+        embed_task.cancel()
+    if long_term_results:
+        # Assume LLM uses some content from the retrieved documents
+        used_data = long_term_results[0]['text']  # Simplified assumption
+        logger.info(f"LLM used data: {used_data}")
+        return JSONResponse({
+            "source": "long_term",
+            "results": long_term_results,
+            "used_data": used_data
+        })
+
+    return JSONResponse({
+        "source": "none",
+        "message": "No matching information found"
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if BACKGROUND_JOBS:
+        threading.Thread(target=sleep_like_processing, daemon=True).start()
+    ingest_queue.start()
+    yield
+    # Let batches in flight finish; anything left is picked up again on restart
+    await asyncio.get_running_loop().run_in_executor(None, ingest_queue.stop, 30)
+    await short_term_store.async_redis_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/health', health),
+        Route('/stats', stats),
+        Route('/metrics', metrics),
+        Route('/process', process_input, methods=['POST']),
+        Route('/process/batch', process_batch, methods=['POST']),
+        Route('/process/status/{item_id}', ingest_status),
+        Route('/process/flush', flush_ingest_queue, methods=['POST']),
+        Route('/query', query_memory, methods=['POST']),
+    ],
+    middleware=[Middleware(RequestTraceMiddleware)],
+    exception_handlers={InvalidTenantError: invalid_tenant},
+    lifespan=lifespan
+)
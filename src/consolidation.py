@@ -0,0 +1,133 @@
+import time
+import zlib
+from loguru import logger
+from llm import BudgetExceededError
+from metrics import registry
+
+
+class ConsolidationEngine:
+    def __init__(self, short_term_store, rag_service, access_threshold=3, batch_size=100, time_budget=5.0,
+                 shard_index=0, shard_count=1, claim_ttl=300, summarize=None):
+        """
+        Promote frequently accessed short-term items to long-term memory.
+
+        Candidates come from the store's access index with one range query per batch
+        (items accessed at least ``access_threshold`` times), and their records with one
+        pipelined read. Qualifying items are promoted with one embedding call and one
+        insert per batch. Each pass stops after ``time_budget`` seconds and resumes from
+        the saved offset on the next pass.
+
+        Workers split the items by a hash of the item id: each one only handles ids with
+        ``crc32(id) % shard_count == shard_index``. Items are also claimed with SET NX
+        before promotion, so overlapping workers never promote the same item twice.
+
+        ``summarize`` optionally maps a list of texts to the list of texts to store (such
+        as ``LLM.summarize``); once the LLM budget is spent, items are stored as they are.
+        """
+        logger.info(f"Initializing consolidation engine (shard {shard_index + 1}/{shard_count})")
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"Invalid shard {shard_index} of {shard_count}")
+        self.short_term_store = short_term_store
+        self.rag_service = rag_service
+        self.access_threshold = access_threshold
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.claim_ttl = claim_ttl
+        self.summarize = summarize
+        self.cursor = 0
+
+    def owns(self, item_id):
+        """
+        Whether ``item_id`` belongs to this worker's slice of the items.
+        """
+        return self.shard_count == 1 or zlib.crc32(item_id.encode("utf-8")) % self.shard_count == self.shard_index
+
+    def run_pass(self):
+        """
+        Promote hot items until the sweep completes or the time budget runs out.
+        """
+        started = time.monotonic()
+        stats = {"scanned": 0, "candidates": 0, "promoted": 0, "complete": False}
+        if self.cursor == 0:
+            # Drop index entries of expired items before walking the access index
+            self.short_term_store.remove_expired()
+
+        while True:
+            item_ids = self.short_term_store.hot_ids(self.access_threshold, offset=self.cursor, count=self.batch_size)
+            stats["scanned"] += len(item_ids)
+            owned = [item_id for item_id in item_ids if self.owns(item_id)]
+            candidates, promoted = self._process_batch(owned) if owned else (0, 0)
+            stats["candidates"] += candidates
+            stats["promoted"] += promoted
+            # Promoted items leave the index, shifting the ones behind them forward
+            self.cursor += len(item_ids) - promoted
+
+            if len(item_ids) < self.batch_size:
+                self.cursor = 0
+                stats["complete"] = True
+                break
+            if time.monotonic() - started >= self.time_budget:
+                break
+
+        stats["elapsed"] = time.monotonic() - started
+        registry.observe("memory_background_pass_seconds", stats["elapsed"], "Duration of background passes",
+                         job="consolidation")
+        registry.inc("memory_consolidated_total", stats["promoted"], "Short-term items promoted to long-term")
+        logger.info(
+            f"Consolidation pass: scanned {stats['scanned']}, promoted {stats['promoted']} "
+            f"in {stats['elapsed']:.2f}s ({'complete' if stats['complete'] else 'resuming later'})"
+        )
+        return stats
+
+    def _process_batch(self, item_ids):
+        candidates = []
+        for item_id, record in zip(item_ids, self.short_term_store.get_many(item_ids)):
+            # Expired items are dropped from the index by the next remove_expired
+            if record is not None and record["ttl"] > 0 and record["access_count"] >= self.access_threshold:
+                candidates.append((item_id, record["text"], record["access_count"]))
+
+        claimed = self._claim(candidates)
+        if not claimed:
+            return len(candidates), 0
+
+        try:
+            documents = [text for _, text, _ in claimed]
+            if self.summarize is not None:
+                try:
+                    documents = self.summarize(documents)
+                except BudgetExceededError as e:
+                    # Summaries are optional; waiting for budget could let the items expire
+                    logger.warning(f"Promoting {len(documents)} items unsummarized: {str(e)}")
+            self.rag_service.add_documents(
+                documents,
+                [
+                    # Frequent access vouches for the item, so pruning gives it a full period
+                    {"source": "short_term", "access_count": access_count, "last_evaluated": time.time()}
+                    for _, _, access_count in claimed
+                ]
+            )
+        except Exception as e:
+            logger.error(f"Failed to promote {len(claimed)} items: {str(e)}")
+            self._release(claimed)
+            return len(candidates), 0
+
+        self.short_term_store.remove([item_id for item_id, _, _ in claimed])
+        # Claims are left to expire so a worker holding stale records cannot re-promote
+        logger.info(f"Promoted {len(claimed)} items to long-term memory")
+        return len(candidates), len(claimed)
+
+    def _claim_key(self, item_id):
+        return f"consolidation:claim:{self.short_term_store.key_for_id(item_id)}"
+
+    def _claim(self, candidates):
+        if not candidates:
+            return []
+        pipe = self.short_term_store.redis_client.pipeline(transaction=False)
+        for item_id, _, _ in candidates:
+            pipe.set(self._claim_key(item_id), self.shard_index, nx=True, ex=self.claim_ttl)
+        return [candidate for candidate, won in zip(candidates, pipe.execute()) if won]
+
+    def _release(self, claimed):
+        self.short_term_store.redis_client.delete(*[self._claim_key(item_id) for item_id, _, _ in claimed])
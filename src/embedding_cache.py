@@ -0,0 +1,134 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from loguru import logger
+
+
+class EmbeddingCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, redis_client=None, redis_ttl=7 * 24 * 3600,
+                 key_prefix="emb:"):
+        """
+        Two-level embedding cache keyed by a hash of the model id and the text.
+
+        The first level is an in-process LRU bounded by ``max_bytes`` that holds float32
+        arrays. The optional second level is a shared Redis tier storing the raw vector
+        bytes; ``redis_client`` must be created with ``decode_responses=False``.
+        """
+        logger.info(f"Initializing embedding cache (max_bytes={max_bytes}, redis={redis_client is not None})")
+        self.max_bytes = max_bytes
+        self.redis_client = redis_client
+        self.redis_ttl = redis_ttl
+        self.key_prefix = key_prefix
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, model_id, kind, text):
+        """
+        Cache key for one text; queries and documents are kept apart since models may encode them differently.
+        """
+        digest = hashlib.sha256(f"{model_id}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}{digest}"
+
+    def get_or_compute(self, model_id, kind, texts, encode):
+        """
+        Return one float32 vector per text, calling ``encode`` only for texts missing from both tiers.
+        """
+        keys = [self.key(model_id, kind, text) for text in texts]
+        vectors = [self._get_local(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.redis_client is not None:
+            self._fill_from_redis(keys, vectors, missing)
+            missing = [i for i in missing if vectors[i] is None]
+
+        if missing:
+            # Encode each distinct text once, even if it repeats within the batch
+            unique = list(dict.fromkeys(keys[i] for i in missing))
+            first_index = {}
+            for i in missing:
+                first_index.setdefault(keys[i], i)
+            encoded = encode([texts[first_index[key]] for key in unique])
+            computed = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(unique, encoded)}
+            for i in missing:
+                vectors[i] = computed[keys[i]]
+            for key, vector in computed.items():
+                self._put_local(key, vector)
+            self._put_redis(computed)
+
+        with self._lock:
+            self.misses += len(missing)
+        return vectors
+
+    def _get_local(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.local_hits += 1
+            return vector
+
+    def _put_local(self, key, vector):
+        size = vector.nbytes + len(key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = vector
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes + len(evicted_key)
+                self.evictions += 1
+
+    def _fill_from_redis(self, keys, vectors, missing):
+        try:
+            raw = self.redis_client.mget([keys[i] for i in missing])
+        except Exception as e:
+            logger.warning(f"Embedding cache Redis read failed: {str(e)}")
+            return
+        hits = 0
+        for i, value in zip(missing, raw):
+            if value is not None:
+                vectors[i] = np.frombuffer(value, dtype=np.float32)
+                self._put_local(keys[i], vectors[i])
+                hits += 1
+        with self._lock:
+            self.redis_hits += hits
+
+    def _put_redis(self, computed):
+        if self.redis_client is None:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, vector in computed.items():
+                pipe.set(key, vector.tobytes(), ex=self.redis_ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Embedding cache Redis write failed: {str(e)}")
+
+    def stats(self):
+        """
+        Hit counters and occupancy, for sizing the cache.
+        """
+        with self._lock:
+            lookups = self.local_hits + self.redis_hits + self.misses
+            return {
+                "local_hits": self.local_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": (self.local_hits + self.redis_hits) / lookups if lookups else 0.0,
+                "local_hit_rate": self.local_hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
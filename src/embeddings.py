@@ -0,0 +1,340 @@
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+from loguru import logger
+from metrics import span
+
+DEFAULT_MODEL_NAME = "GPTCache/paraphrase-albert-onnx"
+DEFAULT_TOKENIZER_NAME = "GPTCache/paraphrase-albert-small-v2"
+
+_TOKEN = re.compile(r"\w+")
+
+
+class EmbeddingBackend:
+    """
+    Base class for embedding backends.
+
+    Subclasses set ``model_id`` and ``dim`` up front (so the collection schema can be
+    checked before the model exists), implement ``load`` and ``_encode``, and get lazy
+    or background loading for free: encoding waits until ``load`` has finished.
+    """
+    model_id = None
+    dim = None
+
+    def __init__(self):
+        self._ready = threading.Event()
+        self._load_lock = threading.Lock()
+
+    @property
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def load(self):
+        raise NotImplementedError
+
+    def _encode(self, texts, kind):
+        raise NotImplementedError
+
+    def ensure_loaded(self):
+        """
+        Load the model in the calling thread, or wait for a load already in progress.
+        """
+        with self._load_lock:
+            if self._ready.is_set():
+                return
+            started = time.perf_counter()
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Failed to load embedding model {self.model_id}: {str(e)}")
+                raise
+            self._ready.set()
+            logger.success(f"Loaded embedding model {self.model_id} in {time.perf_counter() - started:.2f}s")
+
+    def start_loading(self):
+        """
+        Load the model on a background thread so startup is not blocked.
+        """
+        def run():
+            try:
+                self.ensure_loaded()
+            except Exception:
+                pass  # Logged by ensure_loaded; the next encode call retries
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def encode_queries(self, queries):
+        # Blocks while a background load is in progress, or loads lazily if none was started
+        self.ensure_loaded()
+        with span("embed_model"):
+            return self._encode(list(queries), "query")
+
+    def encode_documents(self, documents):
+        self.ensure_loaded()
+        with span("embed_model"):
+            return self._encode(list(documents), "document")
+
+
+class DefaultEmbeddingBackend(EmbeddingBackend):
+    model_id = DEFAULT_MODEL_NAME
+    dim = 768
+
+    def __init__(self, **kwargs):
+        """
+        The pymilvus default ONNX model, encoding one text at a time.
+        """
+        super().__init__(**kwargs)
+        self.embedding_fn = None
+
+    def load(self):
+        from pymilvus import model
+        self.embedding_fn = model.DefaultEmbeddingFunction()
+
+    def _encode(self, texts, kind):
+        if kind == "query":
+            return self.embedding_fn.encode_queries(texts)
+        return self.embedding_fn.encode_documents(texts)
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    dim = 768
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, tokenizer_name=DEFAULT_TOKENIZER_NAME,
+                 quantize=True, threads=None, max_length=256, cache_dir=None, **kwargs):
+        """
+        CPU-optimized variant of the default model.
+
+        Whole batches go through one ONNX Runtime call padded to the longest text
+        (the default function pads every text to the model maximum, one at a time),
+        with full graph optimizations and, by default, dynamic int8 quantization.
+        """
+        super().__init__(**kwargs)
+        self.model_name = model_name
+        self.tokenizer_name = tokenizer_name
+        self.quantize = quantize
+        self.threads = threads
+        self.max_length = max_length
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "memory-poc")
+        self.model_id = f"{model_name}-int8" if quantize else model_name
+        self.tokenizer = None
+        self.session = None
+
+    def load(self):
+        import onnxruntime
+        from huggingface_hub import hf_hub_download
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+        model_path = hf_hub_download(repo_id=self.model_name, filename="model.onnx")
+        if self.quantize:
+            model_path = self._quantized(model_path)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _quantized(self, model_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(self.cache_dir, self.model_name.replace("/", "--") + "-int8.onnx")
+        if not os.path.exists(quantized_path):
+            logger.info(f"Quantizing {self.model_name} to int8")
+            os.makedirs(self.cache_dir, exist_ok=True)
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+
+    def _encode(self, texts, kind):
+        if not texts:
+            return []
+        encoded = self.tokenizer(
+            texts, padding="longest", truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        inputs = {name: encoded[name].astype(np.int64) for name in self._input_names if name in encoded}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return list(pooled.astype(np.float32))
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, dim=768, **kwargs):
+        """
+        Deterministic bag-of-words feature hashing; no model to load. Meant for tests and
+        benchmarks: texts sharing words get similar vectors, but there is no semantics.
+        """
+        super().__init__(**kwargs)
+        self.dim = dim
+        self.model_id = f"hashing-{dim}"
+        self._ready.set()
+
+    def load(self):
+        pass
+
+    def _encode(self, texts, kind):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN.findall(text.lower()):
+                digest = zlib.crc32(token.encode("utf-8"))
+                vectors[row, digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return list(vectors)
+
+
+EMBEDDING_BACKENDS = {
+    "default": DefaultEmbeddingBackend,
+    "onnx": OnnxEmbeddingBackend,
+    "hashing": HashingEmbeddingBackend,
+}
+
+
+def create_embedding_backend(name, **kwargs):
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name} (choose from {', '.join(EMBEDDING_BACKENDS)})")
+    return EMBEDDING_BACKENDS[name](**kwargs)
+
+
+_worker_backend = None
+
+
+def _init_worker(name, kwargs):
+    global _worker_backend
+    _worker_backend = create_embedding_backend(name, **kwargs)
+    _worker_backend.ensure_loaded()
+
+
+def _encode_in_worker(texts, kind):
+    return np.stack(_worker_backend._encode(texts, kind)) if texts else np.zeros((0, _worker_backend.dim))
+
+
+class ProcessPoolEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, name, backend_kwargs=None, processes=None, min_chunk_size=8, **kwargs):
+        """
+        Spread encoding of large batches over a pool of processes, one model copy each.
+        The pool defaults to one process per core.
+        """
+        super().__init__(**kwargs)
+        self.name = name
+        self.backend_kwargs = backend_kwargs or {}
+        self.processes = processes or os.cpu_count() or 1
+        self.min_chunk_size = min_chunk_size
+        probe = create_embedding_backend(name, **self.backend_kwargs)
+        self.model_id = probe.model_id
+        self.dim = probe.dim
+        self.executor = None
+
+    def load(self):
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes, initializer=_init_worker, initargs=(self.name, self.backend_kwargs),
+            # Forking a process that already runs threads (and ONNX Runtime) can deadlock
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        # Make every worker load its model now rather than on the first request
+        list(self.executor.map(_encode_in_worker, [["warm up"]] * self.processes, ["document"] * self.processes))
+
+    def _encode(self, texts, kind):
+        if not texts:
+            return []
+        chunk_size = max(self.min_chunk_size, -(-len(texts) // self.processes))
+        chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+        results = self.executor.map(_encode_in_worker, chunks, [kind] * len(chunks))
+        return [vector for chunk in results for vector in chunk]
+
+
+class MicroBatcher:
+    def __init__(self, backend, max_wait_ms=2.0, max_batch_size=64):
+        """
+        Group concurrent encode calls into one backend call.
+
+        Requests arriving within ``max_wait_ms`` of each other (up to ``max_batch_size``
+        texts) are encoded together, separately for queries and documents.
+        """
+        self.backend = backend
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def model_id(self):
+        return self.backend.model_id
+
+    @property
+    def dim(self):
+        return self.backend.dim
+
+    @property
+    def is_ready(self):
+        return self.backend.is_ready
+
+    def start_loading(self):
+        self.backend.start_loading()
+
+    def encode_queries(self, queries):
+        return self._submit(list(queries), "query")
+
+    def encode_documents(self, documents):
+        return self._submit(list(documents), "document")
+
+    def _submit(self, texts, kind):
+        if not texts:
+            return []
+        if len(texts) >= self.max_batch_size:
+            # Already a full batch; waiting would only add latency
+            return self._encode(texts, kind)
+        future = Future()
+        self._queue.put((texts, kind, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            requests = [self._queue.get()]
+            size = len(requests[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            for kind in ("query", "document"):
+                group = [request for request in requests if request[1] == kind]
+                if group:
+                    self._encode_group(group, kind)
+
+    def _encode(self, texts, kind):
+        if kind == "query":
+            return self.backend.encode_queries(texts)
+        return self.backend.encode_documents(texts)
+
+    def _encode_group(self, group, kind):
+        texts = [text for request_texts, _, _ in group for text in request_texts]
+        try:
+            vectors = self._encode(texts, kind)
+        except Exception as e:
+            for _, _, future in group:
+                future.set_exception(e)
+            return
+        offset = 0
+        for request_texts, _, future in group:
+            future.set_result(vectors[offset:offset + len(request_texts)])
+            offset += len(request_texts)
@@ -0,0 +1,177 @@
+import os
+import random
+import redis
+import socket
+import threading
+import time
+import zlib
+from loguru import logger
+from leases import RedisLease
+
+# Snowflake layout: 41 bits of milliseconds since EPOCH_MS, 10 bits of node id, 12 bits of sequence.
+# That fits a signed int64 primary key for ~69 years.
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = NODE_BITS + SEQUENCE_BITS
+
+
+def default_node_id():
+    """
+    Node id from NODE_ID, or a hash of host name and pid. Prefer ``leased_id_generator``
+    when several processes share a collection, since hashes can collide.
+    """
+    if os.getenv("NODE_ID"):
+        return int(os.environ["NODE_ID"]) & MAX_NODE_ID
+    return zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode("utf-8")) & MAX_NODE_ID
+
+
+def lease_node_id(redis_client, prefix="ids:node:", ttl=60, preferred=None):
+    """
+    Lease a free node id as ``<prefix><node id>``, trying ``preferred`` first, else starting
+    from a random one. Returns the node id and its ``RedisLease``; raises RuntimeError when
+    all 1024 are leased.
+    """
+    start = random.randrange(MAX_NODE_ID + 1) if preferred is None else preferred
+    for offset in range(MAX_NODE_ID + 1):
+        node_id = (start + offset) & MAX_NODE_ID
+        lease = RedisLease(redis_client, f"{prefix}{node_id}", ttl=ttl)
+        if lease.acquire():
+            return node_id, lease
+    logger.error(f"All {MAX_NODE_ID + 1} node ids are leased")
+    raise RuntimeError(f"All {MAX_NODE_ID + 1} node ids are leased")
+
+
+def leased_id_generator(redis_client, prefix="ids:node:", ttl=60):
+    """
+    Id generator on a node id leased from Redis, unique among live processes.
+
+    The generator resumes after the last millisecond the node's previous holder stored, and
+    stores its own on every lease renewal, so a restart cannot repeat ids borrowed from
+    future milliseconds. A lost lease (Redis outage, evicted key) is leased again, the same
+    node id if it is still free, before the next ids. NODE_ID skips the lease; when Redis
+    is unavailable at startup the node id falls back to ``default_node_id``.
+    """
+    if os.getenv("NODE_ID"):
+        return SnowflakeIdGenerator(default_node_id())
+    generator = None
+
+    def store_last_ms():
+        redis_client.set(f"{prefix}{generator.node_id}:last_ms", generator.last_timestamp_ms)
+
+    def reacquire(preferred=None):
+        node_id, lease = lease_node_id(redis_client, prefix=prefix, ttl=ttl, preferred=preferred)
+        lease.on_renew = store_last_ms
+        last_ms = redis_client.get(f"{prefix}{node_id}:last_ms")
+        return node_id, lease, int(last_ms) if last_ms else None
+
+    try:
+        node_id, lease, last_ms = reacquire()
+    except redis.RedisError as e:
+        logger.warning(f"Could not lease a node id from Redis, hashing host and pid instead: {str(e)}")
+        return SnowflakeIdGenerator()
+    generator = SnowflakeIdGenerator(node_id, resume_after_ms=last_ms, lease=lease, reacquire=reacquire)
+    return generator
+
+
+def id_for_timestamp(timestamp_ms):
+    """
+    Smallest id generated at ``timestamp_ms``, for id-range filters such as ``id >= ...``.
+    """
+    return max(int(timestamp_ms) - EPOCH_MS, 0) << TIMESTAMP_SHIFT
+
+
+def timestamp_of(doc_id):
+    """
+    Milliseconds since the Unix epoch at which ``doc_id`` was generated.
+    """
+    return (doc_id >> TIMESTAMP_SHIFT) + EPOCH_MS
+
+
+class SnowflakeIdGenerator:
+    def __init__(self, node_id=None, resume_after_ms=None, lease=None, reacquire=None):
+        """
+        Unique, roughly time-ordered 63-bit ids.
+
+        Ids never repeat within a process: when the 4096 ids of one millisecond are used
+        up, or the wall clock steps backwards, the generator keeps counting on its own
+        logical clock instead of waiting. Distinct ``node_id`` values keep processes apart.
+        ``resume_after_ms`` (Unix milliseconds) skips past ids an earlier process handed out
+        on the same node. With a ``lease``, a lost node id lease is replaced through
+        ``reacquire(preferred)``, which returns ``(node_id, lease, resume_after_ms)``; ids are
+        refused while that fails.
+        """
+        self.node_id = default_node_id() if node_id is None else node_id
+        if not 0 <= self.node_id <= MAX_NODE_ID:
+            raise ValueError(f"Node id must be between 0 and {MAX_NODE_ID}")
+        self.lease = lease
+        self.reacquire = reacquire
+        self._last_ms = -1
+        self._sequence = 0
+        self._resume_after(resume_after_ms)
+        self._lock = threading.Lock()
+        logger.info(f"Initialized id generator for node {self.node_id}")
+
+    @property
+    def last_timestamp_ms(self):
+        """
+        Unix milliseconds up to which this generator may have handed out ids.
+        """
+        return max(self._last_ms, int(time.time() * 1000) - EPOCH_MS) + EPOCH_MS
+
+    def _resume_after(self, resume_after_ms):
+        if resume_after_ms is not None and int(resume_after_ms) - EPOCH_MS >= self._last_ms:
+            # Start on the next millisecond, as if the resumed one were used up
+            self._last_ms = int(resume_after_ms) - EPOCH_MS
+            self._sequence = MAX_SEQUENCE + 1
+
+    def _ensure_lease(self):
+        """
+        Lease a node id again after the lease was lost; called with the lock held.
+        """
+        if self.lease is None or self.lease.held:
+            return
+        logger.warning(f"Lost the lease on node id {self.node_id}, leasing one again")
+        if self.reacquire is None:
+            logger.error(f"Lost the lease on node id {self.node_id}")
+            raise RuntimeError(f"Lost the lease on node id {self.node_id}")
+        try:
+            # Drop what may be left of the old lease, so the same node id can be taken again
+            self.lease.release()
+        except Exception as e:
+            logger.warning(f"Could not release the lease on node id {self.node_id}: {str(e)}")
+        try:
+            node_id, lease, resume_after_ms = self.reacquire(self.node_id)
+        except Exception as e:
+            logger.error(f"Could not lease a node id: {str(e)}")
+            raise RuntimeError(f"Lost the lease on node id {self.node_id}") from e
+        self.node_id, self.lease = node_id, lease
+        self._resume_after(resume_after_ms)
+        logger.info(f"Leased node id {node_id} again")
+
+    def next_id(self):
+        return self.next_ids(1)[0]
+
+    def next_ids(self, count):
+        """
+        Reserve ``count`` consecutive ids in one call.
+        """
+        ids = []
+        with self._lock:
+            self._ensure_lease()
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            while len(ids) < count:
+                if self._sequence > MAX_SEQUENCE:
+                    # Borrow the next millisecond rather than sleeping
+                    self._last_ms += 1
+                    self._sequence = 0
+                take = min(count - len(ids), MAX_SEQUENCE + 1 - self._sequence)
+                base = (self._last_ms << TIMESTAMP_SHIFT) | (self.node_id << SEQUENCE_BITS)
+                ids.extend(base | sequence for sequence in range(self._sequence, self._sequence + take))
+                self._sequence += take
+        return ids
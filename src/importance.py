@@ -0,0 +1,326 @@
+import contextvars
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from loguru import logger
+from metrics import timed
+from text_utils import normalize_text, text_hash
+
+IMPORTANCE_CHECK_PROMPT = """Analyze the following input and determine its importance on a scale of 0-100.
+Consider factors like:
+- Long-term relevance
+- Information density
+- Uniqueness of information
+Return only the numeric value."""
+
+RETRY_SUFFIX = "\n\nYour previous reply could not be parsed. Reply with a single number between 0 and 100."
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_FILLER = re.compile(
+    r"^(hi|hello|hey|thanks|thank you|ok|okay|cool|lol|yes|no|sure|bye|good (morning|night))\b[\s!.?]*$"
+)
+
+
+def parse_importance(reply):
+    """
+    Extract a 0-100 score from an LLM reply such as "85", "Importance: 85/100" or "0.85".
+    """
+    match = _NUMBER.search(str(reply))
+    if not match:
+        raise ValueError(f"No importance score in reply: {str(reply)[:50]!r}")
+    value = float(match.group())
+    rest = str(reply)[match.end():].lstrip()
+    if "." in match.group() and 0 < value < 1 and not rest.startswith(("%", "/")):
+        value *= 100  # A fraction like 0.85
+    return min(max(value, 0.0), 100.0)
+
+
+class HeuristicPreScorer:
+    """
+    Rule-based scores for inputs whose importance is obvious without an LLM.
+    """
+
+    def prescore(self, text):
+        normalized = normalize_text(text)
+        if not normalized:
+            return 0.0, 1.0
+        if _FILLER.match(normalized):
+            return 5.0, 0.95
+        if len(normalized.split()) <= 2 and not _NUMBER.search(normalized):
+            # "Allergic: peanuts" is short too, so this only decides with a lowered min_confidence
+            return 10.0, 0.6
+        return None
+
+    def observe(self, text, score):
+        pass
+
+
+class SimilarityPreScorer:
+    def __init__(self, encode, capacity=10000, min_similarity=0.95):
+        """
+        Reuse the score of the most similar previously scored input.
+
+        ``encode`` maps a list of texts to vectors. The similarity is reported as the
+        confidence, so it only short-circuits the LLM for very close matches.
+        """
+        self.encode = encode
+        self.capacity = capacity
+        self.min_similarity = min_similarity
+        self._vectors = None
+        self._scores = np.zeros(capacity, dtype=np.float32)
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, text):
+        vector = np.asarray(self.encode([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def prescore(self, text):
+        with self._lock:
+            if not self._size:
+                return None
+        vector = self._embed(text)
+        with self._lock:
+            similarities = self._vectors[:self._size] @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            score = float(self._scores[best])
+        if similarity < self.min_similarity:
+            return None
+        return score, similarity
+
+    def observe(self, text, score):
+        vector = self._embed(text)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+            # Ring buffer: the oldest scored item is overwritten once full
+            self._vectors[self._next] = vector
+            self._scores[self._next] = score
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+
+class ImportanceScorer:
+    def __init__(self, llm, prompt=IMPORTANCE_CHECK_PROMPT, cache_size=10000, cache_ttl=3600,
+                 max_retries=2, pre_scorers=None, min_confidence=0.9, max_workers=8):
+        """
+        Score input importance (0-100), avoiding the LLM where possible.
+
+        Scores are cached by a hash of the normalized text with a TTL and a size bound.
+        Pre-scorers are consulted in order and skip the LLM when one returns a score with
+        at least ``min_confidence``. Unparseable LLM replies are retried ``max_retries`` times.
+
+        ``score_many`` sends the texts left over in one batched ``llm.check_importance``
+        call when the LLM has one, and otherwise scores them on ``max_workers`` threads.
+        Texts the batch gave no usable score for are asked again one by one with the retry
+        prompt. Batched calls are counted apart from single ones (``llm_batches``), so
+        ``llm_calls`` and its mean latency stay per text.
+        """
+        logger.info("Initializing importance scorer")
+        self.llm = llm
+        self.prompt = prompt
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.max_retries = max_retries
+        self.pre_scorers = pre_scorers or []
+        self.min_confidence = min_confidence
+        self.max_workers = max_workers
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.cache_hits = 0
+        self.prescored = 0
+        self.llm_calls = 0
+        self.llm_retries = 0
+        self.llm_failures = 0
+        self.llm_seconds = 0.0
+        self.llm_batches = 0
+        self.llm_batch_seconds = 0.0
+        self.batched = 0
+
+    def cache_key(self, text):
+        return text_hash(text)
+
+    @timed("importance")
+    def score(self, text):
+        """
+        Return the importance of ``text``; raises ValueError if the LLM never gives a usable score.
+        """
+        key = self.cache_key(text)
+        score = self._score_without_llm(key, text)
+        if score is None:
+            score = self._score_with_llm(text)
+            self._record(key, text, score)
+        return score
+
+    @timed("importance")
+    def score_many(self, texts):
+        """
+        Scores of ``texts`` in order; a text the LLM gave no usable score for gets the
+        exception instead. Repeated texts are scored once.
+        """
+        scores = [None] * len(texts)
+        pending = {}
+        for i, text in enumerate(texts):
+            key = self.cache_key(text)
+            if key in pending:
+                with self._lock:
+                    self.requests += 1
+                    self.cache_hits += 1
+                pending[key].append(i)
+                continue
+            scores[i] = self._score_without_llm(key, text)
+            if scores[i] is None:
+                pending[key] = [i]
+        if not pending:
+            return scores
+
+        unique = [texts[positions[0]] for positions in pending.values()]
+        for (key, positions), text, score in zip(pending.items(), unique, self._score_many_with_llm(unique)):
+            if not isinstance(score, Exception):
+                self._record(key, text, score)
+            for i in positions:
+                scores[i] = score
+        return scores
+
+    def _score_without_llm(self, key, text):
+        """
+        The cached or pre-scored importance of ``text``, or None.
+        """
+        with self._lock:
+            self.requests += 1
+        cached = self._get_cached(key)
+        if cached is not None:
+            with self._lock:
+                self.cache_hits += 1
+            return cached
+
+        for pre_scorer in self.pre_scorers:
+            result = pre_scorer.prescore(text)
+            if result is not None and result[1] >= self.min_confidence:
+                logger.info(f"Pre-scored importance {result[0]} (confidence {result[1]:.2f})")
+                with self._lock:
+                    self.prescored += 1
+                self._put_cached(key, result[0])
+                return result[0]
+        return None
+
+    def _record(self, key, text, score):
+        self._put_cached(key, score)
+        for pre_scorer in self.pre_scorers:
+            try:
+                pre_scorer.observe(text, score)
+            except Exception as e:
+                logger.warning(f"Pre-scorer failed to record score: {str(e)}")
+
+    def _score_many_with_llm(self, texts):
+        check_importance = getattr(self.llm, "check_importance", None)
+        if check_importance is not None and len(texts) > 1:
+            started = time.perf_counter()
+            scores = check_importance(texts, self.prompt)
+            unparsed = [i for i, score in enumerate(scores) if isinstance(score, ValueError)]
+            with self._lock:
+                self.llm_batches += 1
+                self.llm_batch_seconds += time.perf_counter() - started
+                self.batched += len(texts)
+                self.llm_retries += len(unparsed)
+            # The batch counts as the first attempt; what is left gets the retry prompt
+            for i, score in zip(unparsed, self._score_each([texts[i] for i in unparsed], first_attempt=1)):
+                scores[i] = score
+            return scores
+        return self._score_each(texts)
+
+    def _score_each(self, texts, first_attempt=0):
+        """
+        Score ``texts`` with one LLM call each; a text that cannot be scored gets the exception.
+        """
+        def score(text):
+            try:
+                return self._score_with_llm(text, first_attempt=first_attempt)
+            except Exception as e:
+                logger.error(f"Error scoring input: {str(e)}")
+                return e
+
+        if len(texts) <= 1:
+            return [score(text) for text in texts]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(texts))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, score, text) for text in texts]
+            return [future.result() for future in futures]
+
+    def _score_with_llm(self, text, first_attempt=0):
+        """
+        Score ``text`` with single LLM calls; ``first_attempt`` > 0 continues after earlier
+        unparseable replies, starting with the retry prompt.
+        """
+        prompt = self.prompt + RETRY_SUFFIX if first_attempt else self.prompt
+        for attempt in range(first_attempt, self.max_retries + 1):
+            started = time.perf_counter()
+            reply = self.llm.generate_response(prompt, text)
+            with self._lock:
+                self.llm_calls += 1
+                self.llm_seconds += time.perf_counter() - started
+            try:
+                score = parse_importance(reply)
+                logger.info(f"Calculated importance: {score}")
+                return score
+            except ValueError as e:
+                logger.warning(f"Unparseable importance reply (attempt {attempt + 1}): {str(e)}")
+                with self._lock:
+                    self.llm_retries += 1
+                prompt = self.prompt + RETRY_SUFFIX
+        with self._lock:
+            self.llm_failures += 1
+        raise ValueError(f"No usable importance score after {self.max_retries + 1} attempts")
+
+    def _get_cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            score, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return score
+
+    def _put_cached(self, key, score):
+        with self._lock:
+            self._cache[key] = (score, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self):
+        """
+        How often the LLM was avoided and the estimated latency that saved.
+        """
+        with self._lock:
+            avoided = self.cache_hits + self.prescored
+            mean_llm_seconds = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            mean_batch_seconds = self.llm_batch_seconds / self.llm_batches if self.llm_batches else 0.0
+            # An avoided text would have cost one single call, or its share of a batch
+            per_text_seconds = mean_llm_seconds or (self.llm_batch_seconds / self.batched if self.batched else 0.0)
+            return {
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "prescored": self.prescored,
+                "llm_calls": self.llm_calls,
+                "llm_retries": self.llm_retries,
+                "llm_failures": self.llm_failures,
+                "llm_batches": self.llm_batches,
+                "batched": self.batched,
+                "avoided_fraction": avoided / self.requests if self.requests else 0.0,
+                "mean_llm_latency_ms": mean_llm_seconds * 1000,
+                "mean_batch_latency_ms": mean_batch_seconds * 1000,
+                "saved_latency_ms": avoided * per_text_seconds * 1000,
+                "cache_entries": len(self._cache),
+            }
@@ -0,0 +1,353 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from loguru import logger
+from metrics import registry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_items (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    tenant TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    enqueued_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS ingest_items_status ON ingest_items (status, seq);
+"""
+
+PENDING_STATUSES = ("queued", "processing")
+
+
+class QueueFullError(Exception):
+    """
+    Raised by ``IngestQueue.enqueue`` when accepting the items would exceed ``max_depth``.
+    """
+
+
+class IngestQueue:
+    def __init__(self, process_batch, path="ingest_queue.db", workers=2, min_batch_size=1,
+                 max_batch_size=256, target_batch_seconds=2.0, max_depth=10000, max_attempts=3,
+                 lease_seconds=300, retention_seconds=24 * 3600, poll_interval=0.5):
+        """
+        Durable write-behind queue in front of ``process_batch(texts, tenant)``, which
+        returns one ``MemoryService.process_batch`` result per text.
+
+        Items are written to a SQLite file and acknowledged with a tracking id right away;
+        ``workers`` threads claim them in insertion order and process them in batches.
+        The batch size adapts between ``min_batch_size`` and ``max_batch_size``: it doubles
+        while full batches finish within ``target_batch_seconds`` and halves when they do not.
+        ``enqueue`` raises ``QueueFullError`` once ``max_depth`` items are pending.
+
+        Claims are leases, so several processes can share the file, and items claimed by a
+        process that died are retried after ``lease_seconds``. Workers renew their leases
+        while a batch runs, and only the holder of an item's lease records its result. A
+        batch that raises, or whose lease expires, is retried up to ``max_attempts`` times
+        before its items fail. Finished items are kept for ``retention_seconds``.
+        Items of different tenants claimed together are processed in one call per tenant.
+        """
+        logger.info(f"Initializing ingest queue at {path} ({workers} workers)")
+        self.process_batch = process_batch
+        self.path = path
+        self.workers = workers
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_batch_seconds = target_batch_seconds
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+        self.batch_size = min_batch_size
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._progress = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_purge = 0.0
+
+        try:
+            with self._connection() as connection:
+                connection.executescript(SCHEMA)
+                columns = {row[1] for row in connection.execute("PRAGMA table_info(ingest_items)")}
+                if "tenant" not in columns:
+                    # Queue files written before tenants existed
+                    connection.execute("ALTER TABLE ingest_items ADD COLUMN tenant TEXT")
+        except Exception as e:
+            logger.error(f"Failed to open ingest queue: {str(e)}")
+            raise
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def start(self):
+        """
+        Start the worker threads (idempotent); items left from a previous run are picked up.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"ingest-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stop.set()
+        self._wakeup.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def enqueue(self, texts, tenant=None):
+        """
+        Persist ``texts`` for ``tenant`` and return one tracking id per text, in order.
+        """
+        ids = [uuid.uuid4().hex for _ in texts]
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            depth = self._depth(connection)
+            if depth + len(texts) > self.max_depth:
+                raise QueueFullError(f"Ingest queue is full ({depth} pending, limit {self.max_depth})")
+            connection.executemany(
+                "INSERT INTO ingest_items (id, text, tenant, status, enqueued_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                [(item_id, text, tenant, now, now) for item_id, text in zip(ids, texts)]
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        registry.inc("memory_ingest_enqueued_total", len(ids), "Items accepted by the ingest queue")
+        self.start()
+        self._wakeup.set()
+        return ids
+
+    def status(self, item_ids):
+        """
+        Map each known tracking id to its status, attempts and (once finished) result.
+        """
+        if not item_ids:
+            return {}
+        placeholders = ",".join("?" * len(item_ids))
+        rows = self._connection().execute(
+            f"SELECT id, tenant, status, attempts, result, enqueued_at, updated_at FROM ingest_items "
+            f"WHERE id IN ({placeholders})",
+            list(item_ids)
+        ).fetchall()
+        return {
+            item_id: {
+                "id": item_id,
+                "tenant": tenant,
+                "status": status,
+                "attempts": attempts,
+                "result": json.loads(result) if result else None,
+                "enqueued_at": enqueued_at,
+                "updated_at": updated_at,
+            }
+            for item_id, tenant, status, attempts, result, enqueued_at, updated_at in rows
+        }
+
+    def stats(self):
+        counts = dict(self._connection().execute(
+            "SELECT status, COUNT(*) FROM ingest_items GROUP BY status"
+        ).fetchall())
+        return {
+            "queued": counts.get("queued", 0),
+            "processing": counts.get("processing", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "batch_size": self.batch_size,
+            "max_depth": self.max_depth,
+        }
+
+    def flush(self, timeout=None):
+        """
+        Wait until no items are queued or processing; returns False if ``timeout`` ran out first.
+        """
+        if self._depth(self._connection()):
+            self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._depth(self._connection()):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            with self._progress:
+                # Polls too, since other processes may be draining the same file
+                self._progress.wait(self.poll_interval if remaining is None else min(remaining, self.poll_interval))
+        return True
+
+    def _depth(self, connection):
+        return connection.execute(
+            "SELECT COUNT(*) FROM ingest_items WHERE status IN (?, ?)", PENDING_STATUSES
+        ).fetchone()[0]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                lease_until, batch = self._claim(self.batch_size)
+                if not batch:
+                    self._purge()
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                self._process(batch, lease_until)
+            except Exception as e:
+                logger.error(f"Ingest worker error: {str(e)}")
+                self._stop.wait(self.poll_interval)
+
+    def _claim(self, limit):
+        """
+        Lease up to ``limit`` items; returns the lease's expiry and the items.
+        """
+        now = time.time()
+        lease_until = now + self.lease_seconds
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # An item whose lease expired on its last attempt keeps killing or hanging the
+            # process working on it; fail it instead of claiming it again forever
+            exhausted = connection.execute(
+                "UPDATE ingest_items SET status = 'failed', result = ?, updated_at = ?, lease_until = NULL "
+                "WHERE status = 'processing' AND lease_until < ? AND attempts >= ?",
+                (json.dumps({"status": "error", "error": "Lease expired on the last attempt"}), now, now,
+                 self.max_attempts)
+            ).rowcount
+            rows = connection.execute(
+                "SELECT id, text, tenant, attempts FROM ingest_items "
+                "WHERE status = 'queued' OR (status = 'processing' AND lease_until < ?) "
+                "ORDER BY seq LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            if rows:
+                connection.executemany(
+                    "UPDATE ingest_items SET status = 'processing', attempts = attempts + 1, "
+                    "lease_until = ?, updated_at = ? WHERE id = ?",
+                    [(lease_until, now, item_id) for item_id, _, _, _ in rows]
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        if exhausted:
+            logger.warning(f"Failed {exhausted} ingest items whose lease expired on their last attempt")
+            registry.inc("memory_ingest_processed_total", exhausted, "Items processed by the ingest queue",
+                         status="failed")
+            with self._progress:
+                self._progress.notify_all()
+        return lease_until, [(item_id, text, tenant, attempts + 1) for item_id, text, tenant, attempts in rows]
+
+    def _process(self, batch, lease_until):
+        started = time.monotonic()
+        by_tenant = {}
+        for item in batch:
+            by_tenant.setdefault(item[2], []).append(item)
+
+        # Keep the items leased while they are processed, however long that takes
+        lease = {"until": lease_until}
+        done = threading.Event()
+        renewer = threading.Thread(
+            target=self._renew, args=([item[0] for item in batch], lease, done), daemon=True
+        )
+        renewer.start()
+        updates = []
+        failed = False
+        try:
+            for tenant, items in by_tenant.items():
+                try:
+                    results = self.process_batch([text for _, text, _, _ in items], tenant)
+                except Exception as e:
+                    logger.error(f"Failed to process ingest batch of {len(items)}: {str(e)}")
+                    updates.extend(self._fail(items, str(e)))
+                    failed = True
+                    continue
+                now = time.time()
+                for (item_id, _, _, _), result in zip(items, results):
+                    status = "failed" if result.get("status") == "error" else "done"
+                    updates.append((status, json.dumps(result), now, item_id))
+        finally:
+            done.set()
+            renewer.join()
+        elapsed = time.monotonic() - started
+        self._finish(updates, lease["until"])
+        for status in ("done", "failed"):
+            count = sum(1 for update in updates if update[0] == status)
+            if count:
+                registry.inc("memory_ingest_processed_total", count, "Items processed by the ingest queue",
+                             status=status)
+        registry.observe("memory_ingest_batch_seconds", elapsed, "Duration of ingest queue batches")
+        # A failing downstream gets smaller batches
+        self._adapt(len(batch), self.target_batch_seconds * 2 if failed else elapsed)
+        logger.info(f"Ingested batch of {len(batch)} in {elapsed:.2f}s (next batch size {self.batch_size})")
+
+    def _fail(self, batch, error):
+        now = time.time()
+        updates = []
+        for item_id, _, _, attempts in batch:
+            if attempts >= self.max_attempts:
+                updates.append(("failed", json.dumps({"status": "error", "error": error}), now, item_id))
+            else:
+                updates.append(("queued", None, now, item_id))
+        return updates
+
+    def _renew(self, item_ids, lease, done):
+        placeholders = ", ".join("?" * len(item_ids))
+        while not done.wait(self.lease_seconds / 3):
+            lease_until = time.time() + self.lease_seconds
+            renewed = self._connection().execute(
+                f"UPDATE ingest_items SET lease_until = ? WHERE lease_until = ? AND id IN ({placeholders})",
+                (lease_until, lease["until"], *item_ids)
+            ).rowcount
+            lease["until"] = lease_until
+            if renewed < len(item_ids):
+                logger.warning(f"Lost the lease of {len(item_ids) - renewed} ingest items to another worker")
+
+    def _finish(self, updates, lease_until):
+        """
+        Record results of items still leased until ``lease_until``; others were taken over.
+        """
+        lost = len(updates) - self._connection().executemany(
+            "UPDATE ingest_items SET status = ?, result = ?, updated_at = ?, lease_until = NULL "
+            "WHERE id = ? AND lease_until = ?",
+            [(*update, lease_until) for update in updates]
+        ).rowcount
+        if lost:
+            logger.warning(f"Dropped the results of {lost} ingest items whose lease another worker took over")
+        with self._progress:
+            self._progress.notify_all()
+
+    def _adapt(self, size, elapsed):
+        with self._lock:
+            if elapsed > self.target_batch_seconds:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            elif size >= self.batch_size:
+                # A full batch means items are waiting; larger batches amortize embedding and insert
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+    def _purge(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        self._connection().execute(
+            "DELETE FROM ingest_items WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (now - self.retention_seconds,)
+        )
@@ -0,0 +1,102 @@
+import threading
+import time
+import uuid
+from loguru import logger
+
+# KEYS: lease key. ARGV: token, ttl in milliseconds.
+# Extends the lease only while this token still holds it.
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS: lease key. ARGV: token.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLease:
+    def __init__(self, redis_client, key, ttl=60, on_renew=None):
+        """
+        Exclusive, expiring hold on a Redis key, e.g. to let one process run a job.
+
+        ``acquire`` takes the key with ``SET NX`` and a ``ttl`` (seconds); from then on a
+        heartbeat thread renews it every third of the ``ttl``. A holder that stops renewing
+        (killed or hung) loses the lease once the TTL runs out, and another process can
+        acquire it. ``on_renew`` is called after every renewal and before ``release``.
+        """
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl = ttl
+        self.on_renew = on_renew
+        self.token = uuid.uuid4().hex
+        self._held = False
+        self._renewed_at = 0.0
+        self._heartbeat = None
+        self._lock = threading.Lock()
+        self._renew = redis_client.register_script(RENEW_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    @property
+    def held(self):
+        """
+        Whether this process holds the lease; False once renewals failed for a whole TTL.
+        """
+        return self._held and time.monotonic() - self._renewed_at < self.ttl
+
+    def acquire(self):
+        """
+        Take the lease if it is free, or renew it if this process holds it; returns ``held``.
+        """
+        if self._held:
+            return self.renew()
+        renewed_at = time.monotonic()
+        if not self.redis_client.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)):
+            return False
+        with self._lock:
+            self._held = True
+            self._renewed_at = renewed_at
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._run_heartbeat, name=f"lease-{self.key}", daemon=True)
+                self._heartbeat.start()
+        logger.info(f"Acquired lease {self.key}")
+        return True
+
+    def renew(self):
+        renewed_at = time.monotonic()
+        if not self._renew(keys=[self.key], args=[self.token, int(self.ttl * 1000)]):
+            if self._held:
+                logger.warning(f"Lost lease {self.key}")
+            self._held = False
+            return False
+        self._renewed_at = renewed_at
+        if self.on_renew is not None:
+            self.on_renew()
+        return True
+
+    def release(self):
+        if not self._held:
+            return
+        self._held = False
+        if self.on_renew is not None:
+            self.on_renew()
+        self._release(keys=[self.key], args=[self.token])
+        logger.info(f"Released lease {self.key}")
+
+    def _run_heartbeat(self):
+        # Runs until the lease is released or lost; ``acquire`` starts a new one
+        while self._held:
+            time.sleep(self.ttl / 3)
+            if not self._held:
+                return
+            try:
+                self.renew()
+            except Exception as e:
+                # Keep trying; ``held`` turns False once a whole TTL passed without a renewal
+                logger.warning(f"Could not renew lease {self.key}: {str(e)}")
@@ -0,0 +1,118 @@
+import math
+import re
+import threading
+from collections import Counter
+
+_TOKEN = re.compile(r"\w+")
+
+# Words too common to say anything about a match
+STOPWORDS = frozenset(
+    "a an and are as at be but by did do does for from had has have how i in is it its of on or "
+    "that the this to was were what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75):
+        """
+        In-process inverted index scoring documents with Okapi BM25.
+
+        Postings map each term to ``{doc_id: term frequency}``, so a query only touches
+        the documents that share a term with it. Documents are replaced when added again.
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._lengths = {}
+        self._doc_terms = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._lengths
+
+    def add(self, doc_ids, texts):
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                self._remove(doc_id)
+                terms = Counter(tokenize(text))
+                for term, count in terms.items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+                self._doc_terms[doc_id] = tuple(terms)
+                self._lengths[doc_id] = sum(terms.values())
+                self._total_length += self._lengths[doc_id]
+
+    def remove(self, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}
+            self._lengths = {}
+            self._doc_terms = {}
+            self._total_length = 0
+
+    def _remove(self, doc_id):
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query, top_k=10, require_all_terms=False):
+        """
+        Return up to ``top_k`` ``(doc_id, score)`` pairs, best first.
+
+        With ``require_all_terms``, only documents containing every query term qualify.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            count = len(self._lengths)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            postings = [self._postings.get(term, {}) for term in terms]
+            if require_all_terms:
+                if not all(postings):
+                    return []
+                candidates = set.intersection(*(set(term_postings) for term_postings in postings))
+            else:
+                candidates = None
+
+            scores = Counter()
+            for term_postings in postings:
+                if not term_postings:
+                    continue
+                idf = math.log(1 + (count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+                for doc_id, frequency in term_postings.items():
+                    if candidates is not None and doc_id not in candidates:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores.most_common(top_k)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Merge ranked id lists: each id scores the sum of ``1 / (k + rank)`` over the lists.
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1 / (k + rank)
+    return scores.most_common()
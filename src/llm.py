@@ -1,30 +1,397 @@
-import os
+import asyncio
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from loguru import logger
+from importance import IMPORTANCE_CHECK_PROMPT, parse_importance
+from metrics import registry, timed
+
+# US dollars per million input and output tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+SUMMARIZE_PROMPT = """Rewrite the following input as one concise, self-contained statement.
+Keep every fact, name, date and number; drop filler and conversational phrasing."""
+
+BATCH_IMPORTANCE_SUFFIX = ("\n\nYou will get {count} numbered items. Reply with a JSON array of {count} numbers, "
+                           "the importance of each item in order, and nothing else.")
+BATCH_SUMMARIZE_SUFFIX = ("\n\nYou will get {count} numbered items. Reply with a JSON array of {count} strings, "
+                          "the statement for each item in order, and nothing else.")
+
+# How often an async call polls for a free concurrency slot
+SLOT_POLL_SECONDS = 0.01
+
+_current_budget = contextvars.ContextVar("llm_budget", default=None)
+
+
+class BudgetExceededError(Exception):
+    """
+    Raised instead of calling the LLM once the active ``LLMBudget`` is spent.
+    """
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute):
+        """
+        Rate limiter refilling ``rate_per_minute`` units a minute, holding at most a minute's worth.
+        """
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = float(rate_per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """
+        Take ``amount`` units; returns how many seconds to wait before using them.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # The balance may go negative; later callers wait until it has refilled
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount):
+        """
+        Give back (or, when negative, take) units once the real cost of a call is known.
+        """
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMBudget:
+    def __init__(self, max_tokens=None, max_cost=None):
+        """
+        Tokens and US dollars calls may spend; None means unlimited.
+        """
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.calls = 0
+        self.tokens = 0
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return ((self.max_tokens is not None and self.tokens >= self.max_tokens)
+                or (self.max_cost is not None and self.cost >= self.max_cost))
+
+    def check(self):
+        if self.exhausted:
+            raise BudgetExceededError(f"LLM budget spent ({self.tokens} tokens, ${self.cost:.4f})")
+
+    def charge(self, tokens, cost):
+        with self._lock:
+            self.calls += 1
+            self.tokens += tokens
+            self.cost += cost
+
+
+def parse_json_list(reply, count):
+    """
+    The JSON array in an LLM reply; raises ValueError unless it has ``count`` items.
+    """
+    text = str(reply)
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        raise ValueError(f"No JSON array in reply: {text[:50]!r}")
+    try:
+        items = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON array in reply: {str(e)}") from e
+    if not isinstance(items, list) or len(items) != count:
+        raise ValueError(f"Expected an array of {count} items in reply: {text[:50]!r}")
+    return items
+
+
+def numbered_items(texts):
+    return "\n".join(f"{i + 1}. {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts))
+
 
 class LLM:
-    def __init__(self):
-        logger.info("Initializing LLM service")
+    def __init__(self, model="gpt-4o-mini", max_concurrency=8, requests_per_minute=None, tokens_per_minute=None,
+                 batch_items=20, max_retries=2, prices=None):
+        """
+        Chat model client shared by importance scoring, pruning and consolidation.
+
+        At most ``max_concurrency`` calls are in flight, from threads and the event loop
+        alike, and optional ``requests_per_minute`` and ``tokens_per_minute`` token buckets
+        keep calls under the provider's rate limits (a call's tokens are estimated up front
+        and corrected from the reported usage). Tokens, cost (``prices`` per million input
+        and output tokens, known models by default) and latency of every call are counted
+        in ``stats()`` and charged to the ``budget()`` active in the calling context.
+
+        ``check_importance`` and ``summarize`` put up to ``batch_items`` texts in one prompt.
+        """
+        logger.info(f"Initializing LLM service ({model}, {max_concurrency} concurrent calls)")
         load_dotenv()
+        self.model = model
         self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
+            model=model,
             temperature=0,
             max_tokens=None,
-            max_retries=2
+            max_retries=max_retries
         )
+        self.max_concurrency = max_concurrency
+        self.batch_items = batch_items
+        self.prices = prices or MODEL_PRICES.get(model, (0.0, 0.0))
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.failures = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.seconds = 0.0
+        self.rate_limited_seconds = 0.0
         logger.info("LLM service initialized successfully")
-    
+
+    @contextlib.contextmanager
+    def budget(self, max_tokens=None, max_cost=None):
+        """
+        Charge calls made in this context, including the batches it starts, to a new
+        ``LLMBudget``; once it is spent, calls raise ``BudgetExceededError``.
+        """
+        budget = LLMBudget(max_tokens, max_cost)
+        token = _current_budget.set(budget)
+        try:
+            yield budget
+        finally:
+            _current_budget.reset(token)
+
+    def _admit(self, messages):
+        """
+        Check the budget and reserve rate limit capacity; returns the token estimate and the wait.
+        """
+        budget = _current_budget.get()
+        if budget is not None:
+            budget.check()
+        # About four characters a token, and a reply about as long as the prompt
+        estimate = sum(len(content) for _, content in messages) // 2
+        wait = 0.0
+        if self._request_bucket is not None:
+            wait = self._request_bucket.reserve(1)
+        if self._token_bucket is not None:
+            wait = max(wait, self._token_bucket.reserve(estimate))
+        if wait:
+            with self._lock:
+                self.rate_limited_seconds += wait
+        return estimate, wait
+
+    def _account(self, response, estimate, elapsed):
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        cost = (input_tokens * self.prices[0] + output_tokens * self.prices[1]) / 1_000_000
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cost += cost
+            self.seconds += elapsed
+        if self._token_bucket is not None and usage:
+            self._token_bucket.adjust(estimate - input_tokens - output_tokens)
+        budget = _current_budget.get()
+        if budget is not None:
+            budget.charge(input_tokens + output_tokens, cost)
+        registry.inc("memory_llm_tokens_total", input_tokens, "LLM tokens used", kind="input")
+        registry.inc("memory_llm_tokens_total", output_tokens, "LLM tokens used", kind="output")
+        registry.inc("memory_llm_cost_dollars_total", cost, "Estimated LLM spend in US dollars")
+
+    def _failed(self):
+        with self._lock:
+            self.failures += 1
+        registry.inc("memory_llm_failures_total", 1, "LLM calls that raised")
+
+    @timed("llm")
     def generate_response(self, system_prompt, prompt):
         logger.info(f"Generating response for prompt: {prompt[:50]}...")
+        messages = [
+            ("system", system_prompt),
+            ("human", prompt)
+        ]
+        estimate, wait = self._admit(messages)
+        if wait:
+            time.sleep(wait)
+        with self._slots:
+            started = time.perf_counter()
+            try:
+                response = self.llm.invoke(messages)
+            except Exception as e:
+                self._failed()
+                logger.error(f"Error generating response: {str(e)}")
+                raise
+        self._account(response, estimate, time.perf_counter() - started)
+        logger.success("Response generated successfully")
+        return response.content
+
+    @timed("llm")
+    async def agenerate_response(self, system_prompt, prompt):
+        """
+        Async variant of ``generate_response``, sharing its concurrency and rate limits.
+        """
+        logger.info(f"Generating response for prompt: {prompt[:50]}...")
+        messages = [
+            ("system", system_prompt),
+            ("human", prompt)
+        ]
+        estimate, wait = self._admit(messages)
+        if wait:
+            await asyncio.sleep(wait)
+        # Polling keeps a cancelled call from leaking a slot
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(SLOT_POLL_SECONDS)
         try:
-            messages = [
-                ("system", system_prompt),
-                ("human", prompt)
-            ]
-            response = self.llm.invoke(messages)
-            logger.success("Response generated successfully")
-            return response.content
+            started = time.perf_counter()
+            response = await self.llm.ainvoke(messages)
         except Exception as e:
+            self._failed()
             logger.error(f"Error generating response: {str(e)}")
             raise
+        finally:
+            self._slots.release()
+        self._account(response, estimate, time.perf_counter() - started)
+        logger.success("Response generated successfully")
+        return response.content
+
+    def batch(self, requests):
+        """
+        Run ``(system_prompt, prompt)`` requests concurrently; returns each reply, or the
+        exception it raised, in order.
+        """
+        def call(system_prompt, prompt):
+            try:
+                return self.generate_response(system_prompt, prompt)
+            except Exception as e:
+                return e
+
+        if len(requests) == 1:
+            return [call(*requests[0])]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(requests))) as executor:
+            # Each call carries the caller's context, and with it the active budget
+            futures = [executor.submit(contextvars.copy_context().run, call, *request) for request in requests]
+            return [future.result() for future in futures]
+
+    async def abatch(self, requests):
+        """
+        Async variant of ``batch``.
+        """
+        return list(await asyncio.gather(
+            *(self.agenerate_response(system_prompt, prompt) for system_prompt, prompt in requests),
+            return_exceptions=True
+        ))
+
+    def _chunks(self, texts):
+        return [texts[start:start + self.batch_items] for start in range(0, len(texts), self.batch_items)]
+
+    def _importance_requests(self, chunks, instructions):
+        return [
+            (instructions, chunk[0]) if len(chunk) == 1
+            else (instructions + BATCH_IMPORTANCE_SUFFIX.format(count=len(chunk)), numbered_items(chunk))
+            for chunk in chunks
+        ]
+
+    def _parse_importance(self, chunks, replies):
+        """
+        Scores (or exceptions) per text; the texts of an unusable batched reply get its ValueError.
+        """
+        scores = []
+        for chunk, reply in zip(chunks, replies):
+            if isinstance(reply, BudgetExceededError):
+                raise reply
+            if isinstance(reply, Exception):
+                scores.extend([reply] * len(chunk))
+                continue
+            try:
+                items = [reply] if len(chunk) == 1 else parse_json_list(reply, len(chunk))
+            except ValueError as e:
+                logger.warning(f"Unusable batched importance reply for {len(chunk)} items: {str(e)}")
+                scores.extend([e] * len(chunk))
+                continue
+            for item in items:
+                try:
+                    scores.append(parse_importance(item))
+                except ValueError as e:
+                    scores.append(e)
+        return scores
+
+    def check_importance(self, texts, instructions=IMPORTANCE_CHECK_PROMPT):
+        """
+        Importance (0-100) of each text, or the exception scoring it raised.
+
+        Prompts of ``batch_items`` texts run concurrently, once: a text without a usable
+        score gets a ValueError, and retrying it is left to the caller. Raises
+        ``BudgetExceededError`` when the active budget ran out.
+        """
+        chunks = self._chunks(list(texts))
+        return self._parse_importance(chunks, self.batch(self._importance_requests(chunks, instructions)))
+
+    async def acheck_importance(self, texts, instructions=IMPORTANCE_CHECK_PROMPT):
+        """
+        Async variant of ``check_importance``.
+        """
+        chunks = self._chunks(list(texts))
+        return self._parse_importance(chunks, await self.abatch(self._importance_requests(chunks, instructions)))
+
+    def _summary_requests(self, chunks, instructions):
+        return [
+            (instructions + BATCH_SUMMARIZE_SUFFIX.format(count=len(chunk)), numbered_items(chunk))
+            for chunk in chunks
+        ]
+
+    def _parse_summaries(self, chunks, replies):
+        summaries = []
+        for chunk, reply in zip(chunks, replies):
+            if isinstance(reply, Exception):
+                raise reply
+            try:
+                items = parse_json_list(reply, len(chunk))
+            except ValueError as e:
+                logger.warning(f"Unusable summary reply, keeping {len(chunk)} texts as they are: {str(e)}")
+                items = chunk
+            summaries.extend(
+                item.strip() if isinstance(item, str) and item.strip() else text
+                for text, item in zip(chunk, items)
+            )
+        return summaries
+
+    def summarize(self, texts, instructions=SUMMARIZE_PROMPT):
+        """
+        One condensed statement per text, in order, ``batch_items`` texts per prompt.
+
+        Texts whose summary is missing or unparseable are returned as they are; failed
+        calls (including ``BudgetExceededError``) raise.
+        """
+        chunks = self._chunks(list(texts))
+        return self._parse_summaries(chunks, self.batch(self._summary_requests(chunks, instructions)))
+
+    async def asummarize(self, texts, instructions=SUMMARIZE_PROMPT):
+        """
+        Async variant of ``summarize``.
+        """
+        chunks = self._chunks(list(texts))
+        return self._parse_summaries(chunks, await self.abatch(self._summary_requests(chunks, instructions)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cost_dollars": self.cost,
+                "mean_latency_ms": self.seconds / self.calls * 1000 if self.calls else 0.0,
+                "rate_limited_seconds": self.rate_limited_seconds,
+            }
@@ -1,15 +1,31 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 import redis
+import redis.asyncio
 import os
+import json
 import threading
 import time
 from dotenv import load_dotenv
-from rag import RAGService
+from rag import SEARCH_MODES, RAGService
 from llm import LLM
+from memory import MemoryService
+from short_term_store import ShortTermStore
+from consolidation import ConsolidationEngine
+from pruning import LongTermPruner
+from short_term_index import ShortTermVectorIndex
+from ids import leased_id_generator
+from embedding_cache import EmbeddingCache
+from lexical_index import BM25Index
+from embeddings import MicroBatcher, ProcessPoolEmbeddingBackend, create_embedding_backend
+from importance import HeuristicPreScorer, ImportanceScorer, SimilarityPreScorer
+from metrics import SamplingProfiler, SlowRequestTracker, registry
+from ingest_queue import IngestQueue, QueueFullError
+from tenants import DEFAULT_TENANT, InvalidTenantError, Tenant, TenantManager
+from leases import RedisLease
 from loguru import logger
 
 # Configure loguru
-logger.add("logs/app.log", rotation="500 MB", level="INFO")
+logger.add(os.getenv('LOG_FILE', 'logs/app.log'), rotation="500 MB", level="INFO")
 
 # Load environment variables
 load_dotenv()
@@ -20,30 +36,371 @@ app = Flask(__name__)
 REDIS_HOST = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 MILVUS_URI = os.getenv('MILVUS_URI', 'http://milvus:19530')
 MILVUS_TOKEN = os.getenv('MILVUS_TOKEN', 'root:Milvus')
+MILVUS_COLLECTION = os.getenv('MILVUS_COLLECTION', 'rag_collection')  # tenants get <name>__<tenant>
+MULTI_TENANT = os.getenv('MULTI_TENANT', 'false').lower() == 'true'
+TENANT_HEADER = os.getenv('TENANT_HEADER', 'X-Tenant-ID')  # or a "tenant" field in the JSON body
+TENANT_MAX_LOADED = int(os.getenv('TENANT_MAX_LOADED', '32'))  # tenant collections kept in memory
+TENANT_IDLE_SECONDS = int(os.getenv('TENANT_IDLE_SECONDS', '900'))  # release tenant collections unused this long
+TENANT_LOAD_WAIT = float(os.getenv('TENANT_LOAD_WAIT', '10'))  # seconds a request waits for a cold tenant
 SHORT_TERM_ACCESS_THRESHOLD = int(os.getenv('SHORT_TERM_ACCESS_THRESHOLD', '3'))
 SLEEP_PROCESS_INTERVAL = int(os.getenv('SLEEP_PROCESS_INTERVAL', '300'))  # 5 minutes
+BACKGROUND_LEASE_TTL = int(os.getenv('BACKGROUND_LEASE_TTL', '60'))  # seconds before a dead leader is replaced
+CONSOLIDATION_TIME_BUDGET = float(os.getenv('CONSOLIDATION_TIME_BUDGET', '5'))  # seconds per pass
+CONSOLIDATION_PASS_PAUSE = float(os.getenv('CONSOLIDATION_PASS_PAUSE', '1'))  # between passes of one sweep
+CONSOLIDATION_BATCH_SIZE = int(os.getenv('CONSOLIDATION_BATCH_SIZE', '100'))
+CONSOLIDATION_SHARD_INDEX = int(os.getenv('CONSOLIDATION_SHARD_INDEX', '0'))
+CONSOLIDATION_SHARD_COUNT = int(os.getenv('CONSOLIDATION_SHARD_COUNT', '1'))
+PRUNE_REEVALUATE_AFTER = int(os.getenv('PRUNE_REEVALUATE_AFTER', str(7 * 24 * 3600)))
+PRUNE_PAGE_SIZE = int(os.getenv('PRUNE_PAGE_SIZE', '500'))
+PRUNE_TIME_BUDGET = float(os.getenv('PRUNE_TIME_BUDGET', '30'))  # seconds per pass
+PROCESS_BATCH_MAX_SIZE = int(os.getenv('PROCESS_BATCH_MAX_SIZE', '1000'))
+PROCESS_BATCH_WORKERS = int(os.getenv('PROCESS_BATCH_WORKERS', '8'))
+INGEST_ASYNC = os.getenv('INGEST_ASYNC', 'false').lower() == 'true'  # default for /process; per request with "async"
+INGEST_QUEUE_PATH = os.getenv('INGEST_QUEUE_PATH', 'ingest_queue.db')
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '2'))
+INGEST_MAX_BATCH = int(os.getenv('INGEST_MAX_BATCH', '256'))
+INGEST_TARGET_BATCH_SECONDS = float(os.getenv('INGEST_TARGET_BATCH_SECONDS', '2'))
+INGEST_MAX_DEPTH = int(os.getenv('INGEST_MAX_DEPTH', '10000'))  # /process answers 429 beyond this
+INGEST_RETENTION = int(os.getenv('INGEST_RETENTION', str(24 * 3600)))  # keep finished item statuses
+INGEST_RETRY_AFTER = int(os.getenv('INGEST_RETRY_AFTER', '5'))  # seconds, sent with 429
+MILVUS_COMPACT = os.getenv('MILVUS_COMPACT', 'false').lower() == 'true'  # defaults below for low-memory storage
+MILVUS_INDEX_TYPE = os.getenv('MILVUS_INDEX_TYPE', 'IVF_SQ8' if MILVUS_COMPACT else 'HNSW')  # FLAT, IVF_FLAT, IVF_SQ8, IVF_PQ or HNSW
+MILVUS_VECTOR_TYPE = os.getenv('MILVUS_VECTOR_TYPE', 'float16' if MILVUS_COMPACT else 'float32')
+MILVUS_COMPRESS_TEXT = os.getenv('MILVUS_COMPRESS_TEXT', str(MILVUS_COMPACT)).lower() == 'true'
+MILVUS_RERANK_FACTOR = int(os.getenv('MILVUS_RERANK_FACTOR', '4'))  # candidates per result on quantized indexes
+MILVUS_INDEX_PARAMS = json.loads(os.getenv('MILVUS_INDEX_PARAMS', '{}'))  # e.g. {"M": 16, "efConstruction": 200}
+MILVUS_SEARCH_PARAMS = json.loads(os.getenv('MILVUS_SEARCH_PARAMS', '{}'))  # e.g. {"ef": 64}
+MILVUS_INDEX_BUILD_THRESHOLD = int(os.getenv('MILVUS_INDEX_BUILD_THRESHOLD', '10000'))
+MILVUS_INDEX_REBUILD_RATIO = float(os.getenv('MILVUS_INDEX_REBUILD_RATIO', '0.5'))
+MILVUS_INDEX_AUTO_REBUILD = os.getenv('MILVUS_INDEX_AUTO_REBUILD', 'false').lower() == 'true'  # rebuild while serving (downtime)
+MILVUS_RESET_COLLECTION = os.getenv('MILVUS_RESET_COLLECTION', 'false').lower() == 'true'
+SLOW_REQUEST_LOG_MS = float(os.getenv('SLOW_REQUEST_LOG_MS', '1000'))  # log stage breakdowns above this, 0 = off
+PROFILE_SLOW_REQUESTS_MS = float(os.getenv('PROFILE_SLOW_REQUESTS_MS', '0'))  # dump flame graphs above this, 0 = off
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'auto')  # dense, lexical, hybrid or auto
+LONG_TERM_DEDUP = os.getenv('LONG_TERM_DEDUP', 'true').lower() == 'true'
+LONG_TERM_DEDUP_SIMILARITY = float(os.getenv('LONG_TERM_DEDUP_SIMILARITY', '0.97'))  # cosine
+LEXICAL_INDEX = os.getenv('LEXICAL_INDEX', 'true').lower() == 'true'
+LEXICAL_REFRESH_SECONDS = float(os.getenv('LEXICAL_REFRESH_SECONDS', '5'))  # Pick up other processes' inserts this often
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'default')  # default, onnx or hashing
+EMBEDDING_QUANTIZE = os.getenv('EMBEDDING_QUANTIZE', 'true').lower() == 'true'  # onnx only
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', '0'))  # onnx intra-op threads, 0 = runtime default
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', '768'))  # hashing only
+EMBEDDING_PROCESSES = int(os.getenv('EMBEDDING_PROCESSES', '0'))  # 0 = encode in-process
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv('EMBEDDING_BATCH_WAIT_MS', '2'))  # 0 disables micro-batching
+EMBEDDING_MAX_BATCH = int(os.getenv('EMBEDDING_MAX_BATCH', '64'))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+EMBEDDING_CACHE_REDIS = os.getenv('EMBEDDING_CACHE_REDIS', 'true').lower() == 'true'
+EMBEDDING_CACHE_REDIS_TTL = int(os.getenv('EMBEDDING_CACHE_REDIS_TTL', str(7 * 24 * 3600)))
+IMPORTANCE_CACHE_SIZE = int(os.getenv('IMPORTANCE_CACHE_SIZE', '10000'))
+IMPORTANCE_CACHE_TTL = int(os.getenv('IMPORTANCE_CACHE_TTL', '3600'))
+IMPORTANCE_MAX_RETRIES = int(os.getenv('IMPORTANCE_MAX_RETRIES', '2'))
+IMPORTANCE_PRESCORERS = [name for name in os.getenv('IMPORTANCE_PRESCORERS', 'heuristic').split(',') if name]  # heuristic, similarity
+IMPORTANCE_MIN_CONFIDENCE = float(os.getenv('IMPORTANCE_MIN_CONFIDENCE', '0.9'))
+IMPORTANCE_SIMILARITY_THRESHOLD = float(os.getenv('IMPORTANCE_SIMILARITY_THRESHOLD', '0.95'))
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4o-mini')
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))  # calls in flight per process
+LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', '0'))  # 0 = no rate limit
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '0'))  # 0 = no rate limit
+LLM_BATCH_ITEMS = int(os.getenv('LLM_BATCH_ITEMS', '20'))  # texts scored or summarized per prompt
+LLM_CYCLE_TOKEN_BUDGET = int(os.getenv('LLM_CYCLE_TOKEN_BUDGET', '0'))  # per background cycle, 0 = unlimited
+LLM_CYCLE_COST_BUDGET = float(os.getenv('LLM_CYCLE_COST_BUDGET', '0'))  # US dollars per background cycle, 0 = unlimited
+CONSOLIDATION_SUMMARIZE = os.getenv('CONSOLIDATION_SUMMARIZE', 'false').lower() == 'true'
+
+EMBEDDING_BACKEND_OPTIONS = {
+    'onnx': {'quantize': EMBEDDING_QUANTIZE, 'threads': EMBEDDING_THREADS or None},
+    'hashing': {'dim': EMBEDDING_DIM},
+}.get(EMBEDDING_BACKEND, {})
 
 # Initialize services
 redis_client = redis.from_url(REDIS_HOST, decode_responses=True)
-rag_service = RAGService(uri=MILVUS_URI, token=MILVUS_TOKEN)
-llm = LLM()
+if EMBEDDING_PROCESSES:
+    embedding_backend = ProcessPoolEmbeddingBackend(
+        EMBEDDING_BACKEND, EMBEDDING_BACKEND_OPTIONS, processes=EMBEDDING_PROCESSES
+    )
+else:
+    embedding_backend = create_embedding_backend(EMBEDDING_BACKEND, **EMBEDDING_BACKEND_OPTIONS)
+if EMBEDDING_BATCH_WAIT_MS > 0:
+    # Concurrent requests share one encoder call
+    embedding_backend = MicroBatcher(
+        embedding_backend, max_wait_ms=EMBEDDING_BATCH_WAIT_MS, max_batch_size=EMBEDDING_MAX_BATCH
+    )
+embedding_cache = EmbeddingCache(
+    max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+    # Vectors are stored as raw bytes, so this tier needs a binary client
+    redis_client=redis.from_url(REDIS_HOST) if EMBEDDING_CACHE_REDIS else None,
+    redis_ttl=EMBEDDING_CACHE_REDIS_TTL
+)
+def claim_collection_reset():
+    """
+    Whether this process should drop the default collection: with MILVUS_RESET_COLLECTION,
+    only the first of the workers starting together does, so later ones keep its data.
+    """
+    if not MILVUS_RESET_COLLECTION:
+        return False
+    try:
+        return bool(redis_client.set(f"milvus:reset:{MILVUS_COLLECTION}", os.getpid(), nx=True, ex=60))
+    except Exception as e:
+        logger.warning(f"Could not coordinate the collection reset through Redis, resetting anyway: {str(e)}")
+        return True
+
+# Shared by the RAG services of all tenants; only the default collection is ever reset
+rag_options = dict(
+    index_type=MILVUS_INDEX_TYPE,
+    index_params=MILVUS_INDEX_PARAMS,
+    search_params=MILVUS_SEARCH_PARAMS,
+    index_build_threshold=MILVUS_INDEX_BUILD_THRESHOLD,
+    index_rebuild_ratio=MILVUS_INDEX_REBUILD_RATIO,
+    auto_rebuild=MILVUS_INDEX_AUTO_REBUILD,
+    embedding_cache=embedding_cache,
+    embedding_backend=embedding_backend,
+    search_mode=SEARCH_MODE if LEXICAL_INDEX else 'dense',
+    lexical_refresh_seconds=LEXICAL_REFRESH_SECONDS,
+    vector_type=MILVUS_VECTOR_TYPE,
+    compress_text=MILVUS_COMPRESS_TEXT,
+    rerank_factor=MILVUS_RERANK_FACTOR,
+    deduplicate=LONG_TERM_DEDUP,
+    dedup_similarity=LONG_TERM_DEDUP_SIMILARITY,
+    # Processes sharing the collection lease distinct node ids from Redis (or set NODE_ID)
+    id_generator=leased_id_generator(redis_client)
+)
+rag_service = RAGService(
+    uri=MILVUS_URI,
+    token=MILVUS_TOKEN,
+    collection_name=MILVUS_COLLECTION,
+    lexical_index=BM25Index() if LEXICAL_INDEX else None,
+    reset=claim_collection_reset(),
+    # One process at a time releases the collection to build its index
+    index_build_lease=RedisLease(redis_client, f"milvus:index_build:{MILVUS_COLLECTION}"),
+    **rag_options
+)
+llm = LLM(
+    model=LLM_MODEL,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE or None,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE or None,
+    batch_items=LLM_BATCH_ITEMS
+)
 
 # Constants
 MIN_TTL = int(os.getenv('MIN_TTL', '10'))
 MAX_TTL = int(os.getenv('MAX_TTL', '60'))
 IMPORTANCE_THRESHOLD = float(os.getenv('IMPORTANCE_THRESHOLD', '70'))
+SHORT_TERM_SEMANTIC = os.getenv('SHORT_TERM_SEMANTIC', 'true').lower() == 'true'
+SHORT_TERM_SIMILARITY_THRESHOLD = float(os.getenv('SHORT_TERM_SIMILARITY_THRESHOLD', '0.9'))
+SHORT_TERM_INDEX_MAX_ITEMS = int(os.getenv('SHORT_TERM_INDEX_MAX_ITEMS', '100000'))
+
+pre_scorers = []
+if 'heuristic' in IMPORTANCE_PRESCORERS:
+    pre_scorers.append(HeuristicPreScorer())
+if 'similarity' in IMPORTANCE_PRESCORERS:
+    pre_scorers.append(SimilarityPreScorer(rag_service.encode_queries, min_similarity=IMPORTANCE_SIMILARITY_THRESHOLD))
+
+importance_scorer = ImportanceScorer(
+    llm,
+    cache_size=IMPORTANCE_CACHE_SIZE,
+    cache_ttl=IMPORTANCE_CACHE_TTL,
+    max_retries=IMPORTANCE_MAX_RETRIES,
+    pre_scorers=pre_scorers,
+    min_confidence=IMPORTANCE_MIN_CONFIDENCE,
+    max_workers=PROCESS_BATCH_WORKERS
+)
+
+memory_options = dict(
+    min_ttl=MIN_TTL,
+    max_ttl=MAX_TTL,
+    importance_threshold=IMPORTANCE_THRESHOLD,
+    short_term_similarity=SHORT_TERM_SIMILARITY_THRESHOLD
+)
+consolidation_options = dict(
+    access_threshold=SHORT_TERM_ACCESS_THRESHOLD,
+    batch_size=CONSOLIDATION_BATCH_SIZE,
+    time_budget=CONSOLIDATION_TIME_BUDGET,
+    shard_index=CONSOLIDATION_SHARD_INDEX,
+    shard_count=CONSOLIDATION_SHARD_COUNT,
+    summarize=llm.summarize if CONSOLIDATION_SUMMARIZE else None
+)
+pruner_options = dict(
+    importance_threshold=IMPORTANCE_THRESHOLD,
+    reevaluate_after=PRUNE_REEVALUATE_AFTER,
+    page_size=PRUNE_PAGE_SIZE,
+    delete_batch_size=PRUNE_PAGE_SIZE,
+    time_budget=PRUNE_TIME_BUDGET
+)
+
+short_term_index = ShortTermVectorIndex(max_items=SHORT_TERM_INDEX_MAX_ITEMS) if SHORT_TERM_SEMANTIC else None
+
+short_term_store = ShortTermStore(
+    redis_client, async_redis_client=redis.asyncio.from_url(REDIS_HOST, decode_responses=True)
+)
+
+memory_service = MemoryService(
+    short_term_store, rag_service, importance_scorer, short_term_index=short_term_index, **memory_options
+)
+
+consolidation_engine = ConsolidationEngine(short_term_store, rag_service, **consolidation_options)
+
+long_term_pruner = LongTermPruner(rag_service, importance_scorer, **pruner_options)
+
+
+def build_tenant(tenant_id):
+    """
+    Services for a tenant other than the default one: its own collection, Redis key
+    prefix and short-term vector tier, sharing clients, models and caches.
+    """
+    tenant_rag = RAGService(
+        client=rag_service.client,
+        collection_name=f"{MILVUS_COLLECTION}__{tenant_id}",
+        lexical_index=BM25Index() if LEXICAL_INDEX else None,
+        load=False,
+        index_build_lease=RedisLease(redis_client, f"milvus:index_build:{MILVUS_COLLECTION}__{tenant_id}"),
+        # Tenant collections are created on first use and never dropped by a restart
+        reset=False,
+        **rag_options
+    )
+    # The hash tag keeps a tenant's keys in one Redis Cluster slot, as its scripts need
+    tenant_store = ShortTermStore(
+        short_term_store.redis_client,
+        async_redis_client=short_term_store.async_redis_client,
+        prefix=f"stm:{{{tenant_id}}}:"
+    )
+    tenant_memory = MemoryService(
+        tenant_store, tenant_rag, importance_scorer,
+        short_term_index=ShortTermVectorIndex(max_items=SHORT_TERM_INDEX_MAX_ITEMS) if SHORT_TERM_SEMANTIC else None,
+        **memory_options
+    )
+    return Tenant(
+        tenant_id, tenant_rag, tenant_memory,
+        ConsolidationEngine(tenant_store, tenant_rag, **consolidation_options),
+        LongTermPruner(tenant_rag, importance_scorer, **pruner_options)
+    )
+
+
+tenants = TenantManager(
+    build_tenant,
+    default_tenant=Tenant(DEFAULT_TENANT, rag_service, memory_service, consolidation_engine, long_term_pruner),
+    redis_client=redis_client,
+    max_loaded=TENANT_MAX_LOADED,
+    idle_seconds=TENANT_IDLE_SECONDS,
+    load_wait=TENANT_LOAD_WAIT
+)
+
+
+def request_tenant_id(headers, data=None):
+    """
+    The tenant named by the tenant header or the body's "tenant" field, when multi-tenancy is on.
+    """
+    if not MULTI_TENANT:
+        return DEFAULT_TENANT
+    return headers.get(TENANT_HEADER) or (data or {}).get('tenant') or DEFAULT_TENANT
+
+
+def process_queued(texts, tenant_id):
+    return tenants.get(tenant_id or DEFAULT_TENANT).memory_service.process_batch(texts)
+
+
+ingest_queue = IngestQueue(
+    process_queued,
+    path=INGEST_QUEUE_PATH,
+    workers=INGEST_WORKERS,
+    max_batch_size=INGEST_MAX_BATCH,
+    target_batch_seconds=INGEST_TARGET_BATCH_SECONDS,
+    max_depth=INGEST_MAX_DEPTH,
+    retention_seconds=INGEST_RETENTION
+)
+
+request_tracker = SlowRequestTracker(
+    slow_threshold=SLOW_REQUEST_LOG_MS / 1000,
+    profiler=SamplingProfiler(
+        threshold=PROFILE_SLOW_REQUESTS_MS / 1000,
+        interval=PROFILE_INTERVAL_MS / 1000,
+        output_dir=PROFILE_DIR,
+        keep=PROFILE_KEEP
+    ) if PROFILE_SLOW_REQUESTS_MS > 0 else None
+)
+
+
+# One process per consolidation shard runs the background jobs, see sleep_like_processing
+background_lease = RedisLease(
+    redis_client, f"background:leader:{CONSOLIDATION_SHARD_INDEX}", ttl=BACKGROUND_LEASE_TTL
+)
+
+
+def collect_gauges():
+    """
+    Numeric fields of the /stats sections, exported as gauges.
+    """
+    sections = {
+        "embedding_cache": embedding_cache.stats(),
+        "importance": importance_scorer.stats(),
+        "llm": llm.stats(),
+        "long_term_dedup": rag_service.dedup_stats(),
+        "ingest_queue": ingest_queue.stats(),
+        "short_term": short_term_store.stats(),
+        "tenants": tenants.stats(),
+        "long_term": {"rows": rag_service.row_count, "ready": rag_service.is_ready},
+        "short_term_index": {"items": len(short_term_index) if short_term_index is not None else 0},
+    }
+    for section, values in sections.items():
+        for key, value in values.items():
+            if isinstance(value, (int, float)):
+                yield f"memory_{section}_{key}", {}, value
+
+
+registry.register_collector(collect_gauges)
+
 
-IMPORTANCE_CHECK_PROMPT = """Analyze the following input and determine its importance on a scale of 0-100.
-Consider factors like:
-- Long-term relevance
-- Information density
-- Uniqueness of information
-Return only the numeric value."""
+@app.before_request
+def start_request_trace():
+    # Label by route template, not the raw path, to keep metric label values bounded
+    g.trace = request_tracker.start(request.url_rule.rule if request.url_rule else None)
+
+@app.after_request
+def record_status(response):
+    g.status_code = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_trace(error):
+    trace, token = g.pop('trace')
+    request_tracker.finish(trace, token, status="error" if error else str(g.get('status_code', 500)))
+
+@app.errorhandler(InvalidTenantError)
+def invalid_tenant(error):
+    logger.error(f"Invalid tenant: {str(error)}")
+    return jsonify(error=str(error)), 400
 
 @app.route('/')
 def home():
     return jsonify(message="Welcome to the Enhanced Memory Management System!")
 
+@app.route('/health')
+def health():
+    long_term_ready = rag_service.is_ready
+    embedder_ready = rag_service.embedder_ready
+    ready = long_term_ready and embedder_ready
+    return jsonify(
+        status="ok" if ready else "loading", long_term_ready=long_term_ready, embedder_ready=embedder_ready
+    ), 200 if ready else 503
+
+@app.route('/stats')
+def stats():
+    return jsonify(
+        embedding_cache=embedding_cache.stats(),
+        importance=importance_scorer.stats(),
+        llm=llm.stats(),
+        long_term_dedup=rag_service.dedup_stats(),
+        ingest_queue=ingest_queue.stats(),
+        short_term=short_term_store.stats(),
+        tenants=tenants.stats()
+    )
+
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/process', methods=['POST'])
 def process_input():
     data = request.json
@@ -52,33 +409,60 @@ def process_input():
         return jsonify(error="No input provided"), 400
 
     input_text = data['input']
+    tenant_id = request_tenant_id(request.headers, data)
+    if data.get('async', INGEST_ASYNC):
+        return enqueue_inputs([input_text], tenants.validate(tenant_id), single=True)
     logger.info(f"Processing new input: {input_text[:50]}...")
-    
-    # Determine importance using LLM
-    importance_percentage = float(llm.generate_response(IMPORTANCE_CHECK_PROMPT, input_text))
-    logger.info(f"Calculated importance: {importance_percentage}")
-    
-    # Calculate TTL for short-term memory
-    ttl = MIN_TTL + (MAX_TTL - MIN_TTL) * (importance_percentage / 100)
-    
-    if importance_percentage < IMPORTANCE_THRESHOLD:
-        # Store in short-term memory (Redis)
-        redis_client.set(input_text, "stored", ex=int(ttl))
-        redis_client.hincrby("access_count", input_text, 0)  # Initialize access count
-        logger.info(f"Stored in short-term memory with TTL: {int(ttl)}")
-        return jsonify({
-            "status": "stored_short_term",
-            "ttl": int(ttl),
-            "importance": importance_percentage
-        })
+    return jsonify(tenants.get(tenant_id).memory_service.process(input_text))
 
-    # Store in long-term memory (RAG)
-    rag_service.add_documents([input_text])
-    logger.info("Stored in long-term memory")
-    return jsonify({
-        "status": "stored_long_term",
-        "importance": importance_percentage
-    })
+@app.route('/process/batch', methods=['POST'])
+def process_batch():
+    data = request.json
+    if not data or not isinstance(data.get('inputs'), list):
+        logger.error("No inputs provided in batch request")
+        return jsonify(error="No inputs provided"), 400
+
+    inputs = data['inputs']
+    if len(inputs) > PROCESS_BATCH_MAX_SIZE:
+        logger.error(f"Batch of {len(inputs)} exceeds limit of {PROCESS_BATCH_MAX_SIZE}")
+        return jsonify(error=f"Batch size exceeds limit of {PROCESS_BATCH_MAX_SIZE}"), 413
+    if not all(isinstance(item, str) for item in inputs):
+        logger.error("Batch inputs must be strings")
+        return jsonify(error="Inputs must be strings"), 400
+
+    tenant_id = request_tenant_id(request.headers, data)
+    if data.get('async', INGEST_ASYNC):
+        return enqueue_inputs(inputs, tenants.validate(tenant_id))
+    logger.info(f"Processing batch of {len(inputs)} inputs")
+    return jsonify(results=tenants.get(tenant_id).memory_service.process_batch(inputs))
+
+def enqueue_inputs(inputs, tenant_id, single=False):
+    """
+    Hand inputs to the ingest queue and answer 202 with their tracking ids.
+    """
+    try:
+        ids = ingest_queue.enqueue(inputs, tenant=tenant_id)
+    except QueueFullError as e:
+        logger.warning(str(e))
+        return jsonify(error="Ingest queue is full, retry later"), 429, {"Retry-After": str(INGEST_RETRY_AFTER)}
+    logger.info(f"Queued {len(ids)} inputs for ingestion")
+    if single:
+        return jsonify(id=ids[0], status="queued"), 202
+    return jsonify(ids=ids, status="queued"), 202
+
+@app.route('/process/status/<item_id>')
+def ingest_status(item_id):
+    item = ingest_queue.status([item_id]).get(item_id)
+    # Ids are only visible to the tenant that queued them, named by header or ?tenant=
+    if item is None or (item["tenant"] or DEFAULT_TENANT) != request_tenant_id(request.headers, request.args):
+        return jsonify(error="Unknown id"), 404
+    return jsonify(item)
+
+@app.route('/process/flush', methods=['POST'])
+def flush_ingest_queue():
+    data = request.get_json(silent=True) or {}
+    drained = ingest_queue.flush(timeout=data.get('timeout', 30))
+    return jsonify(drained=drained, **ingest_queue.stats()), 200 if drained else 504
 
 @app.route('/query', methods=['POST'])
 def query_memory():
@@ -88,26 +472,33 @@ def query_memory():
         return jsonify(error="No query provided"), 400
 
     query_text = data['query']
+    search_mode = data.get('mode')
+    if search_mode is not None and search_mode not in SEARCH_MODES:
+        logger.error(f"Unsupported search mode: {search_mode}")
+        return jsonify(error=f"Mode must be one of {', '.join(SEARCH_MODES)}"), 400
     logger.info(f"Processing query: {query_text[:50]}...")
-    
-    # Check short-term memory first
-    short_term_result = redis_client.get(query_text)
-    if short_term_result:
-        redis_client.hincrby("access_count", query_text, 1)  # Increment access count
+    memory_service = tenants.get(request_tenant_id(request.headers, data)).memory_service
+
+    # Exact short-term key, then the semantic short-term tier, then long-term memory
+    source, result = memory_service.query(query_text, mode=search_mode, nprobe=data.get('nprobe'), ef=data.get('ef'))
+    if source == "short_term":
         return jsonify({
             "source": "short_term",
-            "result": short_term_result
+            **result
         })
-
-    # Query long-term memory
-    long_term_results = rag_service.search(query_text)
-    if long_term_results:
+    if source == "loading":
+        logger.warning("Long-term memory is still loading")
+        return jsonify({
+            "source": "none",
+            "message": "Long-term memory is still loading"
+        }), 503
+    if source == "long_term":
         # Assume LLM uses some content from the retrieved documents
-        used_data = long_term_results[0]['text']  # Simplified assumption
+        used_data = result[0]['text']  # Simplified assumption
         logger.info(f"LLM used data: {used_data}")
         return jsonify({
             "source": "long_term",
-            "results": long_term_results,
+            "results": result,
             "used_data": used_data
         })
 
@@ -116,39 +507,66 @@ def query_memory():
         "message": "No matching information found"
     })
 
+def run_background_jobs():
+    """
+    Consolidate and prune every tenant's memory; only the holder of ``background_lease`` runs this.
+    """
+    # LLM calls of the whole cycle (importance re-scoring, summaries) share one budget
+    with llm.budget(max_tokens=LLM_CYCLE_TOKEN_BUDGET or None,
+                    max_cost=LLM_CYCLE_COST_BUDGET or None) as budget:
+        for tenant_id in tenants.known_tenants():
+            if not background_lease.held:
+                logger.warning("Lost the background lease, stopping this cycle")
+                break
+            tenant = tenants.get(tenant_id, load=False)
+
+            # Promote short-term memory, one time-boxed pass at a time until the sweep completes
+            while not tenant.consolidation_engine.run_pass()["complete"]:
+                time.sleep(CONSOLIDATION_PASS_PAUSE)
+
+            # Clean up long-term memory of loaded tenants; only new or stale documents are
+            # re-scored, and an unfinished pass resumes from its cursor next cycle. Pruning
+            # is not sharded, so only the leader of shard 0 runs it.
+            if CONSOLIDATION_SHARD_INDEX == 0 and tenant.rag_service.is_ready:
+                tenant.long_term_pruner.run_pass()
+    logger.info(f"Background LLM usage: {budget.calls} calls, {budget.tokens} tokens, ${budget.cost:.4f}")
+
+
 def sleep_like_processing():
     """
     Background process to review short-term memory, decide if items should go to long-term memory,
     and clean up unnecessary long-term memory data.
+
+    Every worker process runs this loop, but consolidation and pruning change shared data
+    and spend LLM tokens, so only the process holding ``background_lease`` runs them.
     """
     while True:
         logger.info("Starting sleep-like processing...")
+        started = time.monotonic()
+        try:
+            if background_lease.acquire():
+                run_background_jobs()
+                # Releasing unloads a collection for every process, so one process decides,
+                # from the tenants' last use in any process
+                if CONSOLIDATION_SHARD_INDEX == 0:
+                    tenants.release_idle()
+            else:
+                logger.info("Another process holds the background lease, skipping consolidation and pruning")
 
-        # Process short-term memory
-        keys = redis_client.keys()
-        for key in keys:
-            if redis_client.ttl(key) > 0:  # Ensure the key is still valid
-                access_count = int(redis_client.hget("access_count", key) or 0)
-                if access_count >= SHORT_TERM_ACCESS_THRESHOLD:
-                    # Summarize and move to long-term memory
-                    summarized_content = llm.summarize(key)
-                    rag_service.add_documents([summarized_content])
-                    logger.info(f"Promoted to long-term memory: {summarized_content}")
-                    redis_client.delete(key)
-                    redis_client.hdel("access_count", key)
-
-        # Clean up long-term memory
-        all_documents = rag_service.get_all_documents()
-        for doc in all_documents:
-            usage_feedback = llm.check_importance(doc["text"])
-            if usage_feedback < IMPORTANCE_THRESHOLD:
-                logger.info(f"Removed unnecessary document from long-term memory: {doc['text'][:50]}...")
-                rag_service.delete_document(doc["id"])
+            # Per-process upkeep: drop expired short-term vectors
+            for tenant in tenants.local_tenants():
+                if tenant.memory_service.short_term_index is not None:
+                    tenant.memory_service.short_term_index.evict_expired()
+        except Exception as e:
+            logger.error(f"Sleep-like processing failed: {str(e)}")
 
+        registry.observe("memory_background_pass_seconds", time.monotonic() - started,
+                         "Duration of background passes", job="sleep_cycle")
         logger.info("Completed sleep-like processing.")
         time.sleep(SLEEP_PROCESS_INTERVAL)
 
 if __name__ == '__main__':
     # Start the background sleep-like processing thread
     threading.Thread(target=sleep_like_processing, daemon=True).start()
+    ingest_queue.start()
     app.run(debug=True, port=5000, host='0.0.0.0')
@@ -0,0 +1,248 @@
+import time
+from loguru import logger
+from metrics import span, timed
+
+
+class MemoryService:
+    def __init__(self, short_term_store, rag_service, scorer, min_ttl=10, max_ttl=60,
+                 importance_threshold=70, short_term_index=None, short_term_similarity=0.9):
+        """
+        Route inputs to short-term (Redis, see ``ShortTermStore``) or long-term (RAG) memory
+        based on importance.
+
+        With a ``ShortTermVectorIndex``, short-term items are also embedded so queries
+        can match them semantically (cosine >= ``short_term_similarity``), not only
+        byte for byte.
+        """
+        logger.info("Initializing memory service")
+        self.short_term_store = short_term_store
+        self.rag_service = rag_service
+        self.scorer = scorer
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.importance_threshold = importance_threshold
+        self.short_term_index = short_term_index
+        self.short_term_similarity = short_term_similarity
+        logger.info("Memory service initialized successfully")
+
+    def score_importance(self, input_text):
+        """
+        Importance of a single input (0-100), see ImportanceScorer.
+        """
+        return self.scorer.score(input_text)
+
+    def short_term_key(self, input_text):
+        return self.short_term_store.item_key(input_text)
+
+    def _short_term_hit(self, record, score):
+        if record is None:
+            return None
+        return {"result": "stored", "text": record["text"], "importance": record["importance"], "score": score}
+
+    @timed("redis_lookup")
+    def lookup_short_term(self, query_text):
+        """
+        Exact-match short-term lookup; counts the access on a hit.
+        """
+        return self._short_term_hit(self.short_term_store.touch(query_text), 1.0)
+
+    @timed("redis_lookup")
+    async def alookup_short_term(self, query_text):
+        """
+        Async variant of ``lookup_short_term`` for the ASGI app; needs the store's async client.
+        """
+        return self._short_term_hit(await self.short_term_store.atouch(query_text), 1.0)
+
+    def similar_short_term_candidates(self, query_vector, top_k=3):
+        if self.short_term_index is None:
+            return []
+        return self.short_term_index.search(query_vector, top_k=top_k, min_similarity=self.short_term_similarity)
+
+    @timed("short_term_semantic")
+    def lookup_similar_short_term(self, query_vector):
+        """
+        Semantic short-term lookup against the in-process vector tier.
+
+        Matches are confirmed against Redis, so items promoted or deleted elsewhere are
+        dropped from the tier instead of being returned.
+        """
+        for key, score in self.similar_short_term_candidates(query_vector):
+            hit = self._short_term_hit(self.short_term_store.touch_id(self.short_term_store.id_for_key(key)), score)
+            if hit:
+                return hit
+            self.short_term_index.remove(key)
+        return None
+
+    @timed("short_term_semantic")
+    async def alookup_similar_short_term(self, query_vector):
+        """
+        Async variant of ``lookup_similar_short_term``.
+        """
+        for key, score in self.similar_short_term_candidates(query_vector):
+            record = await self.short_term_store.atouch_id(self.short_term_store.id_for_key(key))
+            hit = self._short_term_hit(record, score)
+            if hit:
+                return hit
+            self.short_term_index.remove(key)
+        return None
+
+    def query(self, query_text, mode=None, nprobe=None, ef=None):
+        """
+        Answer a query from the first tier that has it: the exact short-term key, the
+        semantic short-term tier, then long-term memory.
+
+        Returns ``(source, result)``: ``("short_term", hit)``, ``("long_term", results)``,
+        ``("none", None)``, or ``("loading", None)`` while long-term memory cannot be searched.
+        """
+        short_term_hit = self.lookup_short_term(query_text)
+        if short_term_hit:
+            return "short_term", short_term_hit
+
+        # The semantic tier is checked before any long-term result; the query is embedded
+        # for it only while the tier holds items
+        rag_service = self.rag_service
+        query_vector = None
+        if self.short_term_index is not None and len(self.short_term_index) and rag_service.embedder_ready:
+            query_vector = rag_service.encode_queries([query_text])[0]
+            short_term_hit = self.lookup_similar_short_term(query_vector)
+            if short_term_hit:
+                return "short_term", short_term_hit
+
+        # Keyword matches in long-term memory can be answered without embedding the query
+        results = rag_service.try_lexical_search(query_text, mode=mode) if rag_service.is_ready else None
+        if results is None:
+            if not (rag_service.is_ready and rag_service.embedder_ready):
+                return "loading", None
+            if query_vector is None:
+                query_vector = rag_service.encode_queries([query_text])[0]
+            hybrid = rag_service.effective_search_mode(mode) != "dense"
+            results = rag_service.search_by_vector(
+                query_vector, nprobe=nprobe, ef=ef, lexical_query=query_text if hybrid else None
+            )
+        return ("long_term", results) if results else ("none", None)
+
+    def ttl_for(self, importance_percentage):
+        """
+        Map an importance score onto the short-term TTL range.
+        """
+        return int(self.min_ttl + (self.max_ttl - self.min_ttl) * (importance_percentage / 100))
+
+    def process(self, input_text):
+        """
+        Process a single input; errors are raised instead of reported.
+        """
+        return self.process_batch([input_text], raise_errors=True)[0]
+
+    def process_batch(self, inputs, raise_errors=False):
+        """
+        Score, route and store many inputs per round-trip.
+
+        Importance is scored in batched LLM prompts, long-term items share a single
+        embedding call and a single insert, and short-term writes are pipelined.
+        Returns one status dict per input, in input order.
+        """
+        logger.info(f"Processing batch of {len(inputs)} inputs")
+        results = [None] * len(inputs)
+        if not inputs:
+            return results
+
+        scores = self._score_batch(inputs, raise_errors)
+
+        short_term = []
+        long_term = []
+        for i, score in enumerate(scores):
+            if isinstance(score, Exception):
+                results[i] = {"status": "error", "error": str(score)}
+            elif score < self.importance_threshold:
+                short_term.append(i)
+            else:
+                long_term.append(i)
+
+        if short_term:
+            self._store_short_term(inputs, scores, short_term, results, raise_errors)
+        if long_term:
+            self._store_long_term(inputs, scores, long_term, results, raise_errors)
+
+        logger.success(
+            f"Processed batch: {len(short_term)} short-term, {len(long_term)} long-term, "
+            f"{len(inputs) - len(short_term) - len(long_term)} failed"
+        )
+        return results
+
+    def _score_batch(self, inputs, raise_errors):
+        if len(inputs) == 1:
+            try:
+                return [self.score_importance(inputs[0])]
+            except Exception as e:
+                if raise_errors:
+                    raise
+                logger.error(f"Error scoring input: {str(e)}")
+                return [e]
+
+        try:
+            scores = self.scorer.score_many(inputs)
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Error scoring batch: {str(e)}")
+            return [e] * len(inputs)
+        for score in scores:
+            if isinstance(score, Exception):
+                if raise_errors:
+                    raise score
+                logger.error(f"Error scoring input: {str(score)}")
+        return scores
+
+    def _store_short_term(self, inputs, scores, indexes, results, raise_errors):
+        try:
+            with span("redis_write"):
+                self.short_term_store.store_many([(inputs[i], scores[i], self.ttl_for(scores[i])) for i in indexes])
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Error storing short-term batch: {str(e)}")
+            for i in indexes:
+                results[i] = {"status": "error", "error": str(e), "importance": scores[i]}
+            return
+
+        if self.short_term_index is not None:
+            try:
+                # Same TTLs as the Redis keys, so both tiers expire together
+                self.short_term_index.add(
+                    [self.short_term_key(inputs[i]) for i in indexes],
+                    self.rag_service.encode_documents([inputs[i] for i in indexes]),
+                    [self.ttl_for(scores[i]) for i in indexes]
+                )
+            except Exception as e:
+                logger.warning(f"Error indexing short-term batch: {str(e)}")
+
+        for i in indexes:
+            results[i] = {
+                "status": "stored_short_term",
+                "ttl": self.ttl_for(scores[i]),
+                "importance": scores[i]
+            }
+        logger.info(f"Stored {len(indexes)} inputs in short-term memory")
+
+    def _store_long_term(self, inputs, scores, indexes, results, raise_errors):
+        try:
+            # Record the score so pruning does not re-evaluate fresh documents
+            now = time.time()
+            self.rag_service.add_documents(
+                [inputs[i] for i in indexes],
+                [{"importance": scores[i], "last_evaluated": now} for i in indexes]
+            )
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Error storing long-term batch: {str(e)}")
+            for i in indexes:
+                results[i] = {"status": "error", "error": str(e), "importance": scores[i]}
+            return
+
+        for i in indexes:
+            results[i] = {
+                "status": "stored_long_term",
+                "importance": scores[i]
+            }
+        logger.info(f"Stored {len(indexes)} inputs in long-term memory")
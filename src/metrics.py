@@ -0,0 +1,315 @@
+"""
+In-process latency histograms, request-scoped timing spans and a Prometheus text endpoint.
+
+    with span("milvus_search"):
+        ...
+
+Every span is recorded in the ``memory_stage_seconds`` histogram and, inside a request
+opened with ``SlowRequestTracker.request``, in that request's breakdown, which is logged when the
+request is slow. ``registry.render()`` produces the ``/metrics`` payload.
+"""
+import bisect
+import contextlib
+import contextvars
+import functools
+import heapq
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from loguru import logger
+
+# Seconds; spans cover sub-millisecond Redis calls up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Endpoint label of requests that matched no route, so unknown paths add no label values
+UNMATCHED_ENDPOINT = "unmatched"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Histograms and counters keyed by name and label set, plus collectors that are
+        called at scrape time for values owned elsewhere (cache statistics and the like).
+        """
+        self._histograms = {}
+        self._counters = Counter()
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+                self._help.setdefault(name, help_text)
+        histogram.observe(value)
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+            self._help.setdefault(name, help_text)
+
+    def register_collector(self, collector):
+        """
+        ``collector()`` returns ``(name, labels dict, value)`` gauge samples.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        histograms = {}
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            histograms.setdefault(name, []).append((labels, histogram))
+        for name, series in histograms.items():
+            lines.append(f"# HELP {name} {self._help.get(name) or name}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series:
+                counts, total, count = histogram.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name) or name}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        gauges = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+                continue
+            for name, labels, value in samples:
+                gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        for name, samples in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class RequestTrace:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = []
+        self.thread = threading.get_ident()
+        # Other threads currently running a span for this request (e.g. executor workers)
+        self.helper_threads = Counter()
+        self.samples = Counter()
+
+
+@contextlib.contextmanager
+def span(stage):
+    """
+    Time a block as ``stage`` in the stage histogram and the current request's breakdown.
+    """
+    trace = _current_trace.get()
+    thread_id = threading.get_ident()
+    if trace is not None:
+        trace.helper_threads[thread_id] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if trace is not None:
+            trace.helper_threads[thread_id] -= 1
+        registry.observe("memory_stage_seconds", elapsed, "Time spent per processing stage", stage=stage)
+        if trace is not None:
+            trace.stages.append((stage, elapsed))
+
+
+def timed(stage):
+    """
+    Decorator form of ``span`` for plain and async functions.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_methods(obj, prefix, method_names):
+    """
+    Wrap methods of a client instance (e.g. ``MilvusClient``) in spans named ``<prefix>_<method>``.
+    """
+    for method_name in method_names:
+        setattr(obj, method_name, timed(f"{prefix}_{method_name}")(getattr(obj, method_name)))
+    return obj
+
+
+class SlowRequestTracker:
+    def __init__(self, slow_threshold=1.0, profiler=None):
+        """
+        Log the stage breakdown of requests slower than ``slow_threshold`` seconds, and
+        hand finished traces to an optional ``SamplingProfiler``.
+        """
+        self.slow_threshold = slow_threshold
+        self.profiler = profiler
+
+    def start(self, endpoint):
+        """
+        Open a trace labelled with the route template ``endpoint`` (e.g. ``/query``), never the
+        raw path; None labels the request ``unmatched``.
+        """
+        trace = RequestTrace(endpoint or UNMATCHED_ENDPOINT)
+        if self.profiler is not None:
+            self.profiler.start(trace)
+        return trace, _current_trace.set(trace)
+
+    def finish(self, trace, token, status="ok"):
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # Finished from a different context than it was started in
+            _current_trace.set(None)
+        elapsed = time.perf_counter() - trace.started
+        registry.observe(
+            "memory_request_seconds", elapsed, "Request latency per endpoint", endpoint=trace.endpoint
+        )
+        registry.inc("memory_requests_total", 1, "Requests per endpoint and outcome",
+                     endpoint=trace.endpoint, status=status)
+        if self.profiler is not None:
+            self.profiler.finish(trace, elapsed)
+        if self.slow_threshold and elapsed >= self.slow_threshold:
+            breakdown = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in trace.stages)
+            logger.warning(f"Slow request {trace.endpoint} took {elapsed * 1000:.1f}ms: {breakdown}")
+
+    @contextlib.contextmanager
+    def request(self, endpoint):
+        trace, token = self.start(endpoint)
+        status = "ok"
+        try:
+            yield trace
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.finish(trace, token, status)
+
+
+class SamplingProfiler:
+    def __init__(self, threshold=0.5, interval=0.005, output_dir="profiles", keep=20):
+        """
+        Sample the stacks of threads working on in-flight requests every ``interval``
+        seconds. Requests slower than ``threshold`` seconds have their samples written as
+        folded stacks (``<endpoint>-<ms>ms-<n>.folded``), the input format of flamegraph.pl
+        and speedscope; only the ``keep`` slowest are kept on disk.
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.output_dir = output_dir
+        self.keep = keep
+        self._active = set()
+        self._slowest = []
+        self._written = 0
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        threading.Thread(target=self._run, daemon=True).start()
+        logger.info(f"Sampling profiler writing requests slower than {threshold}s to {output_dir}")
+
+    def start(self, trace):
+        with self._lock:
+            self._active.add(trace)
+
+    def finish(self, trace, elapsed):
+        with self._lock:
+            self._active.discard(trace)
+            if elapsed < self.threshold or not trace.samples:
+                return
+            if len(self._slowest) >= self.keep and elapsed <= self._slowest[0][0]:
+                return
+            self._written += 1
+            path = os.path.join(
+                self.output_dir,
+                f"{trace.endpoint.strip('/').replace('/', '_') or 'root'}-{elapsed * 1000:.0f}ms-{self._written}.folded"
+            )
+            heapq.heappush(self._slowest, (elapsed, path))
+            evicted = heapq.heappop(self._slowest)[1] if len(self._slowest) > self.keep else None
+        with open(path, "w") as f:
+            for stack, count in trace.samples.items():
+                f.write(f"{stack} {count}\n")
+        if evicted:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(evicted)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for trace in active:
+                threads = {trace.thread} | {thread_id for thread_id, depth in list(trace.helper_threads.items()) if depth > 0}
+                for thread_id in threads:
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        trace.samples[_fold(frame)] += 1
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
@@ -0,0 +1,111 @@
+import time
+from loguru import logger
+from llm import BudgetExceededError
+from metrics import registry
+
+
+class LongTermPruner:
+    def __init__(self, rag_service, scorer, importance_threshold=70, reevaluate_after=7 * 24 * 3600,
+                 page_size=500, delete_batch_size=500, time_budget=None):
+        """
+        Drop long-term documents whose importance fell below the threshold.
+
+        The collection is paged with a primary-key cursor, fetching only id, text and
+        metadata. Each document's ``metadata`` records ``importance`` and
+        ``last_evaluated`` (unix seconds), so only documents never evaluated or
+        evaluated more than ``reevaluate_after`` seconds ago are re-scored. Deletes are
+        batched. With a ``time_budget`` a pass stops early and the next one resumes from
+        the saved cursor, as does a pass that runs out of LLM budget.
+        """
+        logger.info("Initializing long-term pruner")
+        self.rag_service = rag_service
+        self.scorer = scorer
+        self.importance_threshold = importance_threshold
+        self.reevaluate_after = reevaluate_after
+        self.page_size = page_size
+        self.delete_batch_size = delete_batch_size
+        self.time_budget = time_budget
+        self.cursor = None
+
+    def is_stale(self, doc, now):
+        last_evaluated = (doc.get("metadata") or {}).get("last_evaluated")
+        return last_evaluated is None or now - last_evaluated >= self.reevaluate_after
+
+    def run_pass(self):
+        """
+        Evaluate stale documents page by page; returns counters for the pass.
+        """
+        started = time.monotonic()
+        stats = {"seen": 0, "scored": 0, "deleted": 0, "complete": False}
+        to_delete = []
+
+        pages = self.rag_service.iter_documents(
+            batch_size=self.page_size, output_fields=("id", "text", "metadata"), start_after=self.cursor
+        )
+        for page in pages:
+            stats["seen"] += len(page)
+            now = time.time()
+            stale = [doc for doc in page if self.is_stale(doc, now)]
+            if stale:
+                try:
+                    to_delete.extend(self._evaluate(stale, now))
+                except BudgetExceededError as e:
+                    logger.warning(f"Pruning pass stopped: {str(e)}")
+                    break
+                stats["scored"] += len(stale)
+            if len(to_delete) >= self.delete_batch_size:
+                stats["deleted"] += self._flush_deletes(to_delete)
+                to_delete = []
+            self.cursor = page[-1]["id"]
+            if self.time_budget is not None and time.monotonic() - started >= self.time_budget:
+                break
+        else:
+            stats["complete"] = True
+            self.cursor = None
+
+        stats["deleted"] += self._flush_deletes(to_delete)
+        stats["elapsed"] = time.monotonic() - started
+        registry.observe("memory_background_pass_seconds", stats["elapsed"], "Duration of background passes",
+                         job="pruning")
+        registry.inc("memory_pruned_total", stats["deleted"], "Long-term documents deleted by pruning")
+        logger.info(
+            f"Pruning pass: saw {stats['seen']}, re-scored {stats['scored']}, "
+            f"deleted {stats['deleted']} in {stats['elapsed']:.2f}s"
+        )
+        return stats
+
+    def _evaluate(self, docs, now):
+        """
+        Score ``docs``; returns ids to delete and records the score on the ones kept.
+        """
+        scores = self.scorer.score_many([doc["text"] for doc in docs])
+        for importance in scores:
+            if isinstance(importance, BudgetExceededError):
+                # Scores obtained so far are cached, so the next pass gets them for free
+                raise importance
+
+        delete_ids = []
+        keep = {}
+        for doc, importance in zip(docs, scores):
+            if isinstance(importance, Exception):
+                logger.error(f"Error scoring document {doc['id']}: {str(importance)}")
+                continue
+            if importance < self.importance_threshold:
+                logger.info(f"Removing unnecessary document from long-term memory: {doc['text'][:50]}...")
+                delete_ids.append(doc["id"])
+            else:
+                keep[doc["id"]] = {**(doc.get("metadata") or {}), "importance": importance, "last_evaluated": now}
+
+        if keep:
+            # Upserts need the whole row, so vectors are fetched only for the documents kept
+            rows = self.rag_service.get_documents(list(keep), output_fields=("id", "vector", "text"))
+            for row in rows:
+                row["metadata"] = keep[row["id"]]
+            self.rag_service.upsert_documents(rows)
+        return delete_ids
+
+    def _flush_deletes(self, ids):
+        if not ids:
+            return 0
+        self.rag_service.delete_documents(ids, batch_size=self.delete_batch_size)
+        return len(ids)
@@ -1,133 +1,1024 @@
+import base64
+import json
+import threading
 import time
-from pymilvus import MilvusClient, model
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pymilvus import DataType, MilvusClient
 from pymilvus.milvus_client import IndexParams
+import numpy as np
 from loguru import logger
+from embeddings import DefaultEmbeddingBackend
+from ids import TIMESTAMP_SHIFT, SnowflakeIdGenerator
+from lexical_index import reciprocal_rank_fusion
+from metrics import instrument_methods, timed
+from text_utils import text_hash
+
+SEARCH_MODES = ("dense", "lexical", "hybrid", "auto")
+
+# Default build and search parameters per supported index type
+INDEX_DEFAULTS = {
+    "FLAT": ({}, {}),
+    "IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_SQ8": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_PQ": ({"nlist": 1024, "m": 96, "nbits": 8}, {"nprobe": 16}),
+    "HNSW": ({"M": 16, "efConstruction": 200}, {"ef": 64}),
+}
+
+# Lexical refreshes page again from this long before the newest id indexed, since ids from
+# other processes' clocks and slow inserts can land behind it
+LEXICAL_REFRESH_OVERLAP_MS = 30000
+
+# Indexes that score with compressed vectors, so results benefit from a float re-rank
+QUANTIZED_INDEXES = ("IVF_SQ8", "IVF_PQ")
+IVF_INDEXES = ("IVF_FLAT", "IVF_SQ8", "IVF_PQ")
+
+VECTOR_TYPES = {
+    "float32": (DataType.FLOAT_VECTOR, np.float32),
+    "float16": (DataType.FLOAT16_VECTOR, np.float16),
+}
+
+# Marks zlib-compressed text; plain text that happens to start with it is always compressed
+COMPRESSED_TEXT_MARKER = "\x1bz"
+
+
+def compress_text(text):
+    """
+    Store ``text`` as base85 zlib when that is shorter (or when it could be mistaken for compressed text).
+    """
+    packed = COMPRESSED_TEXT_MARKER + base64.b85encode(zlib.compress(text.encode("utf-8"), 9)).decode("ascii")
+    if len(packed) < len(text) or text.startswith(COMPRESSED_TEXT_MARKER):
+        return packed
+    return text
+
+
+def decompress_text(value):
+    if value is None or not value.startswith(COMPRESSED_TEXT_MARKER):
+        return value
+    return zlib.decompress(base64.b85decode(value[len(COMPRESSED_TEXT_MARKER):])).decode("utf-8")
+
+
+def build_index_params(index_type, metric_type="COSINE", params=None, field_name="vector"):
+    """
+    Build the IndexParams for a vector field, filling in default build parameters.
+    """
+    if index_type not in INDEX_DEFAULTS:
+        raise ValueError(f"Unsupported index type: {index_type}")
+    build_params = {**INDEX_DEFAULTS[index_type][0], **(params or {})}
+    index_params = IndexParams()
+    index_params.add_index(
+        field_name=field_name,
+        index_type=index_type,
+        index_name=field_name,
+        metric_type=metric_type,
+        params=build_params
+    )
+    return index_params
+
 
 class RAGService:
-    def __init__(self, uri=None, token=None, collection_name="rag_collection"):
+    def __init__(self, uri=None, token=None, collection_name="rag_collection",
+                 index_type="FLAT", index_params=None, search_params=None, metric_type="COSINE",
+                 index_build_threshold=10000, index_rebuild_ratio=0.5, auto_rebuild=False, search_wait_timeout=30,
+                 reset=False, embedding_cache=None, id_generator=None, insert_batch_size=2000,
+                 embedding_backend=None, lexical_index=None, search_mode="dense", rrf_k=60,
+                 hybrid_candidates=4, deduplicate=False, dedup_similarity=0.97, vector_type="float32",
+                 compress_text=False, rerank_factor=4, client=None, load=True, index_build_lease=None,
+                 lexical_refresh_seconds=5.0):
         """
         Initialize Milvus client with support for both local and server modes.
+
+        An existing collection is kept (after checking its schema) and loaded in the
+        background; ``is_ready`` reports when it can be searched. Pass ``reset=True``
+        to drop and recreate it instead.
+
+        Texts are encoded by ``embedding_backend`` (the pymilvus default model unless
+        another ``EmbeddingBackend`` is given), whose model loads in the background too.
+        An optional ``EmbeddingCache`` skips re-encoding texts seen before.
+
+        Document ids come from ``id_generator`` (a ``SnowflakeIdGenerator``), so they are
+        unique across processes that use distinct node ids and sort by insertion time.
+        Large inserts are sent in chunks of ``insert_batch_size`` rows.
+
+        The collection starts with a FLAT index. Once it holds ``index_build_threshold``
+        rows, the configured ``index_type`` is built, and it is rebuilt whenever the rows
+        inserted since the last build exceed ``index_rebuild_ratio`` of the rows it was
+        built on. Milvus can only replace the index of a released collection, so builds
+        run before this process loads the collection (at startup or when a released tenant
+        loads again) and release it first; other processes serving it load it again when
+        their reads find it released. With several processes, pass an ``index_build_lease``
+        (a ``RedisLease`` per collection) so only one of them builds at a time. With
+        ``auto_rebuild``, a serving collection is also rebuilt in the background as it
+        grows; searches then wait up to ``search_wait_timeout`` seconds until it is loaded again.
+
+        With a ``lexical_index`` (a ``BM25Index``), stored texts are also indexed for
+        keyword search, kept in sync with inserts, upserts and deletes made through this
+        service and rebuilt from the collection on startup. Rows other processes insert are
+        picked up by ``refresh_lexical_index``, which searches start in the background at
+        most every ``lexical_refresh_seconds`` (None turns that off). ``search_mode`` then picks
+        ``dense``, ``lexical``, ``hybrid`` (both run concurrently, ``hybrid_candidates``
+        times ``top_k`` each, merged by reciprocal rank fusion) or ``auto`` (lexical when
+        some document contains every query term, otherwise hybrid).
+
+        Compact storage: ``vector_type="float16"`` halves raw vector storage, the
+        ``IVF_SQ8`` (int8) and ``IVF_PQ`` index types hold compressed vectors, and
+        ``compress_text`` stores texts zlib-compressed when that is shorter. Searches on a
+        quantized index fetch ``rerank_factor`` times ``top_k`` candidates and re-rank them
+        by exact similarity to the stored vectors. Vectors returned to callers are NumPy arrays.
+
+        With ``deduplicate``, ``add_documents`` merges repeated facts into the row already
+        stored instead of inserting them again (see there).
+
+        Services for several collections (one per tenant) can share one ``client``. With
+        ``load=False`` the collection is only loaded by ``load()``, and ``release()`` frees
+        its memory again.
         """
         logger.info(f"Initializing RAG service with collection: {collection_name}")
-        if uri and token:
+        if client is not None:
+            self.client = client
+        elif uri and token:
             logger.info("Connecting to remote Milvus server")
             self.client = MilvusClient(uri=uri, token=token)
         else:
             logger.info("Using local Milvus database")
             self.client = MilvusClient("milvus_demo.db")
-        
+        if client is None:
+            instrument_methods(self.client, "milvus", ("search", "insert", "upsert", "query", "get", "delete"))
+
         self.collection_name = collection_name
-        self.dimension = 768  # Model output dimension
+        self.embedding_fn = embedding_backend or DefaultEmbeddingBackend()
+        self.embedding_model_id = self.embedding_fn.model_id
+        self.dimension = self.embedding_fn.dim  # Model output dimension
+        self.embedding_fn.start_loading()
 
-        # Create or reset the collection
-        if self.client.has_collection(collection_name=self.collection_name):
+        if index_type not in INDEX_DEFAULTS:
+            raise ValueError(f"Unsupported index type: {index_type}")
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.search_params = search_params or {}
+        self.metric_type = metric_type
+        if vector_type not in VECTOR_TYPES:
+            raise ValueError(f"Unsupported vector type: {vector_type}")
+        self.vector_type = vector_type
+        self.vector_dtype = VECTOR_TYPES[vector_type][1]
+        self.compress_text = compress_text
+        self.rerank_factor = rerank_factor
+        self.index_build_threshold = index_build_threshold
+        self.index_rebuild_ratio = index_rebuild_ratio
+        self.auto_rebuild = auto_rebuild
+        self.index_build_lease = index_build_lease
+        self.search_wait_timeout = search_wait_timeout
+
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unsupported search mode: {search_mode}")
+        if search_mode != "dense" and lexical_index is None:
+            raise ValueError(f"Search mode {search_mode} needs a lexical index")
+        self.search_mode = search_mode
+        self.lexical_index = lexical_index
+        self.rrf_k = rrf_k
+        self.hybrid_candidates = hybrid_candidates
+        self._lexical_ready = threading.Event()
+        self._lexical_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lexical")
+        self.lexical_refresh_seconds = lexical_refresh_seconds
+        self._lexical_newest_id = None
+        self._lexical_refreshed = 0.0
+        self._lexical_refreshing = threading.Lock()
+
+        # Index lifecycle state
+        self.built_index_type = None
+        self.row_count = 0
+        self.rows_at_build = 0
+        self._index_lock = threading.Lock()
+        self._index_building = False
+        self._loading = False
+        self._loaded = threading.Event()
+        # False for collections created before the content_hash field existed
+        self.has_hash_field = True
+
+        # Open the existing collection, or create it
+        if reset and self.client.has_collection(collection_name=self.collection_name):
+            logger.warning(f"Resetting collection: {self.collection_name}")
             self.client.drop_collection(collection_name=self.collection_name)
-            
-        # Create collection with proper schema
+
+        if self.client.has_collection(collection_name=self.collection_name):
+            self._open_collection()
+        else:
+            self._create_collection()
+
+        self.embedding_cache = embedding_cache
+        self.id_generator = id_generator or SnowflakeIdGenerator()
+        self.insert_batch_size = insert_batch_size
+        self.deduplicate = deduplicate
+        self.dedup_similarity = dedup_similarity
+        self._dedup_lock = threading.Lock()
+        self._dedup_stats = Counter()
+        if load:
+            # Load the collection into memory without blocking startup
+            self.load()
+        logger.info("RAG service initialized successfully")
+
+    @property
+    def is_ready(self):
+        """
+        Whether the collection is loaded and can be searched.
+        """
+        return self._loaded.is_set()
+
+    @property
+    def embedder_ready(self):
+        """
+        Whether the embedding model is loaded, so encoding will not block.
+        """
+        return self.embedding_fn.is_ready
+
+    @property
+    def lexical_ready(self):
+        """
+        Whether the lexical index has been rebuilt from the collection.
+        """
+        return self._lexical_ready.is_set()
+
+    def _create_collection(self):
+        logger.info(f"Creating collection: {self.collection_name}")
         self.client.create_collection(
             collection_name=self.collection_name,
-            dimension=self.dimension,
-            primary_field_name="id",
-            vector_field_name="vector",
-            scalar_fields=[
-                {"name": "text", "type": "varchar", "max_length": 4096},
-                {"name": "metadata", "type": "json"},
-            ]
+            schema=self._create_schema()
         )
 
         # Create index for vector field
-        self._create_index()
+        self._create_index("FLAT")
+        self._create_hash_index()
 
-        # Set up embedding function
-        self.embedding_fn = model.DefaultEmbeddingFunction()
-        logger.info("RAG service initialized successfully")
+    def _create_hash_index(self):
+        """
+        Index the content hash field, so duplicate lookups do not scan the collection.
+        """
+        index_params = IndexParams()
+        index_params.add_index(field_name="content_hash", index_type="INVERTED", index_name="content_hash")
+        try:
+            self.client.create_index(collection_name=self.collection_name, index_params=index_params)
+        except Exception as e:
+            logger.warning(f"Failed to index content hashes, duplicate lookups will scan: {str(e)}")
+
+    def _open_collection(self):
+        logger.info(f"Opening existing collection: {self.collection_name}")
+        self._validate_schema()
+        if not self._refresh_index_state():
+            self._create_index("FLAT")
+        logger.info(
+            f"Opened collection with {self.row_count} rows and {self.built_index_type} index"
+        )
+
+    def _refresh_index_state(self):
+        """
+        Read the row count and vector index type from Milvus, where another process may have
+        changed them; returns False when the collection has no vector index.
+        """
+        stats = self.client.get_collection_stats(collection_name=self.collection_name)
+        self.row_count = int(stats["row_count"])
+        if "vector" not in self.client.list_indexes(collection_name=self.collection_name, field_name="vector"):
+            return False
+        index = self.client.describe_index(collection_name=self.collection_name, index_name="vector")
+        if index["index_type"] != self.built_index_type:
+            self.built_index_type = index["index_type"]
+            self.rows_at_build = self.row_count
+        return True
+
+    def _validate_schema(self):
+        """
+        Check that an existing collection matches the schema this service writes.
+        """
+        expected = {field.name: field for field in self._create_schema().fields}
+        actual = {
+            field["name"]: field
+            for field in self.client.describe_collection(collection_name=self.collection_name)["fields"]
+        }
+        if "content_hash" not in actual:
+            logger.warning(
+                f"Collection {self.collection_name} has no content_hash field; duplicate lookups "
+                f"scan metadata until it is recreated"
+            )
+            self.has_hash_field = False
+            del expected["content_hash"]
+        for name, field in expected.items():
+            if name not in actual:
+                raise ValueError(
+                    f"Collection {self.collection_name} is missing field '{name}'; "
+                    f"drop it with delete_all() or start with reset=True"
+                )
+            if actual[name]["type"] != field.dtype:
+                raise ValueError(
+                    f"Collection {self.collection_name} field '{name}' has type "
+                    f"{actual[name]['type']}, expected {field.dtype}"
+                )
+        dimension = int(actual["vector"]["params"]["dim"])
+        if dimension != self.dimension:
+            raise ValueError(
+                f"Collection {self.collection_name} has dimension {dimension}, "
+                f"expected {self.dimension}"
+            )
 
-    def _create_index(self):
+    def load(self, wait=None):
+        """
+        Start loading the collection in the background unless it is loaded or loading;
+        with ``wait``, block up to that many seconds for it. Returns ``is_ready``.
+        """
+        with self._index_lock:
+            start = not self._loaded.is_set() and not self._loading
+            if start:
+                self._loading = True
+        if start:
+            threading.Thread(target=self._load_collection, daemon=True).start()
+        if wait:
+            self._loaded.wait(timeout=wait)
+        return self.is_ready
+
+    def release(self):
+        """
+        Release the collection from memory and drop the lexical index; ``load()`` restores both.
+
+        Milvus releases it for every process, also when this one never loaded it; the others
+        load it again on their next read. Returns False, doing nothing, while the collection
+        is loading or its index is being built in this process.
+        """
+        with self._index_lock:
+            if self._index_building or self._loading:
+                return False
+            self._loaded.clear()
+        logger.info(f"Releasing collection {self.collection_name}")
+        try:
+            self.client.release_collection(collection_name=self.collection_name)
+        except Exception as e:
+            logger.error(f"Failed to release collection {self.collection_name}: {str(e)}")
+            raise
+        if self.lexical_index is not None:
+            self._lexical_ready.clear()
+            self.lexical_index.clear()
+        return True
+
+    def _load_collection(self):
+        logger.info(f"Loading collection {self.collection_name} in the background")
+        started = time.perf_counter()
+        try:
+            self._build_index_before_load()
+            try:
+                self.client.load_collection(collection_name=self.collection_name)
+            except Exception as e:
+                logger.error(f"Failed to load collection {self.collection_name}: {str(e)}")
+                return
+            self._loaded.set()
+            logger.success(f"Collection loaded in {time.perf_counter() - started:.2f}s")
+            if self.lexical_index is not None and not self._lexical_ready.is_set():
+                self._rebuild_lexical_index()
+        finally:
+            with self._index_lock:
+                self._loading = False
+
+    def _rebuild_lexical_index(self):
+        started = time.perf_counter()
+        try:
+            with self._lexical_refreshing:
+                self._lexical_newest_id = None
+                self._index_new_documents()
+        except Exception as e:
+            logger.error(f"Failed to build the lexical index: {str(e)}")
+            return
+        self._lexical_ready.set()
+        logger.success(
+            f"Indexed {len(self.lexical_index)} documents for keyword search in {time.perf_counter() - started:.2f}s"
+        )
+
+    def _index_new_documents(self):
+        """
+        Add the rows after the newest indexed id, less the overlap, that are not indexed yet.
+        """
+        start_after = None
+        if self._lexical_newest_id is not None:
+            start_after = max(self._lexical_newest_id - (LEXICAL_REFRESH_OVERLAP_MS << TIMESTAMP_SHIFT), 0)
+        added = 0
+        for page in self.iter_documents(output_fields=("id", "text"), start_after=start_after):
+            new = [doc for doc in page if doc["id"] not in self.lexical_index]
+            self.lexical_index.add([doc["id"] for doc in new], [doc["text"] for doc in new])
+            added += len(new)
+            self._lexical_newest_id = max(self._lexical_newest_id or 0, page[-1]["id"])
+        self._lexical_refreshed = time.monotonic()
+        return added
+
+    def refresh_lexical_index(self):
+        """
+        Index rows other processes inserted since the last rebuild or refresh; returns how many.
+
+        Returns 0 without waiting while another refresh runs or the index is not built.
+        """
+        if not self._lexical_ready.is_set() or not self._lexical_refreshing.acquire(blocking=False):
+            return 0
+        try:
+            added = self._index_new_documents()
+        except Exception as e:
+            logger.warning(f"Failed to refresh the lexical index: {str(e)}")
+            return 0
+        finally:
+            self._lexical_refreshing.release()
+        if added:
+            logger.info(f"Indexed {added} documents from other processes for keyword search")
+        return added
+
+    def _refresh_lexical_index_if_due(self):
+        if self.lexical_refresh_seconds is None:
+            return
+        now = time.monotonic()
+        if now - self._lexical_refreshed >= self.lexical_refresh_seconds:
+            self._lexical_refreshed = now
+            self._lexical_executor.submit(self.refresh_lexical_index)
+
+    def _create_schema(self):
+        """
+        Build the collection schema: int64 id, float vector, text, its content hash and JSON metadata.
+        """
+        schema = self.client.create_schema(auto_id=False, enable_dynamic_field=True)
+        schema.add_field("id", DataType.INT64, is_primary=True)
+        schema.add_field("vector", VECTOR_TYPES[self.vector_type][0], dim=self.dimension)
+        schema.add_field("text", DataType.VARCHAR, max_length=4096)
+        schema.add_field("content_hash", DataType.VARCHAR, max_length=64)
+        schema.add_field("metadata", DataType.JSON)
+        return schema
+
+    def _create_index(self, index_type):
         """
         Create an index for the vector field in the collection.
         """
-        logger.info("Creating index for vector field")
-        try:
-            # index_params = self.client.prepare_index_params()
-            # index_params.add_index(
-            #     field_name="vector",
-            #     index_type="IVF_FLAT",
-            #     metric_type="COSINE",
-            #     index_name="vector_index",
-            #     params={"nlist": 1024}
-            # )
-            # self.client.create_index(
-            #     collection_name=self.collection_name,
-            #     index_params=index_params
-            # )
+        logger.info(f"Creating {index_type} index for vector field")
+        try:
+            params = self.index_params if index_type == self.index_type else {}
+            self.client.create_index(
+                collection_name=self.collection_name,
+                index_params=build_index_params(index_type, self.metric_type, params)
+            )
+            self.built_index_type = index_type
+            self.rows_at_build = self.row_count
             logger.success("Index created successfully")
         except Exception as e:
             logger.error(f"Failed to create index: {str(e)}")
             raise
 
+    def build_index(self, index_type=None):
+        """
+        Replace the vector index with ``index_type`` (the configured type by default).
+
+        The collection is released while the index is rebuilt, in every process serving
+        it; searches wait for it to be loaded again. Returns False, doing nothing, while
+        another process holds the ``index_build_lease``.
+        """
+        index_type = index_type or self.index_type
+        if not self._acquire_build_lease():
+            return False
+        try:
+            logger.info(f"Building {index_type} index on {self.row_count} rows")
+            started = time.perf_counter()
+            self._loaded.clear()
+            try:
+                self.client.release_collection(collection_name=self.collection_name)
+                self._replace_index(index_type)
+            finally:
+                self.client.load_collection(collection_name=self.collection_name)
+                self._loaded.set()
+        finally:
+            self._release_build_lease()
+        logger.success(f"Built {index_type} index in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def _replace_index(self, index_type):
+        self.client.drop_index(collection_name=self.collection_name, index_name="vector")
+        previous_type = self.built_index_type
+        try:
+            self._create_index(index_type)
+        except Exception:
+            # Keep the collection searchable with the index it had before
+            self._create_index(previous_type)
+            raise
+
+    def _build_index_before_load(self):
+        """
+        Build an outgrown index before this process loads the collection; returns whether it did.
+
+        The collection is released first, since other processes may be serving it; they
+        load it again once their reads find it released.
+        """
+        try:
+            self._refresh_index_state()
+        except Exception as e:
+            logger.warning(f"Could not read the index of {self.collection_name}, keeping it: {str(e)}")
+            return False
+        if not self._needs_index_build() or not self._acquire_build_lease():
+            return False
+        logger.info(f"Building {self.index_type} index on {self.row_count} rows before loading")
+        started = time.perf_counter()
+        try:
+            self.client.release_collection(collection_name=self.collection_name)
+            self._replace_index(self.index_type)
+        except Exception as e:
+            logger.error(f"Index build failed, loading with the {self.built_index_type} index: {str(e)}")
+            return False
+        finally:
+            self._release_build_lease()
+        logger.success(f"Built {self.index_type} index in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def _acquire_build_lease(self):
+        if self.index_build_lease is None:
+            return True
+        try:
+            if self.index_build_lease.acquire():
+                return True
+        except Exception as e:
+            logger.warning(f"Could not take the index build lease of {self.collection_name}: {str(e)}")
+            return False
+        logger.info(f"Another process is building the index of {self.collection_name}")
+        return False
+
+    def _release_build_lease(self):
+        if self.index_build_lease is None:
+            return
+        try:
+            self.index_build_lease.release()
+        except Exception as e:
+            # The lease expires on its own
+            logger.warning(f"Could not release the index build lease of {self.collection_name}: {str(e)}")
+
+    def _reloading(self, call):
+        """
+        Run ``call``; when Milvus reports the collection not loaded (another process released
+        it to build an index), load it again and retry once.
+        """
+        try:
+            return call()
+        except Exception as e:
+            if "not loaded" not in str(e).lower():
+                raise
+            logger.warning(f"Collection {self.collection_name} was released elsewhere, loading it again")
+        with self._index_lock:
+            if not self._loading:
+                self._loaded.clear()
+        if not self.load(wait=self.search_wait_timeout):
+            raise TimeoutError(f"Collection {self.collection_name} is not loaded")
+        return call()
+
+    def _needs_index_build(self):
+        if self.index_type == "FLAT" or self.row_count < self.index_build_threshold:
+            return False
+        if self.built_index_type != self.index_type:
+            return True
+        inserted_since_build = self.row_count - self.rows_at_build
+        return inserted_since_build >= self.rows_at_build * self.index_rebuild_ratio
+
+    def _maybe_build_index(self):
+        """
+        With ``auto_rebuild``, start a background build when the collection has outgrown its index.
+        """
+        if not self.auto_rebuild:
+            return
+        with self._index_lock:
+            if self._index_building or not self._loaded.is_set() or not self._needs_index_build():
+                return
+            self._index_building = True
+
+        def run():
+            try:
+                self.build_index()
+            except Exception as e:
+                logger.error(f"Background index build failed: {str(e)}")
+            finally:
+                with self._index_lock:
+                    self._index_building = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _search_params(self, nprobe=None, ef=None):
+        params = {}
+        if self.built_index_type == self.index_type:
+            params.update(INDEX_DEFAULTS[self.index_type][1])
+            params.update(self.search_params)
+        if nprobe is not None and self.built_index_type in IVF_INDEXES:
+            params["nprobe"] = nprobe
+        if ef is not None and self.built_index_type == "HNSW":
+            params["ef"] = ef
+        return {"metric_type": self.metric_type, "params": params}
+
+    @timed("embed_documents")
+    def encode_documents(self, documents):
+        """
+        Embed documents, going through the embedding cache when one is configured.
+        """
+        if self.embedding_cache is None:
+            return self.embedding_fn.encode_documents(documents)
+        return self.embedding_cache.get_or_compute(
+            self.embedding_model_id, "document", documents, self.embedding_fn.encode_documents
+        )
+
+    @timed("embed_query")
+    def encode_queries(self, queries):
+        """
+        Embed queries, going through the embedding cache when one is configured.
+        """
+        if self.embedding_cache is None:
+            return self.embedding_fn.encode_queries(queries)
+        return self.embedding_cache.get_or_compute(
+            self.embedding_model_id, "query", queries, self.embedding_fn.encode_queries
+        )
+
     def add_documents(self, documents, metadata_list=None):
         """
-        Add documents with optional metadata to the collection.
+        Add documents with optional metadata to the collection; returns their ids.
+
+        With deduplication on, a document is not inserted when its normalized text hash
+        matches a stored or earlier batch document, or its vector is at least
+        ``dedup_similarity`` similar to one. The surviving row's ``hit_count`` and
+        ``last_seen`` metadata are updated instead, and its id is returned for the duplicate.
         """
         logger.info(f"Adding {len(documents)} documents to collection")
         try:
-            vectors = self.embedding_fn.encode_documents(documents)
+            vectors = self.encode_documents(documents)
             if metadata_list is None:
                 metadata_list = [{} for _ in documents]
-                
-            data = [
-                { 
-                    # the id will be a big number - the current nano-second timestamp
-                    "id": int(time.time_ns()),
-                    "vector": vectors[i],
-                    "text": documents[i],
-                    "metadata": metadata_list[i]
-                } for i in range(len(vectors))
-            ]
-            
-            self.client.insert(collection_name=self.collection_name, data=data)
+            if not self.deduplicate:
+                ids = self.id_generator.next_ids(len(documents))
+                self._insert_rows(ids, vectors, documents, metadata_list)
+            else:
+                with self._dedup_lock:
+                    ids = self._add_deduplicated(documents, vectors, metadata_list)
             logger.success(f"Successfully added {len(documents)} documents")
         except Exception as e:
             logger.error(f"Error adding documents: {str(e)}")
             raise
+        self._maybe_build_index()
+        return ids
 
-    def search(self, query, filter=None, top_k=3):
+    def insert_documents(self, ids, vectors, documents, metadata_list, upsert=False):
+        """
+        Insert rows that already have ids and vectors (e.g. from a snapshot), without
+        embedding or deduplicating them. With ``upsert``, rows whose id is stored already
+        are replaced instead of added again.
+        """
+        logger.info(f"Inserting {len(ids)} documents")
+        try:
+            self._insert_rows(ids, vectors, documents, metadata_list, upsert=upsert)
+        except Exception as e:
+            logger.error(f"Error inserting documents: {str(e)}")
+            raise
+        self._maybe_build_index()
+
+    def _insert_rows(self, ids, vectors, documents, metadata_list, upsert=False):
+        data = [
+            {
+                "id": ids[i],
+                "vector": self._pack_vector(vectors[i]),
+                "text": self._pack_text(documents[i]),
+                "metadata": metadata_list[i]
+            } for i in range(len(ids))
+        ]
+        if self.has_hash_field:
+            for row, document in zip(data, documents):
+                row["content_hash"] = text_hash(document)
+
+        write = self.client.upsert if upsert else self.client.insert
+        for start in range(0, len(data), self.insert_batch_size):
+            chunk = data[start:start + self.insert_batch_size]
+            write(collection_name=self.collection_name, data=chunk)
+            self.row_count += len(chunk)
+        if upsert:
+            # Replaced rows are not new ones
+            self.row_count = int(self.client.get_collection_stats(collection_name=self.collection_name)["row_count"])
+        if self.lexical_index is not None:
+            self.lexical_index.add(ids, documents)
+
+    def _add_deduplicated(self, documents, vectors, metadata_list):
+        now = time.time()
+        hashes = [text_hash(document) for document in documents]
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(documents), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        stored_by_hash = self._find_by_content_hash(set(hashes))
+        stored_similar = self._find_similar(
+            matrix, [i for i, content_hash in enumerate(hashes) if content_hash not in stored_by_hash]
+        )
+
+        # Resolve every document to a stored row, an earlier document of the batch, or a new row
+        new_ids = self.id_generator.next_ids(len(documents))
+        ids = [None] * len(documents)
+        kept = []
+        kept_by_hash = {}
+        hits = Counter()
+        for i, content_hash in enumerate(hashes):
+            target, near = stored_by_hash.get(content_hash), False
+            if target is None and content_hash in kept_by_hash:
+                target = ids[kept_by_hash[content_hash]]
+            if target is None and i in stored_similar:
+                target, near = stored_similar[i], True
+            if target is None and kept:
+                similarities = matrix[kept] @ matrix[i]
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.dedup_similarity:
+                    target, near = ids[kept[best]], True
+            if target is None:
+                ids[i] = new_ids[i]
+                kept.append(i)
+                kept_by_hash[content_hash] = i
+            else:
+                ids[i] = target
+                hits[target] += 1
+                self._dedup_stats["near_duplicates" if near else "exact_duplicates"] += 1
+
+        if kept:
+            kept_ids = [ids[i] for i in kept]
+            self._insert_rows(
+                kept_ids,
+                [vectors[i] for i in kept],
+                [documents[i] for i in kept],
+                [
+                    {**metadata_list[i], "hit_count": 1 + hits.pop(ids[i], 0), "last_seen": now,
+                     **({} if self.has_hash_field else {"content_hash": hashes[i]})}
+                    for i in kept
+                ]
+            )
+            self._dedup_stats["inserted"] += len(kept)
+        if hits:
+            # What is left in hits points at rows stored before this call
+            self._merge_hits(hits, now)
+        return ids
+
+    def _find_by_content_hash(self, hashes):
+        """
+        Map content hashes to the id of a stored document with that hash.
+        """
+        if not hashes or not self._loaded.is_set():
+            return {}
+        if self.has_hash_field:
+            docs = self.client.query(
+                collection_name=self.collection_name,
+                filter=f"content_hash in {json.dumps(sorted(hashes))}",
+                output_fields=["id", "content_hash"]
+            )
+            return {doc["content_hash"]: doc["id"] for doc in docs}
+        docs = self.client.query(
+            collection_name=self.collection_name,
+            filter=f'metadata["content_hash"] in {json.dumps(sorted(hashes))}',
+            output_fields=["id", "metadata"]
+        )
+        return {doc["metadata"]["content_hash"]: doc["id"] for doc in docs}
+
+    def _find_similar(self, matrix, positions):
+        """
+        Map batch positions to the id of their nearest stored document when it is similar enough.
+        """
+        if not positions or self.metric_type not in ("COSINE", "IP") or not self._loaded.is_set():
+            return {}
+        results = self.client.search(
+            collection_name=self.collection_name,
+            data=[self._pack_vector(matrix[i]) for i in positions],
+            limit=1,
+            search_params=self._search_params()
+        )
+        return {
+            position: hits[0]["id"]
+            for position, hits in zip(positions, results)
+            if hits and hits[0]["distance"] >= self.dedup_similarity
+        }
+
+    def _merge_hits(self, hits, now):
+        rows = self.get_documents(list(hits), output_fields=("id", "vector", "text", "metadata"))
+        for row in rows:
+            metadata = row.get("metadata") or {}
+            row["metadata"] = {
+                **metadata, "hit_count": metadata.get("hit_count", 1) + hits[row["id"]], "last_seen": now
+            }
+        self.upsert_documents(rows)
+
+    def dedup_stats(self):
+        """
+        Rows saved by deduplication since startup.
+        """
+        saved = self._dedup_stats["exact_duplicates"] + self._dedup_stats["near_duplicates"]
+        total = saved + self._dedup_stats["inserted"]
+        return {
+            "inserted": self._dedup_stats["inserted"],
+            "exact_duplicates": self._dedup_stats["exact_duplicates"],
+            "near_duplicates": self._dedup_stats["near_duplicates"],
+            "rows_saved": saved,
+            "saved_fraction": saved / total if total else 0.0
+        }
+
+    def search(self, query, filter=None, top_k=3, nprobe=None, ef=None, mode=None):
         """
         Perform semantic search with optional filtering.
+
+        ``nprobe`` (IVF indexes) and ``ef`` (HNSW) override the configured search
+        parameters for this call, trading recall for latency. ``mode`` overrides
+        ``search_mode``; ``lexical`` and ``auto`` with an exact-term match never embed
+        the query. Until the lexical index is built, every mode searches dense only.
         """
-        logger.info(f"Searching for: {query[:50]}... (top_k={top_k})")
+        mode = self.effective_search_mode(mode)
+        logger.info(f"Searching for: {query[:50]}... (top_k={top_k}, mode={mode})")
+        results = self.try_lexical_search(query, filter=filter, top_k=top_k, mode=mode)
+        if results is not None:
+            return results
         try:
-            query_vector = self.embedding_fn.encode_queries([query])
+            query_vector = self.encode_queries([query])[0]
+        except Exception as e:
+            logger.error(f"Search error: {str(e)}")
+            raise
+        return self.search_by_vector(
+            query_vector, filter=filter, top_k=top_k, nprobe=nprobe, ef=ef,
+            lexical_query=None if mode == "dense" else query
+        )
+
+    def search_by_vector(self, query_vector, filter=None, top_k=3, nprobe=None, ef=None, lexical_query=None):
+        """
+        Search with an already embedded query, so embedding can run elsewhere or concurrently.
+
+        With ``lexical_query``, a keyword search runs alongside the vector search and the
+        two rankings are merged by reciprocal rank fusion; scores are then fusion scores.
+        """
+        if lexical_query is None or not self.lexical_ready:
+            return self._dense_search(query_vector, filter, top_k, nprobe, ef)
+
+        self._refresh_lexical_index_if_due()
+        limit = top_k * self.hybrid_candidates
+        lexical_future = self._lexical_executor.submit(self.lexical_index.search, lexical_query, limit)
+        dense_results = self._dense_search(query_vector, filter, limit, nprobe, ef)
+        lexical_ranked = lexical_future.result()
+
+        fused = reciprocal_rank_fusion(
+            [[result["id"] for result in dense_results], [doc_id for doc_id, _ in lexical_ranked]], k=self.rrf_k
+        )
+        by_id = {result["id"]: result for result in dense_results}
+        # Lexical-only hits still need their text, and must pass the filter
+        missing = [doc_id for doc_id, _ in fused[:limit] if doc_id not in by_id]
+        by_id.update({doc["id"]: doc for doc in self._fetch_documents(missing, filter)})
+
+        results = []
+        for doc_id, score in fused:
+            if doc_id in by_id:
+                results.append({**by_id[doc_id], "score": score})
+                if len(results) == top_k:
+                    break
+        logger.success(f"Hybrid search completed, found {len(results)} results")
+        return results
+
+    def effective_search_mode(self, mode=None):
+        """
+        The mode a search will use: ``mode`` or the default, dense until the lexical index is built.
+        """
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unsupported search mode: {mode}")
+        return mode if mode == "dense" or self.lexical_ready else "dense"
+
+    def try_lexical_search(self, query, filter=None, top_k=3, mode=None):
+        """
+        Answer without embedding when ``mode`` allows it: always for ``lexical``, and for
+        ``auto`` when some document contains every query term. Returns None otherwise.
+        """
+        mode = self.effective_search_mode(mode)
+        if mode not in ("lexical", "auto"):
+            return None
+        results = self.lexical_search(query, filter=filter, top_k=top_k, require_all_terms=mode == "auto")
+        return results if results or mode == "lexical" else None
+
+    @timed("lexical_search")
+    def lexical_search(self, query, filter=None, top_k=3, require_all_terms=False):
+        """
+        Keyword (BM25) search that skips embedding the query; scores are BM25 scores.
+        """
+        self._refresh_lexical_index_if_due()
+        ranked = self.lexical_index.search(
+            query, top_k=top_k * self.hybrid_candidates if filter else top_k, require_all_terms=require_all_terms
+        )
+        scores = dict(ranked)
+        results = [
+            {**doc, "score": scores[doc["id"]]}
+            for doc in self._fetch_documents([doc_id for doc_id, _ in ranked], filter)
+        ][:top_k]
+        logger.success(f"Lexical search completed, found {len(results)} results")
+        return results
+
+    def _fetch_documents(self, ids, filter=None):
+        """
+        Fetch text and metadata for ``ids`` that pass ``filter``, keeping the order of ``ids``.
+        """
+        if not ids:
+            return []
+        try:
+            if not self._loaded.wait(timeout=self.search_wait_timeout):
+                raise TimeoutError(f"Collection {self.collection_name} is not loaded")
+            expression = f"id in [{', '.join(str(int(doc_id)) for doc_id in ids)}]"
+            if filter:
+                expression += f" and ({filter})"
+            docs = self._reloading(lambda: self.client.query(
+                collection_name=self.collection_name, filter=expression, output_fields=["id", "text", "metadata"]
+            ))
+        except Exception as e:
+            logger.error(f"Error fetching {len(ids)} search results: {str(e)}")
+            raise
+        order = {doc_id: position for position, doc_id in enumerate(ids)}
+        return sorted(
+            ({"id": doc["id"], "text": decompress_text(doc.get("text")), "metadata": doc.get("metadata")}
+             for doc in docs),
+            key=lambda doc: order[doc["id"]]
+        )
+
+    def _dense_search(self, query_vector, filter, top_k, nprobe, ef):
+        rerank = self.built_index_type in QUANTIZED_INDEXES and self.rerank_factor > 1
+        try:
+            if not self._loaded.wait(timeout=self.search_wait_timeout):
+                raise TimeoutError(f"Collection {self.collection_name} is not loaded")
             search_params = {
                 "collection_name": self.collection_name,
-                "data": query_vector,
-                "limit": top_k,
+                "data": [self._pack_vector(query_vector)],
+                "limit": top_k * self.rerank_factor if rerank else top_k,
                 "output_fields": ["text", "metadata"],
+                "search_params": self._search_params(nprobe=nprobe, ef=ef),
             }
             if filter:
                 search_params["filter"] = filter
                 
-            results = self.client.search(**search_params)
+            results = self._reloading(lambda: self.client.search(**search_params))
             
             logger.success(f"Search completed, found {len(results[0])} results")
-            return [
+            results = [
                 {
                     "id": item["id"],
                     "score": item["distance"],
-                    "text": item["entity"].get("text"),
+                    "text": decompress_text(item["entity"].get("text")),
                     "metadata": item["entity"].get("metadata")
                 }
                 for item in results[0]
             ]
+            return self._rerank(query_vector, results, top_k) if rerank else results
         except Exception as e:
             logger.error(f"Search error: {str(e)}")
             raise
 
-    def get_all_documents(self, limit=100):
+    def _rerank(self, query_vector, results, top_k):
+        """
+        Re-score candidates found with compressed vectors against the stored vectors.
+        """
+        if not results:
+            return results
+        vectors = {
+            doc["id"]: doc["vector"]
+            for doc in self.get_documents([result["id"] for result in results], output_fields=("id", "vector"))
+        }
+        # Candidates deleted since the search have no stored vector
+        results = [result for result in results if result["id"] in vectors]
+        if not results:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        matrix = np.stack([vectors[result["id"]] for result in results])
+        if self.metric_type == "COSINE":
+            query = query / max(np.linalg.norm(query), 1e-12)
+            matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        if self.metric_type == "L2":
+            scores = ((matrix - query) ** 2).sum(axis=1)
+            order = np.argsort(scores)
+        else:
+            scores = matrix @ query
+            order = np.argsort(-scores)
+        return [{**results[i], "score": float(scores[i])} for i in order[:top_k]]
+
+    def _pack_vector(self, vector):
+        return np.asarray(vector, dtype=self.vector_dtype)
+
+    def _pack_text(self, text):
+        # Reads decompress every marker-prefixed text, so such input is always stored packed
+        if self.compress_text or text.startswith(COMPRESSED_TEXT_MARKER):
+            return compress_text(text)
+        return text
+
+    def _unpack_rows(self, rows):
+        """
+        Decompress texts and turn vectors into float32 NumPy arrays, in place.
+        """
+        for row in rows:
+            if row.get("text") is not None:
+                row["text"] = decompress_text(row["text"])
+            vector = row.get("vector")
+            if vector is not None:
+                if self.vector_type == "float16":
+                    # Milvus returns half-precision vectors as raw bytes
+                    raw = b"".join(vector) if isinstance(vector, list) else vector
+                    row["vector"] = np.frombuffer(raw, dtype=np.float16).astype(np.float32)
+                else:
+                    row["vector"] = np.asarray(vector, dtype=np.float32)
+        return rows
+
+    def get_all_documents(self, limit=100, output_fields=("id", "text", "metadata")):
         """
         Retrieve a limited number of documents from the collection.
         
         :param limit: The maximum number of documents to retrieve (default is 100).
+        :param output_fields: Fields to return; add "vector" only when it is needed.
         """
         logger.info(f"Retrieving up to {limit} documents from the collection: {self.collection_name}")
         try:
@@ -135,36 +1026,116 @@ class RAGService:
             res = self.client.query(
                 collection_name=self.collection_name,
                 filter="",  # Empty filter to retrieve all documents
-                output_fields=["id", "text", "metadata", "vector"],
+                output_fields=list(output_fields),
                 limit=limit
             )
             
             logger.success(f"Successfully retrieved {len(res)} documents from the collection")
-            return res
+            return self._unpack_rows(res)
         except Exception as e:
             logger.error(f"Error retrieving documents from collection: {str(e)}")
             raise
 
+    def iter_documents(self, batch_size=1000, output_fields=("id", "text", "metadata"), filter=None,
+                       start_after=None):
+        """
+        Page through the whole collection in id order using a primary-key cursor.
 
+        Yields lists of at most ``batch_size`` documents. Documents deleted while
+        iterating are simply skipped, since the cursor only moves forward. Ids are
+        time-ordered, so ``start_after=id_for_timestamp(ms)`` pages from a point in time.
+        """
+        output_fields = list(output_fields)
+        if "id" not in output_fields:
+            output_fields.insert(0, "id")
+        cursor = start_after
+        while True:
+            conditions = [] if cursor is None else [f"id > {cursor}"]
+            if filter:
+                conditions.append(f"({filter})")
+            try:
+                page = self._reloading(lambda: self.client.query(
+                    collection_name=self.collection_name,
+                    filter=" and ".join(conditions),
+                    output_fields=output_fields,
+                    limit=batch_size
+                ))
+            except Exception as e:
+                logger.error(f"Error paging documents after id {cursor}: {str(e)}")
+                raise
+            if not page:
+                return
+            # Milvus returns limited query results in primary-key order; sort to be safe
+            page.sort(key=lambda doc: doc["id"])
+            cursor = page[-1]["id"]
+            yield self._unpack_rows(page)
+            if len(page) < batch_size:
+                return
 
-    def delete_document(self, doc_id):
+    def get_documents(self, ids, output_fields=("id", "text", "metadata")):
         """
-        Delete a document from the collection by ID.
+        Fetch documents by primary key.
         """
-        logger.info(f"Deleting document with ID: {doc_id}")
+        if not ids:
+            return []
         try:
-            # Create the boolean expression for deletion
-            expr = f"id in [{doc_id}]"
-            
-            # Perform the delete operation
-            collection = self.client.get_collection(self.collection_name)
-            collection.delete(expr)
-            
-            logger.success(f"Document with ID {doc_id} deleted successfully")
+            return self._unpack_rows(self._reloading(lambda: self.client.get(
+                collection_name=self.collection_name, ids=list(ids), output_fields=list(output_fields)
+            )))
         except Exception as e:
-            logger.error(f"Error deleting document with ID {doc_id}: {str(e)}")
+            logger.error(f"Error fetching {len(ids)} documents: {str(e)}")
             raise
 
+    def upsert_documents(self, rows):
+        """
+        Overwrite complete rows (id, vector, text, metadata), e.g. to update metadata.
+        """
+        if not rows:
+            return
+        try:
+            self.client.upsert(
+                collection_name=self.collection_name,
+                data=[
+                    {
+                        **row, "vector": self._pack_vector(row["vector"]), "text": self._pack_text(row["text"]),
+                        **({"content_hash": text_hash(row["text"])} if self.has_hash_field else {})
+                    }
+                    for row in rows
+                ]
+            )
+            if self.lexical_index is not None:
+                self.lexical_index.add([row["id"] for row in rows], [row["text"] for row in rows])
+            logger.success(f"Upserted {len(rows)} documents")
+        except Exception as e:
+            logger.error(f"Error upserting {len(rows)} documents: {str(e)}")
+            raise
+
+    def delete_documents(self, doc_ids, batch_size=1000):
+        """
+        Delete documents by ID with one ``id in [...]`` expression per batch.
+        """
+        doc_ids = list(doc_ids)
+        logger.info(f"Deleting {len(doc_ids)} documents")
+        try:
+            for start in range(0, len(doc_ids), batch_size):
+                batch = doc_ids[start:start + batch_size]
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    filter=f"id in [{', '.join(str(int(doc_id)) for doc_id in batch)}]"
+                )
+                if self.lexical_index is not None:
+                    self.lexical_index.remove(batch)
+            self.row_count = max(self.row_count - len(doc_ids), 0)
+            logger.success(f"Deleted {len(doc_ids)} documents")
+        except Exception as e:
+            logger.error(f"Error deleting documents: {str(e)}")
+            raise
+
+    def delete_document(self, doc_id):
+        """
+        Delete a document from the collection by ID.
+        """
+        self.delete_documents([doc_id])
 
     def delete_all(self):
         """
@@ -172,5 +1143,8 @@ class RAGService:
         """
         logger.warning(f"Deleting collection: {self.collection_name}")
         if self.client.has_collection(collection_name=self.collection_name):
+            self._loaded.clear()
             self.client.drop_collection(collection_name=self.collection_name)
+            if self.lexical_index is not None:
+                self.lexical_index.clear()
             print(f"Deleted collection: {self.collection_name}")
\ No newline at end of file
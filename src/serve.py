@@ -0,0 +1,29 @@
+"""
+Production launcher for the ASGI app (see asgi.py).
+
+    WEB_CONCURRENCY=4 python src/serve.py
+
+Every worker serves requests and drains the ingest queue, whose claims are leases renewed
+while a batch runs, so each item is processed once; only items of a worker that died
+mid-batch are processed again. Consolidation and pruning run in one process at a time: workers
+compete for a Redis lease and only its holder runs them, another taking over within
+BACKGROUND_LEASE_TTL seconds if it dies. BACKGROUND_JOBS=false keeps them out of these
+workers altogether, e.g. when a separate process runs them.
+"""
+import os
+import uvicorn
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', '5000'))
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'info')
+
+if __name__ == '__main__':
+    uvicorn.run(
+        "asgi:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        log_level=LOG_LEVEL
+    )
@@ -0,0 +1,128 @@
+import threading
+import time
+import numpy as np
+
+
+class ShortTermVectorIndex:
+    def __init__(self, max_items=100000, initial_capacity=1024):
+        """
+        In-process vector index over short-term items, for semantic recall of recent context.
+
+        Embeddings are kept L2-normalized in one contiguous float32 matrix, so a lookup
+        is a single matrix-vector product followed by a top-k partition. Every row
+        carries the expiry time of its Redis key; expired rows are masked out of
+        searches and compacted away when space is needed or ``evict_expired`` runs.
+        """
+        self.max_items = max_items
+        self.initial_capacity = initial_capacity
+        self._vectors = None
+        self._expires_at = np.zeros(0, dtype=np.float64)
+        self._keys = []
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _ensure_capacity(self, dim, needed):
+        if self._vectors is None:
+            capacity = max(self.initial_capacity, needed)
+            self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+            self._expires_at = np.zeros(capacity, dtype=np.float64)
+        elif needed > len(self._vectors):
+            capacity = max(len(self._vectors) * 2, needed)
+            vectors = np.zeros((capacity, dim), dtype=np.float32)
+            vectors[:len(self._keys)] = self._vectors[:len(self._keys)]
+            expires_at = np.zeros(capacity, dtype=np.float64)
+            expires_at[:len(self._keys)] = self._expires_at[:len(self._keys)]
+            self._vectors, self._expires_at = vectors, expires_at
+
+    def add(self, keys, vectors, ttls, now=None):
+        """
+        Insert or refresh items; ``ttls`` are seconds, matching the Redis key TTLs.
+        """
+        now = time.time() if now is None else now
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            new_keys = [key for key in dict.fromkeys(keys) if key not in self._positions]
+            if len(self._keys) + len(new_keys) > self.max_items:
+                self._evict_expired(now)
+            overflow = len(self._keys) + len(new_keys) - self.max_items
+            if overflow > 0:
+                self._evict_soonest(overflow)
+            self._ensure_capacity(vectors.shape[1], len(self._keys) + len(new_keys))
+
+            for key, vector, ttl in zip(keys, vectors, ttls):
+                position = self._positions.get(key)
+                if position is None:
+                    position = len(self._keys)
+                    self._positions[key] = position
+                    self._keys.append(key)
+                self._vectors[position] = vector
+                self._expires_at[position] = now + ttl
+
+    def remove(self, key):
+        with self._lock:
+            self._remove_positions([self._positions[key]] if key in self._positions else [])
+
+    def search(self, vector, top_k=1, min_similarity=0.0, now=None):
+        """
+        Return up to ``top_k`` ``(key, cosine similarity)`` pairs at or above ``min_similarity``.
+        """
+        now = time.time() if now is None else now
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            size = len(self._keys)
+            if not size:
+                return []
+            similarities = self._vectors[:size] @ query
+            similarities[self._expires_at[:size] <= now] = -np.inf
+            k = min(top_k, size)
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top])]
+            return [
+                (self._keys[i], float(similarities[i]))
+                for i in top
+                if similarities[i] >= min_similarity
+            ]
+
+    def evict_expired(self, now=None):
+        """
+        Compact away expired rows; returns how many were removed.
+        """
+        with self._lock:
+            return self._evict_expired(time.time() if now is None else now)
+
+    def _evict_expired(self, now):
+        size = len(self._keys)
+        expired = np.flatnonzero(self._expires_at[:size] <= now)
+        self._remove_positions(expired.tolist())
+        return len(expired)
+
+    def _evict_soonest(self, count):
+        size = len(self._keys)
+        soonest = np.argpartition(self._expires_at[:size], count - 1)[:count]
+        self._remove_positions(soonest.tolist())
+
+    def _remove_positions(self, positions):
+        """
+        Delete rows by moving the last rows into the holes, keeping the matrix contiguous.
+        """
+        for position in sorted(positions, reverse=True):
+            last = len(self._keys) - 1
+            key = self._keys[position]
+            if position != last:
+                moved_key = self._keys[last]
+                self._vectors[position] = self._vectors[last]
+                self._expires_at[position] = self._expires_at[last]
+                self._keys[position] = moved_key
+                self._positions[moved_key] = position
+            self._keys.pop()
+            del self._positions[key]
@@ -0,0 +1,195 @@
+import hashlib
+import time
+from loguru import logger
+
+SHORT_TERM_PREFIX = "stm:"
+
+# KEYS: item hash, access index, expiry index. ARGV: id, text, importance, ttl, now.
+# Re-storing an item keeps its access count and creation time.
+STORE_SCRIPT = """
+redis.call('HSET', KEYS[1], 'text', ARGV[2], 'importance', ARGV[3], 'updated_at', ARGV[5])
+redis.call('HSETNX', KEYS[1], 'created_at', ARGV[5])
+redis.call('HSETNX', KEYS[1], 'access_count', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('ZADD', KEYS[2], redis.call('HGET', KEYS[1], 'access_count'), ARGV[1])
+redis.call('ZADD', KEYS[3], tonumber(ARGV[5]) + tonumber(ARGV[4]), ARGV[1])
+return 1
+"""
+
+# KEYS: item hash, access index, expiry index. ARGV: id, now.
+# Counts an access and returns text, importance and access count, or nil (dropping the
+# index entries) when the item has expired.
+TOUCH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    return false
+end
+local count = redis.call('HINCRBY', KEYS[1], 'access_count', 1)
+redis.call('HSET', KEYS[1], 'last_access', ARGV[2])
+redis.call('ZADD', KEYS[2], count, ARGV[1])
+return redis.call('HMGET', KEYS[1], 'text', 'importance', 'access_count')
+"""
+
+# KEYS: access index, expiry index, then the item hash of each id. ARGV: the ids.
+# Drops index entries of expired items; returns how many were dropped.
+EXPIRE_SCRIPT = """
+local removed = 0
+for i, id in ipairs(ARGV) do
+    if redis.call('EXISTS', KEYS[i + 2]) == 0 then
+        redis.call('ZREM', KEYS[1], id)
+        redis.call('ZREM', KEYS[2], id)
+        removed = removed + 1
+    end
+end
+return removed
+"""
+
+
+class ShortTermStore:
+    def __init__(self, redis_client, async_redis_client=None, prefix=SHORT_TERM_PREFIX):
+        """
+        Short-term memory records in Redis.
+
+        Each item is a hash ``<prefix>item:<id>`` (text, importance, access count and
+        timestamps) under its TTL, where the id is a hash of the text. Two sorted sets index
+        the items: ``<prefix>access`` by access count, so hot items are one range query
+        away, and ``<prefix>expiry`` by expiry time, so index entries of expired items can
+        be dropped without scanning. Writes and counted reads are Lua scripts, one round
+        trip each (pipelined for batches). Scripts name every key they touch; on Redis Cluster
+        the keys of a script must share a slot, so use a hash-tagged prefix (``stm:{name}:``).
+        """
+        logger.info(f"Initializing short-term store (prefix {prefix!r})")
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.prefix = prefix
+        self.item_prefix = f"{prefix}item:"
+        self.access_key = f"{prefix}access"
+        self.expiry_key = f"{prefix}expiry"
+        self._store = redis_client.register_script(STORE_SCRIPT)
+        self._touch = redis_client.register_script(TOUCH_SCRIPT)
+        self._expire = redis_client.register_script(EXPIRE_SCRIPT)
+        self._atouch = async_redis_client.register_script(TOUCH_SCRIPT) if async_redis_client else None
+
+    def item_id(self, text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+    def item_key(self, text):
+        return self.key_for_id(self.item_id(text))
+
+    def key_for_id(self, item_id):
+        return f"{self.item_prefix}{item_id}"
+
+    def id_for_key(self, key):
+        return key[len(self.item_prefix):]
+
+    def store_many(self, items):
+        """
+        Store ``(text, importance, ttl)`` items in one pipelined round trip.
+        """
+        now = time.time()
+        pipe = self.redis_client.pipeline(transaction=False)
+        for text, importance, ttl in items:
+            item_id = self.item_id(text)
+            self._store(
+                keys=[self.key_for_id(item_id), self.access_key, self.expiry_key],
+                args=[item_id, text, importance, ttl, now],
+                client=pipe
+            )
+        pipe.execute()
+
+    def touch(self, text):
+        """
+        Count an access to the item holding ``text``; returns its record or None.
+        """
+        return self.touch_id(self.item_id(text))
+
+    def touch_id(self, item_id):
+        reply = self._touch(
+            keys=[self.key_for_id(item_id), self.access_key, self.expiry_key], args=[item_id, time.time()]
+        )
+        return self._record(reply)
+
+    async def atouch(self, text):
+        """
+        Async variant of ``touch``; needs ``async_redis_client``.
+        """
+        return await self.atouch_id(self.item_id(text))
+
+    async def atouch_id(self, item_id):
+        reply = await self._atouch(
+            keys=[self.key_for_id(item_id), self.access_key, self.expiry_key], args=[item_id, time.time()]
+        )
+        return self._record(reply)
+
+    def _record(self, reply):
+        if not reply:
+            return None
+        text, importance, access_count = reply
+        return {"text": text, "importance": float(importance or 0), "access_count": int(access_count or 0)}
+
+    def hot_ids(self, min_access, offset=0, count=100):
+        """
+        Ids accessed at least ``min_access`` times, least accessed first.
+        """
+        return self.redis_client.zrangebyscore(self.access_key, min_access, "+inf", start=offset, num=count)
+
+    def get_many(self, item_ids):
+        """
+        Records (with TTL) of ``item_ids`` in one pipelined round trip; None for expired items.
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        for item_id in item_ids:
+            pipe.hgetall(self.key_for_id(item_id))
+            pipe.ttl(self.key_for_id(item_id))
+        replies = pipe.execute()
+        records = []
+        for i in range(len(item_ids)):
+            fields, ttl = replies[2 * i], replies[2 * i + 1]
+            if not fields or ttl == -2:
+                records.append(None)
+                continue
+            records.append({
+                "text": fields.get("text", ""),
+                "importance": float(fields.get("importance") or 0),
+                "access_count": int(fields.get("access_count") or 0),
+                "ttl": ttl,
+            })
+        return records
+
+    def remove(self, item_ids):
+        if not item_ids:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.delete(*[self.key_for_id(item_id) for item_id in item_ids])
+        pipe.zrem(self.access_key, *item_ids)
+        pipe.zrem(self.expiry_key, *item_ids)
+        pipe.execute()
+
+    def remove_expired(self, batch_size=1000, now=None):
+        """
+        Drop index entries of expired items, ``batch_size`` per script call.
+        """
+        now = time.time() if now is None else now
+        total = 0
+        offset = 0
+        while True:
+            item_ids = self.redis_client.zrangebyscore(self.expiry_key, "-inf", now, start=offset, num=batch_size)
+            if not item_ids:
+                return total
+            removed = self._expire(
+                keys=[self.access_key, self.expiry_key, *[self.key_for_id(item_id) for item_id in item_ids]],
+                args=item_ids
+            )
+            total += removed
+            # Entries of items that are still alive stay in the range; step past them
+            offset += len(item_ids) - removed
+            if len(item_ids) < batch_size:
+                return total
+
+    def stats(self):
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zcard(self.expiry_key)
+        pipe.zcount(self.expiry_key, "-inf", time.time())
+        items, expired = pipe.execute()
+        return {"items": items - expired, "expired_pending_cleanup": expired}
@@ -0,0 +1,199 @@
+"""
+Streaming snapshots of long-term memory.
+
+A snapshot holds a collection's rows (id, vector, text, metadata) as a Parquet file
+(when the path ends in ``.parquet``) or an Arrow IPC file (otherwise), written one
+page at a time. Vectors are fixed-size float32 lists, so importing reads them straight
+from a memory map into the insert without re-embedding or re-scoring.
+
+    python src/snapshots.py export memories.arrow
+    python src/snapshots.py import memories.arrow --tenant acme
+
+Needs pyarrow (the ``snapshots`` extra).
+"""
+import argparse
+import contextlib
+import json
+import os
+import time
+import numpy as np
+from loguru import logger
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_METADATA_KEY = b"memory_snapshot"
+
+
+def snapshot_format(path):
+    return "parquet" if path.endswith(".parquet") else "arrow"
+
+
+def snapshot_schema(dimension, info):
+    import pyarrow as pa
+    return pa.schema(
+        [
+            pa.field("id", pa.int64(), nullable=False),
+            pa.field("vector", pa.list_(pa.float32(), dimension), nullable=False),
+            pa.field("text", pa.string()),
+            pa.field("metadata", pa.string()),  # JSON
+        ],
+        metadata={SNAPSHOT_METADATA_KEY: json.dumps(info)}
+    )
+
+
+def _open_writer(path, schema, file_format):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if file_format == "parquet":
+        return pq.ParquetWriter(path, schema, compression="zstd")
+    return pa.ipc.new_file(path, schema)
+
+
+def _record_batch(page, schema):
+    import pyarrow as pa
+    dimension = schema.field("vector").type.list_size
+    vectors = np.stack([np.asarray(doc["vector"], dtype=np.float32) for doc in page]).reshape(-1)
+    return pa.record_batch(
+        [
+            pa.array([doc["id"] for doc in page], pa.int64()),
+            pa.FixedSizeListArray.from_arrays(pa.array(vectors), dimension),
+            pa.array([doc["text"] for doc in page], pa.string()),
+            pa.array([json.dumps(doc.get("metadata") or {}) for doc in page], pa.string()),
+        ],
+        schema=schema
+    )
+
+
+def export_snapshot(rag_service, path, batch_size=10000, filter=None):
+    """
+    Write the collection of ``rag_service`` to ``path``; returns the number of rows.
+
+    Rows are paged with ``iter_documents`` and written as one row group (record batch)
+    per page, so memory use does not grow with the collection. The file appears under
+    ``path`` only once it is complete. The embedding model id and dimension are kept in
+    the schema metadata and checked on import.
+    """
+    info = {
+        "version": SNAPSHOT_VERSION,
+        "collection": rag_service.collection_name,
+        "embedding_model_id": rag_service.embedding_model_id,
+        "dimension": rag_service.dimension,
+        "created_at": time.time(),
+    }
+    schema = snapshot_schema(rag_service.dimension, info)
+    logger.info(f"Exporting collection {rag_service.collection_name} to {path}")
+    started = time.perf_counter()
+    partial_path = f"{path}.partial"
+    rows = 0
+    try:
+        with _open_writer(partial_path, schema, snapshot_format(path)) as writer:
+            for page in rag_service.iter_documents(
+                batch_size=batch_size, output_fields=("id", "vector", "text", "metadata"), filter=filter
+            ):
+                writer.write_batch(_record_batch(page, schema))
+                rows += len(page)
+        os.replace(partial_path, path)
+    except Exception as e:
+        logger.error(f"Failed to export snapshot to {path}: {str(e)}")
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial_path)
+        raise
+    logger.success(f"Exported {rows} documents in {time.perf_counter() - started:.2f}s")
+    return rows
+
+
+def read_snapshot_info(path):
+    """
+    The metadata recorded by ``export_snapshot``.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if snapshot_format(path) == "parquet":
+        schema = pq.read_schema(path, memory_map=True)
+    else:
+        with pa.memory_map(path) as source:
+            schema = pa.ipc.open_file(source).schema
+    if not schema.metadata or SNAPSHOT_METADATA_KEY not in schema.metadata:
+        raise ValueError(f"{path} is not a memory snapshot")
+    return json.loads(schema.metadata[SNAPSHOT_METADATA_KEY])
+
+
+def _read_batches(path, batch_size):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if snapshot_format(path) == "parquet":
+        yield from pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_size)
+        return
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            for start in range(0, batch.num_rows, batch_size):
+                yield batch.slice(start, batch_size)
+
+
+def iter_snapshot(path, batch_size=10000):
+    """
+    Yield ``(ids, vectors, texts, metadata_list)`` chunks of at most ``batch_size`` rows.
+
+    ``vectors`` is an ``(n, dimension)`` float32 array; for Arrow files it is a view of
+    the memory-mapped file, valid until the next chunk is requested.
+    """
+    for batch in _read_batches(path, batch_size):
+        dimension = batch.schema.field("vector").type.list_size
+        vectors = batch.column("vector").flatten().to_numpy(zero_copy_only=False).reshape(-1, dimension)
+        yield (
+            batch.column("id").to_pylist(),
+            vectors,
+            batch.column("text").to_pylist(),
+            [json.loads(metadata) if metadata else {} for metadata in batch.column("metadata").to_pylist()],
+        )
+
+
+def import_snapshot(rag_service, path, batch_size=10000, keep_ids=True):
+    """
+    Bulk-insert a snapshot into the collection of ``rag_service``; returns the number of rows.
+
+    Stored vectors and metadata (importance, dedup hashes) are used as they are, so
+    nothing is embedded or scored again. Snapshot ids are kept unless ``keep_ids`` is
+    False, which assigns new ones, e.g. to clone rows into a collection that may already
+    hold them. Rows with kept ids replace stored rows with the same id, so importing a
+    snapshot again does not duplicate them. Raises ``ValueError`` when the snapshot was made with another embedding
+    model or dimension.
+    """
+    info = read_snapshot_info(path)
+    if info["dimension"] != rag_service.dimension or info["embedding_model_id"] != rag_service.embedding_model_id:
+        raise ValueError(
+            f"Snapshot vectors come from {info['embedding_model_id']} ({info['dimension']} dimensions), "
+            f"the collection uses {rag_service.embedding_model_id} ({rag_service.dimension} dimensions)"
+        )
+    logger.info(f"Importing snapshot {path} into collection {rag_service.collection_name}")
+    started = time.perf_counter()
+    rows = 0
+    for ids, vectors, texts, metadata_list in iter_snapshot(path, batch_size):
+        if not keep_ids:
+            ids = rag_service.id_generator.next_ids(len(ids))
+        # Kept ids may be stored already, e.g. when a snapshot is imported again
+        rag_service.insert_documents(ids, vectors, texts, metadata_list, upsert=keep_ids)
+        rows += len(ids)
+    logger.success(f"Imported {rows} documents in {time.perf_counter() - started:.2f}s")
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path")
+    parser.add_argument("--tenant", help="tenant whose collection to use (default: the default tenant)")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--new-ids", action="store_true", help="assign new ids on import")
+    parser.add_argument("--load-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    from main import DEFAULT_TENANT, tenants
+    rag_service = tenants.get(args.tenant or DEFAULT_TENANT, load=False).rag_service
+    if args.command == "export":
+        if not rag_service.load(wait=args.load_timeout):
+            raise SystemExit(f"Collection {rag_service.collection_name} did not load within {args.load_timeout}s")
+        export_snapshot(rag_service, args.path, batch_size=args.batch_size)
+    else:
+        import_snapshot(rag_service, args.path, batch_size=args.batch_size, keep_ids=not args.new_ids)
@@ -0,0 +1,160 @@
+import re
+import threading
+import time
+from loguru import logger
+from metrics import registry
+
+DEFAULT_TENANT = "default"
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_]{1,64}$")
+
+
+class InvalidTenantError(ValueError):
+    """
+    Raised for tenant ids that cannot name a collection and a Redis key prefix.
+    """
+
+
+class Tenant:
+    def __init__(self, tenant_id, rag_service, memory_service, consolidation_engine, long_term_pruner):
+        """
+        The services holding one tenant's memories.
+        """
+        self.tenant_id = tenant_id
+        self.rag_service = rag_service
+        self.memory_service = memory_service
+        self.consolidation_engine = consolidation_engine
+        self.long_term_pruner = long_term_pruner
+        self.last_used = time.time()
+        self.last_shared = 0.0
+
+
+class TenantManager:
+    def __init__(self, build_tenant, default_tenant=None, redis_client=None, registry_key="tenants",
+                 last_used_key="tenants:last_used", max_loaded=32, idle_seconds=900, load_wait=10.0):
+        """
+        Create tenants' services on first use and release the long-term memory of cold ones.
+
+        ``build_tenant(tenant_id)`` returns a ``Tenant`` whose RAG service has not been
+        loaded yet. ``get`` loads it (waiting up to ``load_wait`` seconds), and
+        ``release_idle`` releases tenants unused for ``idle_seconds``, as well as the least
+        recently used ones beyond ``max_loaded``. The ``default_tenant`` loads at startup
+        and is never released.
+
+        Tenant ids are recorded in the ``registry_key`` Redis set, so background jobs in
+        every process can find tenants that have only been used elsewhere. Releasing a
+        collection unloads it on the Milvus server for every process, so uses are also
+        shared in the ``last_used_key`` sorted set (at most every tenth of ``idle_seconds``)
+        and ``release_idle`` judges idleness across processes; call it from one process only.
+        """
+        logger.info(f"Initializing tenant manager (max_loaded={max_loaded}, idle_seconds={idle_seconds})")
+        self.build_tenant = build_tenant
+        self.redis_client = redis_client
+        self.registry_key = registry_key
+        self.last_used_key = last_used_key
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self.load_wait = load_wait
+        self._tenants = {}
+        self._lock = threading.Lock()
+        self.default_tenant_id = None
+        if default_tenant is not None:
+            self.default_tenant_id = default_tenant.tenant_id
+            self._tenants[default_tenant.tenant_id] = default_tenant
+
+    def validate(self, tenant_id):
+        if not isinstance(tenant_id, str) or not TENANT_ID_PATTERN.match(tenant_id):
+            raise InvalidTenantError("Tenant ids are 1-64 letters, digits or underscores")
+        return tenant_id
+
+    def get(self, tenant_id, load=True):
+        """
+        The tenant's services, created if needed. With ``load``, counts as a use and
+        loads the tenant's collection; background jobs pass ``load=False``.
+        """
+        self.validate(tenant_id)
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            with self._lock:
+                tenant = self._tenants.get(tenant_id)
+                if tenant is None:
+                    logger.info(f"Creating services for tenant {tenant_id}")
+                    tenant = self.build_tenant(tenant_id)
+                    self._tenants[tenant_id] = tenant
+                    if self.redis_client is not None:
+                        self.redis_client.sadd(self.registry_key, tenant_id)
+        if load:
+            self._touch(tenant)
+            if not tenant.rag_service.is_ready and tenant_id != self.default_tenant_id:
+                registry.inc("memory_tenant_loads_total", 1, "Tenant collections loaded on demand")
+                tenant.rag_service.load(wait=self.load_wait)
+        return tenant
+
+    def get_loaded(self, tenant_id):
+        """
+        The tenant if it exists and is loaded, counted as a use; None when ``get`` would block.
+        """
+        self.validate(tenant_id)
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None or not tenant.rag_service.is_ready:
+            return None
+        self._touch(tenant)
+        return tenant
+
+    def _touch(self, tenant):
+        tenant.last_used = time.time()
+        if (self.redis_client is not None and tenant.tenant_id != self.default_tenant_id
+                and tenant.last_used - tenant.last_shared >= self.idle_seconds / 10):
+            tenant.last_shared = tenant.last_used
+            self.redis_client.zadd(self.last_used_key, {tenant.tenant_id: tenant.last_used})
+
+    def known_tenants(self):
+        """
+        Ids of tenants created in this process or recorded by any process.
+        """
+        tenant_ids = set(self._tenants)
+        if self.redis_client is not None:
+            tenant_ids.update(self.redis_client.smembers(self.registry_key))
+        return sorted(tenant_id for tenant_id in tenant_ids if TENANT_ID_PATTERN.match(tenant_id))
+
+    def local_tenants(self):
+        """
+        Tenants whose services exist in this process.
+        """
+        return list(self._tenants.values())
+
+    def release_idle(self):
+        """
+        Release tenants no process used for ``idle_seconds`` and the least recently used
+        beyond ``max_loaded``; returns their ids.
+        """
+        now = time.time()
+        last_used = {
+            tenant.tenant_id: tenant.last_used
+            for tenant in list(self._tenants.values()) if tenant.rag_service.is_ready
+        }
+        if self.redis_client is not None:
+            # Tenants used anywhere since they were last released
+            for tenant_id, used_at in self.redis_client.zrange(self.last_used_key, 0, -1, withscores=True):
+                last_used[tenant_id] = max(last_used.get(tenant_id, 0.0), used_at)
+        last_used.pop(self.default_tenant_id, None)
+        loaded = sorted(last_used, key=last_used.get)
+        excess = len(loaded) - self.max_loaded
+        released = []
+        for i, tenant_id in enumerate(loaded):
+            if i < excess or now - last_used[tenant_id] >= self.idle_seconds:
+                tenant = self.get(tenant_id, load=False)
+                if tenant.rag_service.release():
+                    released.append(tenant_id)
+                    tenant.last_shared = 0.0
+                    if self.redis_client is not None:
+                        self.redis_client.zrem(self.last_used_key, tenant_id)
+        if released:
+            logger.info(f"Released {len(released)} idle tenants: {', '.join(released)}")
+        return released
+
+    def stats(self):
+        tenants = list(self._tenants.values())
+        return {
+            "active": len(tenants),
+            "loaded": sum(1 for tenant in tenants if tenant.rag_service.is_ready),
+        }
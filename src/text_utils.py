@@ -0,0 +1,15 @@
+import hashlib
+
+
+def normalize_text(text):
+    """
+    Collapse case, whitespace and trailing punctuation so near-identical inputs compare equal.
+    """
+    return " ".join(text.lower().split()).rstrip(" .!?")
+
+
+def text_hash(text):
+    """
+    SHA-256 hex digest of the normalized text; used as importance cache key and dedup hash.
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
@@ -0,0 +1,22 @@
+from rag import COMPRESSED_TEXT_MARKER, compress_text, decompress_text
+
+
+def test_long_text_is_stored_compressed_and_round_trips():
+    text = "Quantum mechanics is a fundamental theory in physics. " * 20
+
+    stored = compress_text(text)
+
+    assert stored.startswith(COMPRESSED_TEXT_MARKER)
+    assert len(stored) < len(text)
+    assert decompress_text(stored) == text
+
+
+def test_short_text_is_kept_as_is():
+    assert compress_text("OpenAI was founded in 2015") == "OpenAI was founded in 2015"
+    assert decompress_text("OpenAI was founded in 2015") == "OpenAI was founded in 2015"
+
+
+def test_text_resembling_compressed_text_round_trips():
+    text = COMPRESSED_TEXT_MARKER + "abc"
+
+    assert decompress_text(compress_text(text)) == text
@@ -0,0 +1,98 @@
+import fakeredis
+from consolidation import ConsolidationEngine
+from llm import BudgetExceededError
+from short_term_store import ShortTermStore
+
+
+class RecordingRAG:
+    def __init__(self):
+        self.batches = []
+
+    def add_documents(self, documents, metadata_list=None):
+        self.batches.append(list(documents))
+
+
+def seed(counts):
+    store = ShortTermStore(fakeredis.FakeRedis(decode_responses=True))
+    store.store_many([(text, 20, 60) for text in counts])
+    for text, count in counts.items():
+        for _ in range(count):
+            store.touch(text)
+    return store
+
+
+def test_promotes_hot_items_in_one_batch():
+    store = seed({"hot-1": 5, "hot-2": 3, "cold": 1})
+    store.redis_client.set("unrelated", "value")
+    rag = RecordingRAG()
+
+    stats = ConsolidationEngine(store, rag, access_threshold=3).run_pass()
+
+    assert stats["complete"] and stats["promoted"] == 2
+    assert len(rag.batches) == 1 and sorted(rag.batches[0]) == ["hot-1", "hot-2"]
+    assert store.touch("hot-1") is None
+    assert store.redis_client.zscore(store.access_key, store.item_id("hot-1")) is None
+    assert store.touch("cold")["access_count"] == 2
+    assert store.redis_client.get("unrelated") == "value"
+
+
+def test_shards_split_the_keyspace_without_overlap():
+    store = seed({f"item-{i}": 5 for i in range(50)})
+    rag = RecordingRAG()
+
+    for shard in range(3):
+        ConsolidationEngine(store, rag, shard_index=shard, shard_count=3, batch_size=7).run_pass()
+
+    promoted = [text for batch in rag.batches for text in batch]
+    assert sorted(promoted) == sorted(f"item-{i}" for i in range(50))
+
+
+def test_overlapping_workers_do_not_double_promote():
+    store = seed({"hot": 5})
+    rag = RecordingRAG()
+    first = ConsolidationEngine(store, rag)
+    second = ConsolidationEngine(store, rag)
+    candidate = (store.item_id("hot"), "hot", 5)
+
+    # Both workers saw the item as a candidate; only one claim can win
+    assert len(first._claim([candidate])) == 1
+    assert second._claim([candidate]) == []
+
+
+def test_pass_stops_at_time_budget_and_resumes():
+    store = seed({f"item-{i}": 5 for i in range(20)})
+    rag = RecordingRAG()
+    engine = ConsolidationEngine(store, rag, batch_size=5, time_budget=0)
+
+    passes = 1
+    while not engine.run_pass()["complete"]:
+        passes += 1
+
+    assert passes > 1
+    assert sum(len(batch) for batch in rag.batches) == 20
+
+
+def test_expired_items_leave_the_indexes():
+    store = seed({"hot": 5, "gone": 5})
+    store.redis_client.delete(store.item_key("gone"))
+    rag = RecordingRAG()
+
+    assert store.remove_expired(now=float("inf")) == 1
+    ConsolidationEngine(store, rag).run_pass()
+
+    assert rag.batches == [["hot"]]
+    assert store.redis_client.zcard(store.access_key) == 0
+    assert store.redis_client.zcard(store.expiry_key) == 0
+
+
+def test_items_are_promoted_unsummarized_once_the_budget_is_spent():
+    store = seed({"hot": 5})
+    rag = RecordingRAG()
+
+    def summarize(texts):
+        raise BudgetExceededError("LLM budget spent")
+
+    stats = ConsolidationEngine(store, rag, summarize=summarize).run_pass()
+
+    assert stats["promoted"] == 1
+    assert rag.batches == [["hot"]]
@@ -0,0 +1,66 @@
+import fakeredis
+import numpy as np
+from embedding_cache import EmbeddingCache
+
+
+class CountingEncoder:
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [np.full(self.dim, len(text), dtype=np.float64) for text in texts]
+
+
+def test_repeated_texts_are_encoded_once():
+    cache = EmbeddingCache()
+    encode = CountingEncoder()
+
+    first = cache.get_or_compute("model", "query", ["a", "bb", "a"], encode)
+    second = cache.get_or_compute("model", "query", ["bb"], encode)
+
+    assert encode.calls == [["a", "bb"]]
+    assert first[0].dtype == np.float32
+    np.testing.assert_array_equal(first[1], second[0])
+    stats = cache.stats()
+    assert stats["local_hits"] == 1
+    assert stats["misses"] == 3
+
+
+def test_keys_depend_on_model_and_kind():
+    cache = EmbeddingCache()
+    keys = {
+        cache.key("model-a", "query", "text"),
+        cache.key("model-b", "query", "text"),
+        cache.key("model-a", "document", "text"),
+    }
+    assert len(keys) == 3
+
+
+def test_lru_evicts_by_bytes():
+    encode = CountingEncoder(dim=16)
+    key_size = len(EmbeddingCache().key("m", "query", "x"))
+    cache = EmbeddingCache(max_bytes=2 * (16 * 4 + key_size))
+
+    cache.get_or_compute("m", "query", ["a", "b"], encode)
+    cache.get_or_compute("m", "query", ["a"], encode)  # "a" becomes most recently used
+    cache.get_or_compute("m", "query", ["c"], encode)  # evicts "b"
+    cache.get_or_compute("m", "query", ["a", "b"], encode)
+
+    assert encode.calls[-1] == ["b"]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_redis_tier_is_shared_between_processes():
+    server = fakeredis.FakeServer()
+    encode = CountingEncoder()
+    writer = EmbeddingCache(redis_client=fakeredis.FakeRedis(server=server))
+    reader = EmbeddingCache(redis_client=fakeredis.FakeRedis(server=server))
+
+    written = writer.get_or_compute("model", "document", ["shared"], encode)
+    read = reader.get_or_compute("model", "document", ["shared"], encode)
+
+    assert len(encode.calls) == 1
+    np.testing.assert_array_equal(written[0], read[0])
+    assert reader.stats()["redis_hits"] == 1
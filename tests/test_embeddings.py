@@ -0,0 +1,76 @@
+import threading
+import numpy as np
+from embeddings import EmbeddingBackend, HashingEmbeddingBackend, MicroBatcher, ProcessPoolEmbeddingBackend
+
+
+class RecordingBackend(EmbeddingBackend):
+    model_id = "recording"
+    dim = 2
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+
+    def _encode(self, texts, kind):
+        self.calls.append((kind, list(texts)))
+        return [np.array([len(text), 0 if kind == "query" else 1], dtype=np.float32) for text in texts]
+
+
+def test_hashing_backend_is_deterministic_and_normalized():
+    backend = HashingEmbeddingBackend(dim=64)
+
+    first, second, other = backend.encode_documents(["the quick fox", "The quick fox", "lazy dog"])
+
+    assert backend.is_ready
+    assert first.shape == (64,)
+    assert np.allclose(first, second)
+    assert np.isclose(np.linalg.norm(first), 1.0)
+    assert float(first @ other) < 0.99
+
+
+def test_backend_loads_lazily_once():
+    backend = RecordingBackend()
+    assert not backend.is_ready
+
+    backend.encode_queries(["a"])
+    backend.encode_documents(["b"])
+
+    assert backend.is_ready
+    assert backend.loads == 1
+
+
+def test_micro_batcher_groups_concurrent_calls_by_kind():
+    backend = RecordingBackend()
+    backend.ensure_loaded()
+    batcher = MicroBatcher(backend, max_wait_ms=200, max_batch_size=100)
+    results = {}
+
+    def encode(name, kind):
+        method = batcher.encode_queries if kind == "query" else batcher.encode_documents
+        results[name] = method([name])
+
+    threads = [threading.Thread(target=encode, args=(name, "query")) for name in ("a", "bb", "ccc")]
+    threads.append(threading.Thread(target=encode, args=("dddd", "document")))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(len(texts) for _, texts in backend.calls) == [1, 3]
+    assert results["ccc"][0].tolist() == [3, 0]
+    assert results["dddd"][0].tolist() == [4, 1]
+
+
+def test_process_pool_preserves_order():
+    backend = ProcessPoolEmbeddingBackend("hashing", {"dim": 32}, processes=2, min_chunk_size=2)
+    texts = [f"text number {i}" for i in range(7)]
+
+    vectors = backend.encode_documents(texts)
+
+    assert backend.model_id == "hashing-32"
+    assert np.allclose(vectors, HashingEmbeddingBackend(dim=32).encode_documents(texts))
+    backend.executor.shutdown()
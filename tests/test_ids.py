@@ -0,0 +1,119 @@
+import threading
+import time
+import fakeredis
+import pytest
+from ids import (EPOCH_MS, MAX_NODE_ID, MAX_SEQUENCE, SnowflakeIdGenerator, id_for_timestamp, lease_node_id,
+                 leased_id_generator, timestamp_of)
+
+
+def test_bulk_ids_are_unique_and_increasing():
+    ids = SnowflakeIdGenerator(node_id=1).next_ids(3 * (MAX_SEQUENCE + 1) + 5)
+
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert all(0 < doc_id < 2 ** 63 for doc_id in ids)
+
+
+def test_nodes_never_collide():
+    first = SnowflakeIdGenerator(node_id=1).next_ids(5000)
+    second = SnowflakeIdGenerator(node_id=2).next_ids(5000)
+
+    assert not set(first) & set(second)
+
+
+def test_concurrent_callers_get_distinct_ids():
+    generator = SnowflakeIdGenerator(node_id=3)
+    results = []
+
+    def worker():
+        results.extend(generator.next_ids(1000))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(results)) == 8000
+
+
+def test_ids_encode_their_timestamp():
+    before = int(time.time() * 1000)
+    doc_id = SnowflakeIdGenerator(node_id=0).next_id()
+
+    assert before <= timestamp_of(doc_id) <= int(time.time() * 1000)
+    assert id_for_timestamp(before) <= doc_id
+    assert id_for_timestamp(EPOCH_MS) == 0
+
+
+def test_leased_node_ids_are_distinct_until_none_is_free(monkeypatch):
+    monkeypatch.delenv("NODE_ID", raising=False)
+    redis_client = fakeredis.FakeRedis()
+    for node_id in range(MAX_NODE_ID):
+        redis_client.set(f"ids:node:{node_id}", "another process")
+
+    node_id, lease = lease_node_id(redis_client)
+
+    assert node_id == MAX_NODE_ID and lease.held
+    with pytest.raises(RuntimeError):
+        lease_node_id(redis_client)
+
+
+def test_restart_resumes_after_borrowed_milliseconds(monkeypatch):
+    monkeypatch.delenv("NODE_ID", raising=False)
+    redis_client = fakeredis.FakeRedis()
+    monkeypatch.setattr("ids.random.randrange", lambda stop: 7)
+    first = leased_id_generator(redis_client)
+    # Enough ids to run several milliseconds ahead of the wall clock
+    issued = first.next_ids(200 * (MAX_SEQUENCE + 1))
+    first.lease.release()
+
+    second = leased_id_generator(redis_client)
+
+    assert second.node_id == first.node_id == 7
+    assert second.next_id() > max(issued)
+
+
+def test_a_lost_node_lease_is_leased_again(monkeypatch):
+    monkeypatch.delenv("NODE_ID", raising=False)
+    redis_client = fakeredis.FakeRedis()
+    generator = leased_id_generator(redis_client)
+    node_id = generator.node_id
+    issued = generator.next_ids(5 * (MAX_SEQUENCE + 1))
+    generator.lease.renew()  # stores the last millisecond
+    # The key was evicted, or expired during a Redis outage
+    redis_client.delete(f"ids:node:{node_id}")
+    assert not generator.lease.renew()
+
+    doc_id = generator.next_id()
+
+    assert generator.node_id == node_id and generator.lease.held
+    assert doc_id > max(issued)
+    assert redis_client.get(f"ids:node:{node_id}").decode() == generator.lease.token
+
+
+def test_a_node_id_taken_meanwhile_is_replaced(monkeypatch):
+    monkeypatch.delenv("NODE_ID", raising=False)
+    redis_client = fakeredis.FakeRedis()
+    generator = leased_id_generator(redis_client)
+    node_id = generator.node_id
+    redis_client.set(f"ids:node:{node_id}", "another process")
+    generator.lease.renew()
+
+    generator.next_id()
+
+    assert generator.node_id != node_id and generator.lease.held
+
+
+def test_ids_are_refused_while_no_node_id_can_be_leased(monkeypatch):
+    monkeypatch.delenv("NODE_ID", raising=False)
+    redis_client = fakeredis.FakeRedis()
+    generator = leased_id_generator(redis_client)
+    for node_id in range(MAX_NODE_ID + 1):
+        redis_client.set(f"ids:node:{node_id}", "another process")
+    generator.lease.renew()
+
+    with pytest.raises(RuntimeError):
+        generator.next_id()
+    redis_client.delete("ids:node:3")
+    assert generator.next_id() and generator.node_id == 3
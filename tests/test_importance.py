@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+from importance import RETRY_SUFFIX, HeuristicPreScorer, ImportanceScorer, SimilarityPreScorer, parse_importance
+
+
+class ScriptedLLM:
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.prompts = []
+        self.system_prompts = []
+
+    def generate_response(self, system_prompt, prompt):
+        self.prompts.append(prompt)
+        self.system_prompts.append(system_prompt)
+        return self.replies.pop(0)
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ("85", 85.0),
+    ("Importance: 72/100", 72.0),
+    ("  40%\n", 40.0),
+    ("0.85", 85.0),
+    ("150", 100.0),
+])
+def test_parse_importance(reply, expected):
+    assert parse_importance(reply) == expected
+
+
+def test_parse_importance_rejects_text():
+    with pytest.raises(ValueError):
+        parse_importance("very important")
+
+
+def test_near_identical_inputs_hit_the_cache():
+    llm = ScriptedLLM("80")
+    scorer = ImportanceScorer(llm)
+
+    assert scorer.score("OpenAI was founded in December 2015") == 80.0
+    assert scorer.score("  openai was founded in   December 2015.") == 80.0
+
+    assert len(llm.prompts) == 1
+    assert scorer.stats()["avoided_fraction"] == 0.5
+
+
+def test_expired_entries_are_rescored():
+    llm = ScriptedLLM("80", "60")
+    scorer = ImportanceScorer(llm, cache_ttl=-1)
+
+    assert scorer.score("fact") == 80.0
+    assert scorer.score("fact") == 60.0
+
+
+def test_unparseable_replies_are_retried():
+    llm = ScriptedLLM("I'd say it matters", "55")
+    scorer = ImportanceScorer(llm, max_retries=1)
+
+    assert scorer.score("The speed of light is 299,792,458 m/s") == 55.0
+    assert scorer.stats()["llm_retries"] == 1
+
+    llm = ScriptedLLM("no", "still no")
+    with pytest.raises(ValueError):
+        ImportanceScorer(llm, max_retries=1).score("The speed of light is 299,792,458 m/s")
+
+
+def test_heuristic_prescorer_skips_the_llm():
+    llm = ScriptedLLM()
+    scorer = ImportanceScorer(llm, pre_scorers=[HeuristicPreScorer()])
+
+    assert scorer.score("Thanks!") == 5.0
+    assert llm.prompts == []
+
+
+def test_short_inputs_are_left_to_the_llm_by_default():
+    llm = ScriptedLLM("85")
+    scorer = ImportanceScorer(llm, pre_scorers=[HeuristicPreScorer()])
+
+    assert scorer.score("Allergic: peanuts") == 85.0
+    assert ImportanceScorer(llm, pre_scorers=[HeuristicPreScorer()], min_confidence=0.5).score("Allergic: peanuts") == 10.0
+
+
+def test_similarity_prescorer_reuses_close_scores():
+    vectors = {"a": [1.0, 0.0], "a'": [0.99, 0.05], "b": [0.0, 1.0]}
+    pre_scorer = SimilarityPreScorer(lambda texts: [np.array(vectors[t]) for t in texts], min_similarity=0.95)
+    llm = ScriptedLLM("90", "20")
+    scorer = ImportanceScorer(llm, pre_scorers=[pre_scorer])
+
+    assert scorer.score("a") == 90.0
+    assert scorer.score("a'") == 90.0
+    assert scorer.score("b") == 20.0
+    assert len(llm.prompts) == 2
+
+
+class BatchLLM(ScriptedLLM):
+    def __init__(self, scores):
+        super().__init__()
+        self.scores = scores
+        self.batches = []
+
+    def check_importance(self, texts, instructions):
+        self.batches.append(list(texts))
+        return [self.scores[text] for text in texts]
+
+
+def test_score_many_batches_the_texts_the_cache_cannot_answer():
+    fact, chatter, failing = "Paris is the capital of France", "I am sitting in a cafe", "Something unscorable here"
+    llm = BatchLLM({fact: 90.0, chatter: 20.0, failing: ValueError("no score")})
+    scorer = ImportanceScorer(llm, pre_scorers=[HeuristicPreScorer()])
+    llm.replies.append("90")
+    scorer.score(fact)
+
+    # The failing text is asked again on its own, and fails again
+    llm.replies.extend(["still nothing", "nothing"])
+
+    scores = scorer.score_many([fact, chatter, "Thanks!", chatter, failing])
+
+    assert scores[:4] == [90.0, 20.0, 5.0, 20.0]
+    assert isinstance(scores[4], ValueError)
+    assert llm.batches == [[chatter, failing]]
+    stats = scorer.stats()
+    assert (stats["llm_calls"], stats["llm_batches"], stats["batched"], stats["llm_failures"]) == (3, 1, 2, 1)
+
+
+def test_batch_items_without_a_usable_score_are_retried_alone():
+    llm = BatchLLM({"first fact": 80.0, "garbled": ValueError("no score")})
+    llm.replies.append("65")
+    scorer = ImportanceScorer(llm, max_retries=1)
+
+    assert scorer.score_many(["first fact", "garbled"]) == [80.0, 65.0]
+    assert llm.prompts == ["garbled"]
+    assert llm.system_prompts[0].endswith(RETRY_SUFFIX)
+    stats = scorer.stats()
+    assert (stats["llm_calls"], stats["llm_batches"], stats["llm_retries"]) == (1, 1, 1)
+
+
+def test_score_many_scores_one_by_one_without_a_batching_llm():
+    llm = ScriptedLLM("80", "30")
+    scorer = ImportanceScorer(llm, max_workers=1)
+
+    assert scorer.score_many(["first fact", "second fact"]) == [80.0, 30.0]
@@ -0,0 +1,166 @@
+import threading
+import time
+
+import pytest
+
+from ingest_queue import IngestQueue, QueueFullError
+
+
+class RecordingProcessor:
+    def __init__(self, fail_times=0, delay=0.0):
+        self.batches = []
+        self.tenants = []
+        self.fail_times = fail_times
+        self.delay = delay
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, texts, tenant=None):
+        self.gate.wait()
+        self.tenants.append(tenant)
+        time.sleep(self.delay)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("milvus unavailable")
+        self.batches.append(list(texts))
+        return [
+            {"status": "error", "error": "bad input"} if text == "bad" else {"status": "stored_short_term"}
+            for text in texts
+        ]
+
+
+def make_queue(tmp_path, processor, **kwargs):
+    kwargs.setdefault("poll_interval", 0.01)
+    return IngestQueue(processor, path=str(tmp_path / "queue.db"), **kwargs)
+
+
+def test_enqueued_items_are_processed_and_reported(tmp_path):
+    queue = make_queue(tmp_path, RecordingProcessor())
+
+    ids = queue.enqueue(["first", "bad"])
+
+    assert queue.flush(timeout=5)
+    statuses = queue.status(ids + ["unknown"])
+    assert statuses[ids[0]]["status"] == "done"
+    assert statuses[ids[0]]["result"] == {"status": "stored_short_term"}
+    assert statuses[ids[1]]["status"] == "failed"
+    assert "unknown" not in statuses
+    queue.stop()
+
+
+def test_full_queue_rejects_new_items(tmp_path):
+    processor = RecordingProcessor()
+    processor.gate.clear()
+    queue = make_queue(tmp_path, processor, workers=1, max_depth=3)
+
+    queue.enqueue(["a", "b"])
+    with pytest.raises(QueueFullError):
+        queue.enqueue(["c", "d"])
+
+    processor.gate.set()
+    assert queue.flush(timeout=5)
+    queue.enqueue(["c", "d"])
+    assert queue.flush(timeout=5)
+    queue.stop()
+
+
+def test_failed_batches_are_retried(tmp_path):
+    queue = make_queue(tmp_path, RecordingProcessor(fail_times=1), max_attempts=2)
+
+    item_id = queue.enqueue(["retry me"])[0]
+
+    assert queue.flush(timeout=5)
+    assert queue.status([item_id])[item_id]["status"] == "done"
+    assert queue.status([item_id])[item_id]["attempts"] == 2
+    queue.stop()
+
+
+def test_batch_size_grows_while_a_backlog_is_waiting(tmp_path):
+    processor = RecordingProcessor()
+    processor.gate.clear()
+    queue = make_queue(tmp_path, processor, workers=1, max_batch_size=8)
+
+    queue.enqueue([f"item-{i}" for i in range(40)])
+    processor.gate.set()
+
+    assert queue.flush(timeout=5)
+    assert [len(batch) for batch in processor.batches][:4] == [1, 2, 4, 8]
+    assert queue.stats()["done"] == 40
+    queue.stop()
+
+
+def test_items_survive_a_restart(tmp_path):
+    processor = RecordingProcessor()
+    processor.gate.clear()
+    queue = make_queue(tmp_path, processor, workers=0)
+    item_id = queue.enqueue(["persisted"])[0]
+    queue.stop()
+
+    restarted = make_queue(tmp_path, RecordingProcessor())
+    assert restarted.flush(timeout=5)
+    assert restarted.status([item_id])[item_id]["status"] == "done"
+    restarted.stop()
+
+
+def test_items_are_processed_per_tenant(tmp_path):
+    producer = make_queue(tmp_path, RecordingProcessor(), workers=0)
+    first = producer.enqueue(["a1"], tenant="acme")[0]
+    producer.enqueue(["b1"], tenant="globex")
+    producer.enqueue(["a2"], tenant="acme")
+
+    processor = RecordingProcessor()
+    queue = make_queue(tmp_path, processor, workers=1, min_batch_size=4)
+
+    assert queue.flush(timeout=5)
+    assert processor.batches == [["a1", "a2"], ["b1"]]
+    assert processor.tenants == ["acme", "globex"]
+    assert queue.status([first])[first]["tenant"] == "acme"
+    queue.stop()
+
+
+def test_items_whose_lease_expired_on_the_last_attempt_fail(tmp_path):
+    crashed = make_queue(tmp_path, RecordingProcessor(), workers=0, max_attempts=1, lease_seconds=0)
+    item_id = crashed.enqueue(["poison"])[0]
+    # Claimed, then the process died without finishing the item
+    assert [item[0] for item in crashed._claim(10)[1]] == [item_id]
+    crashed.stop()
+
+    processor = RecordingProcessor()
+    restarted = make_queue(tmp_path, processor, max_attempts=1)
+    assert restarted.flush(timeout=5)
+    assert restarted.status([item_id])[item_id]["status"] == "failed"
+    assert processor.batches == []
+    restarted.stop()
+
+
+def test_results_are_only_recorded_by_the_lease_holder(tmp_path):
+    stale = make_queue(tmp_path, RecordingProcessor(), workers=0, lease_seconds=0)
+    item_id = stale.enqueue(["slow"])[0]
+    stale_lease, _ = stale._claim(10)
+    # The lease expired and another worker claimed the item
+    current_lease, _ = stale._claim(10)
+
+    stale._finish([("failed", None, time.time(), item_id)], stale_lease)
+    assert stale.status([item_id])[item_id]["status"] == "processing"
+    stale._finish([("done", None, time.time(), item_id)], current_lease)
+    assert stale.status([item_id])[item_id]["status"] == "done"
+    stale.stop()
+
+
+def test_leases_are_renewed_while_a_batch_runs(tmp_path):
+    claimed_meanwhile = []
+
+    def process(texts, tenant=None):
+        time.sleep(0.5)
+        claimed_meanwhile.extend(queue._claim(10)[1])
+        return [{"status": "stored_short_term"} for _ in texts]
+
+    queue = make_queue(tmp_path, process, workers=0, lease_seconds=0.3)
+    item_id = queue.enqueue(["slow"])[0]
+    lease_until, batch = queue._claim(10)
+
+    queue._process(batch, lease_until)
+
+    assert claimed_meanwhile == []
+    assert queue.status([item_id])[item_id]["status"] == "done"
+    queue.stop()
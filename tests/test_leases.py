@@ -0,0 +1,43 @@
+import fakeredis
+
+from leases import RedisLease
+
+
+def test_only_one_holder_at_a_time():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    first = RedisLease(redis_client, "background:leader", ttl=60)
+    second = RedisLease(redis_client, "background:leader", ttl=60)
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert first.acquire()  # the holder renews
+
+    first.release()
+    assert not first.held
+    assert second.acquire()
+
+
+def test_a_lease_taken_over_after_expiry_is_lost():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    lease = RedisLease(redis_client, "background:leader", ttl=60)
+    assert lease.acquire()
+
+    # The TTL ran out and another process took the key
+    redis_client.set("background:leader", "someone else")
+
+    assert not lease.renew()
+    assert not lease.held
+    lease.release()
+    assert redis_client.get("background:leader") == "someone else"
+
+
+def test_renewals_call_back():
+    renewals = []
+    lease = RedisLease(fakeredis.FakeRedis(decode_responses=True), "ids:node:1", ttl=60,
+                       on_renew=lambda: renewals.append(1))
+
+    lease.acquire()
+    lease.renew()
+    lease.release()
+
+    assert renewals == [1, 1]
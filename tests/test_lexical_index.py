@@ -0,0 +1,49 @@
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def build_index():
+    index = BM25Index()
+    index.add(
+        [1, 2, 3],
+        [
+            "OpenAI was founded in December 2015",
+            "Quantum mechanics describes atoms and photons",
+            "OpenAI builds large language models",
+        ],
+    )
+    return index
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("When was OpenAI founded?") == ["openai", "founded"]
+
+
+def test_search_ranks_documents_sharing_rare_terms_first():
+    results = build_index().search("When was OpenAI founded?")
+
+    assert [doc_id for doc_id, _ in results] == [1, 3]
+    assert results[0][1] > results[1][1]
+
+
+def test_require_all_terms_keeps_only_exact_term_matches():
+    index = build_index()
+
+    assert [doc_id for doc_id, _ in index.search("openai founded", require_all_terms=True)] == [1]
+    assert index.search("openai photons", require_all_terms=True) == []
+
+
+def test_documents_are_replaced_and_removed():
+    index = build_index()
+    index.add([2], ["OpenAI photons"])
+    index.remove([1, 3])
+
+    assert len(index) == 1
+    assert [doc_id for doc_id, _ in index.search("openai")] == [2]
+    assert index.search("quantum") == []
+
+
+def test_reciprocal_rank_fusion_favors_ids_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]], k=60)
+
+    assert [doc_id for doc_id, _ in fused][:2] == [1, 3]
+    assert fused[0][1] == 1 / 61 + 1 / 63
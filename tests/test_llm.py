@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from llm import LLM, BudgetExceededError, TokenBucket, parse_json_list
+
+
+class FakeMessage:
+    def __init__(self, content, input_tokens=100, output_tokens=10):
+        self.content = content
+        self.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                               "total_tokens": input_tokens + output_tokens}
+
+
+class FakeChatModel:
+    def __init__(self, reply, delay=0.0):
+        self.reply = reply
+        self.delay = delay
+        self.prompts = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, messages):
+        with self._lock:
+            self.prompts.append(messages)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return FakeMessage(self.reply(messages))
+
+    async def ainvoke(self, messages):
+        with self._lock:
+            self.prompts.append(messages)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return FakeMessage(self.reply(messages))
+
+
+def make_llm(monkeypatch, reply, delay=0.0, **kwargs):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    llm = LLM(**kwargs)
+    llm.llm = FakeChatModel(reply, delay)
+    return llm
+
+
+def numbered(messages):
+    return [json.loads(line.split(". ", 1)[1]) for line in messages[1][1].splitlines()]
+
+
+def test_importance_of_many_texts_takes_one_prompt_per_chunk(monkeypatch):
+    def reply(messages):
+        if "numbered items" not in messages[0][1]:
+            return str(len(messages[1][1]))
+        return json.dumps([len(text) for text in numbered(messages)])
+
+    llm = make_llm(monkeypatch, reply, batch_items=3)
+
+    scores = llm.check_importance(["a", "bb", "ccc", "dddd"])
+
+    assert scores == [1.0, 2.0, 3.0, 4.0]
+    assert len(llm.llm.prompts) == 2
+    assert llm.stats()["input_tokens"] == 200
+
+
+def test_texts_without_a_usable_score_get_a_value_error(monkeypatch):
+    def reply(messages):
+        return "both matter" if "a" in numbered(messages) else json.dumps([80, "meh"])
+
+    llm = make_llm(monkeypatch, reply, batch_items=2)
+
+    scores = llm.check_importance(["a", "b", "c", "d"])
+
+    # Not asked again; the caller decides whether to retry
+    assert [type(score) for score in scores] == [ValueError, ValueError, float, ValueError]
+    assert scores[2] == 80.0
+    assert len(llm.llm.prompts) == 2
+
+
+def test_summaries_fall_back_to_the_original_text(monkeypatch):
+    llm = make_llm(monkeypatch, lambda messages: json.dumps(["Short.", ""]))
+
+    assert llm.summarize(["A long story", "Kept as is"]) == ["Short.", "Kept as is"]
+
+
+def test_concurrency_is_capped_for_threads_and_tasks(monkeypatch):
+    llm = make_llm(monkeypatch, lambda messages: "50", delay=0.05, max_concurrency=2)
+
+    llm.batch([("system", str(i)) for i in range(6)])
+    assert llm.llm.peak == 2
+
+    llm.llm.peak = 0
+    asyncio.run(llm.abatch([("system", str(i)) for i in range(6)]))
+    assert llm.llm.peak == 2
+
+
+def test_budget_stops_calls_in_its_context(monkeypatch):
+    llm = make_llm(monkeypatch, lambda messages: "50")
+
+    with llm.budget(max_tokens=200) as budget:
+        llm.generate_response("system", "one")
+        llm.batch([("system", "two")])
+        with pytest.raises(BudgetExceededError):
+            llm.generate_response("system", "three")
+    assert budget.tokens == 220
+    llm.generate_response("system", "outside")
+
+
+def test_token_bucket_makes_callers_wait_once_empty():
+    bucket = TokenBucket(60)
+
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(2) == pytest.approx(2.0, abs=0.1)
+
+
+def test_parse_json_list_checks_the_length():
+    assert parse_json_list('Scores: [1, 2]', 2) == [1, 2]
+    with pytest.raises(ValueError):
+        parse_json_list("[1, 2]", 3)
@@ -99,5 +99,17 @@ def test_memory_system():
         print(f"Query: {query}")
         print(f"Result: {json.dumps(result, indent=2)}\n")
 
+    # Test 6: Batch Processing
+    print("\nTest 6: Batch Processing")
+    batch_inputs = [
+        "The Eiffel Tower is located in Paris",
+        "I had pasta for lunch",
+        "Water boils at 100 degrees Celsius at sea level",
+    ]
+    result = make_request("process/batch", {"inputs": batch_inputs})
+    for input_text, item in zip(batch_inputs, result["results"]):
+        print(f"Input: {input_text}")
+        print(f"Result: {json.dumps(item, indent=2)}\n")
+
 if __name__ == "__main__":
     test_memory_system()
@@ -0,0 +1,122 @@
+import fakeredis
+import numpy as np
+import pytest
+
+from memory import MemoryService
+from short_term_index import ShortTermVectorIndex
+from short_term_store import ShortTermStore
+
+
+class FakeScorer:
+    def __init__(self, scores):
+        self.scores = scores
+        self.batches = []
+
+    def score(self, text):
+        score = self.score_many([text])[0]
+        if isinstance(score, Exception):
+            raise score
+        return score
+
+    def score_many(self, texts):
+        self.batches.append(list(texts))
+        return [self.scores[text] for text in texts]
+
+
+class FakeRAG:
+    is_ready = True
+    embedder_ready = True
+
+    def __init__(self, lexical_results=None):
+        self.lexical_results = lexical_results
+        self.encoded = []
+        self.queries = []
+        self.added = []
+
+    def encode_documents(self, documents):
+        self.encoded.append(list(documents))
+        return [np.ones(4) for _ in documents]
+
+    def encode_queries(self, queries):
+        self.queries.append(list(queries))
+        return [np.ones(4) for _ in queries]
+
+    def effective_search_mode(self, mode=None):
+        return mode or "auto"
+
+    def try_lexical_search(self, query, mode=None):
+        return self.lexical_results
+
+    def search_by_vector(self, query_vector, nprobe=None, ef=None, lexical_query=None):
+        return [{"id": 2, "text": "dense match", "score": 0.5}]
+
+    def add_documents(self, documents, metadata_list=None):
+        self.added.append((list(documents), metadata_list))
+        return list(range(len(documents)))
+
+
+def make_service(scores, short_term_index=None, rag_service=None):
+    store = ShortTermStore(fakeredis.FakeRedis(decode_responses=True))
+    return MemoryService(store, rag_service or FakeRAG(), FakeScorer(scores), importance_threshold=70,
+                         short_term_index=short_term_index)
+
+
+def test_batch_routes_by_importance_and_keeps_input_order():
+    service = make_service({"fact one": 90.0, "chatter": 20.0, "fact two": 80.0, "aside": 10.0},
+                           short_term_index=ShortTermVectorIndex())
+
+    results = service.process_batch(["fact one", "chatter", "fact two", "aside"])
+
+    assert [result["status"] for result in results] == [
+        "stored_long_term", "stored_short_term", "stored_long_term", "stored_short_term"
+    ]
+    assert [result["importance"] for result in results] == [90.0, 20.0, 80.0, 10.0]
+    # One scoring call, one long-term insert and one short-term embedding for the whole batch
+    assert service.scorer.batches == [["fact one", "chatter", "fact two", "aside"]]
+    assert [documents for documents, _ in service.rag_service.added] == [["fact one", "fact two"]]
+    assert service.rag_service.encoded == [["chatter", "aside"]]
+    assert service.short_term_store.touch("chatter")["importance"] == 20.0
+    assert len(service.short_term_index) == 2
+
+
+def test_scoring_errors_are_reported_per_input():
+    service = make_service({"fact": 90.0, "broken": ValueError("no score"), "chatter": 20.0})
+
+    results = service.process_batch(["fact", "broken", "chatter"])
+
+    assert results[0]["status"] == "stored_long_term"
+    assert results[1] == {"status": "error", "error": "no score"}
+    assert results[2]["status"] == "stored_short_term"
+    assert service.rag_service.added[0][0] == ["fact"]
+
+
+def test_scoring_errors_raise_when_asked():
+    service = make_service({"fact": 90.0, "broken": ValueError("no score")})
+
+    with pytest.raises(ValueError):
+        service.process_batch(["fact", "broken"], raise_errors=True)
+    assert service.rag_service.added == []
+
+
+def test_query_checks_the_semantic_short_term_tier_before_a_keyword_hit():
+    rag_service = FakeRAG(lexical_results=[{"id": 1, "text": "keyword match", "score": 3.0}])
+    service = make_service({"recent chatter": 20.0}, short_term_index=ShortTermVectorIndex(),
+                           rag_service=rag_service)
+    service.process_batch(["recent chatter"])
+
+    source, result = service.query("something like the recent chatter")
+
+    assert source == "short_term"
+    assert result["text"] == "recent chatter"
+
+
+def test_query_answers_keyword_hits_without_embedding_while_the_tier_is_empty():
+    rag_service = FakeRAG(lexical_results=[{"id": 1, "text": "keyword match", "score": 3.0}])
+    service = make_service({}, short_term_index=ShortTermVectorIndex(), rag_service=rag_service)
+
+    assert service.query("keyword") == ("long_term", rag_service.lexical_results)
+    assert rag_service.queries == []
+
+    rag_service.lexical_results = None
+    source, results = service.query("no keyword match")
+    assert source == "long_term" and results[0]["text"] == "dense match"
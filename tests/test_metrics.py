@@ -0,0 +1,58 @@
+import pytest
+
+from metrics import MetricsRegistry, SlowRequestTracker, registry, span, timed
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    metrics = MetricsRegistry()
+    metrics.observe("latency_seconds", 0.003, "Latency", stage="a")
+    metrics.observe("latency_seconds", 2.0, "Latency", stage="a")
+
+    text = metrics.render()
+
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{stage="a",le="0.005"} 1' in text
+    assert 'latency_seconds_bucket{stage="a",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{stage="a"} 2' in text
+
+
+def test_collectors_are_rendered_as_gauges():
+    metrics = MetricsRegistry()
+    metrics.register_collector(lambda: [("cache_hit_rate", {"cache": "embeddings"}, 0.75)])
+
+    assert 'cache_hit_rate{cache="embeddings"} 0.75' in metrics.render()
+
+
+def test_spans_are_recorded_in_the_current_request():
+    tracker = SlowRequestTracker(slow_threshold=0)
+
+    @timed("decorated")
+    def work():
+        with span("inner"):
+            return 42
+
+    with tracker.request("/test-span") as trace:
+        assert work() == 42
+
+    assert [stage for stage, _ in trace.stages] == ["inner", "decorated"]
+    assert 'memory_requests_total{endpoint="/test-span",status="ok"} 1' in registry.render()
+
+
+def test_failed_requests_are_counted_as_errors():
+    tracker = SlowRequestTracker(slow_threshold=0)
+
+    with pytest.raises(RuntimeError):
+        with tracker.request("/test-error"):
+            raise RuntimeError("boom")
+
+    assert 'memory_requests_total{endpoint="/test-error",status="error"} 1' in registry.render()
+
+
+def test_requests_without_a_route_share_one_label():
+    tracker = SlowRequestTracker(slow_threshold=0)
+
+    for _ in range(2):
+        with tracker.request(None):
+            pass
+
+    assert 'memory_requests_total{endpoint="unmatched",status="ok"} 2' in registry.render()
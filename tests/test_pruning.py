@@ -0,0 +1,105 @@
+import time
+
+from llm import BudgetExceededError
+from pruning import LongTermPruner
+
+
+class FakeRAG:
+    def __init__(self, docs):
+        self.docs = {doc["id"]: doc for doc in docs}
+        self.pages = []
+        self.deletes = []
+        self.upserts = []
+
+    def iter_documents(self, batch_size=1000, output_fields=(), filter=None, start_after=None):
+        ids = sorted(doc_id for doc_id in self.docs if start_after is None or doc_id > start_after)
+        for start in range(0, len(ids), batch_size):
+            page = [dict(self.docs[doc_id]) for doc_id in ids[start:start + batch_size]]
+            self.pages.append([doc["id"] for doc in page])
+            yield page
+
+    def get_documents(self, ids, output_fields=()):
+        return [{"id": doc_id, "vector": [0.0], "text": self.docs[doc_id]["text"]} for doc_id in ids]
+
+    def upsert_documents(self, rows):
+        self.upserts.append(rows)
+        for row in rows:
+            self.docs[row["id"]] = {"id": row["id"], "text": row["text"], "metadata": row["metadata"]}
+
+    def delete_documents(self, ids, batch_size=1000):
+        self.deletes.append(list(ids))
+        for doc_id in ids:
+            del self.docs[doc_id]
+
+
+class FakeScorer:
+    def __init__(self, scores):
+        self.scores = scores
+        self.scored = []
+
+    def score_many(self, texts):
+        self.scored.extend(texts)
+        return [self.scores[text] for text in texts]
+
+
+def doc(doc_id, text, last_evaluated=None):
+    metadata = {} if last_evaluated is None else {"importance": 90.0, "last_evaluated": last_evaluated}
+    return {"id": doc_id, "text": text, "metadata": metadata}
+
+
+def test_stale_documents_are_rescored_and_pruned_or_kept():
+    now = time.time()
+    rag = FakeRAG([
+        doc(1, "stale fact", last_evaluated=now - 10 * 24 * 3600),
+        doc(2, "fresh fact", last_evaluated=now - 60),
+        doc(3, "never scored chatter"),
+        doc(4, "never scored fact"),
+    ])
+    scorer = FakeScorer({"stale fact": 80.0, "never scored chatter": 10.0, "never scored fact": 95.0})
+
+    stats = LongTermPruner(rag, scorer, reevaluate_after=7 * 24 * 3600, page_size=2).run_pass()
+
+    assert stats["complete"] and stats["seen"] == 4 and stats["scored"] == 3 and stats["deleted"] == 1
+    assert "fresh fact" not in scorer.scored
+    assert sorted(rag.docs) == [1, 2, 4]
+    assert rag.docs[4]["metadata"]["importance"] == 95.0
+    assert rag.docs[1]["metadata"]["last_evaluated"] >= now
+    assert rag.pages == [[1, 2], [3, 4]]
+
+
+def test_deletes_are_batched():
+    rag = FakeRAG([doc(i, f"chatter {i}") for i in range(1, 8)])
+    scorer = FakeScorer({f"chatter {i}": 5.0 for i in range(1, 8)})
+
+    LongTermPruner(rag, scorer, page_size=2, delete_batch_size=4).run_pass()
+
+    assert rag.deletes == [[1, 2, 3, 4], [5, 6, 7]]
+    assert rag.docs == {}
+
+
+def test_pass_stops_at_the_time_budget_and_resumes_from_the_cursor():
+    rag = FakeRAG([doc(i, f"fact {i}") for i in range(1, 6)])
+    scorer = FakeScorer({f"fact {i}": 90.0 for i in range(1, 6)})
+    pruner = LongTermPruner(rag, scorer, page_size=2, time_budget=0)
+
+    first = pruner.run_pass()
+
+    assert not first["complete"] and first["seen"] == 2
+    assert pruner.cursor == 2
+    while not pruner.run_pass()["complete"]:
+        pass
+    assert rag.pages == [[1, 2], [3, 4], [5]]
+    assert pruner.cursor is None
+    assert sorted(scorer.scored) == [f"fact {i}" for i in range(1, 6)]
+
+
+def test_pass_stops_when_the_llm_budget_is_spent():
+    rag = FakeRAG([doc(1, "chatter"), doc(2, "more chatter")])
+    scorer = FakeScorer({"chatter": 5.0, "more chatter": BudgetExceededError("LLM budget spent")})
+    pruner = LongTermPruner(rag, scorer, page_size=1)
+
+    stats = pruner.run_pass()
+
+    assert not stats["complete"] and stats["deleted"] == 1
+    assert pruner.cursor == 1
+    assert sorted(rag.docs) == [2]
@@ -0,0 +1,311 @@
+import re
+import time
+
+import fakeredis
+import pytest
+from pymilvus import DataType, MilvusClient
+
+from embeddings import HashingEmbeddingBackend
+from leases import RedisLease
+from lexical_index import BM25Index
+from rag import COMPRESSED_TEXT_MARKER, RAGService, build_index_params
+from text_utils import text_hash
+
+
+@pytest.fixture(scope="module")
+def milvus_client(tmp_path_factory):
+    # Milvus Lite: a local database file, no server needed
+    client = MilvusClient(str(tmp_path_factory.mktemp("milvus") / "rag.db"))
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def collection_name(request):
+    return re.sub(r"\W", "_", f"test_{request.node.name}")
+
+
+@pytest.fixture
+def make_rag(milvus_client, collection_name):
+    def make(**options):
+        options.setdefault("client", milvus_client)
+        options.setdefault("reset", True)
+        rag_service = RAGService(collection_name=collection_name,
+                                 embedding_backend=HashingEmbeddingBackend(dim=64), **options)
+        assert rag_service.load(wait=30)
+        return rag_service
+    return make
+
+
+def test_reopening_a_collection_keeps_its_rows(make_rag):
+    ids = make_rag().add_documents(["The user lives in Berlin", "The user likes tea"])
+
+    reopened = make_rag(reset=False)
+
+    assert reopened.row_count == 2
+    assert sorted(doc["id"] for doc in reopened.get_documents(ids)) == sorted(ids)
+
+
+def test_reset_drops_the_collection(make_rag):
+    make_rag().add_documents(["The user lives in Berlin"])
+
+    assert make_rag(reset=True).row_count == 0
+
+
+def test_collections_with_another_dimension_are_rejected(make_rag, milvus_client, collection_name):
+    make_rag()
+
+    with pytest.raises(ValueError, match="dimension 64, expected 32"):
+        RAGService(client=milvus_client, collection_name=collection_name,
+                   embedding_backend=HashingEmbeddingBackend(dim=32), load=False)
+
+
+def test_collections_with_other_field_types_are_rejected(milvus_client, collection_name):
+    schema = milvus_client.create_schema(auto_id=False, enable_dynamic_field=True)
+    schema.add_field("id", DataType.INT64, is_primary=True)
+    schema.add_field("vector", DataType.FLOAT_VECTOR, dim=64)
+    schema.add_field("text", DataType.INT64)
+    schema.add_field("metadata", DataType.JSON)
+    milvus_client.drop_collection(collection_name=collection_name)
+    milvus_client.create_collection(collection_name=collection_name, schema=schema)
+
+    with pytest.raises(ValueError, match="field 'text' has type"):
+        RAGService(client=milvus_client, collection_name=collection_name,
+                   embedding_backend=HashingEmbeddingBackend(dim=64), load=False)
+
+
+def test_is_ready_once_loaded(make_rag, milvus_client, collection_name):
+    make_rag()
+    milvus_client.release_collection(collection_name=collection_name)
+
+    rag_service = RAGService(client=milvus_client, collection_name=collection_name,
+                             embedding_backend=HashingEmbeddingBackend(dim=64), load=False)
+
+    assert not rag_service.is_ready
+    assert rag_service.load(wait=30)
+    assert rag_service.is_ready
+
+
+def metadata_by_id(rag_service, ids):
+    return {doc["id"]: doc["metadata"] for doc in rag_service.get_documents(ids, output_fields=("id", "metadata"))}
+
+
+def test_exact_duplicates_are_merged_into_the_stored_row(make_rag):
+    rag_service = make_rag(deduplicate=True)
+    [stored] = rag_service.add_documents(["The user lives in Berlin."])
+
+    # Same text after normalizing case, whitespace and trailing punctuation
+    ids = rag_service.add_documents(["the user  lives in berlin", "The user likes tea"])
+
+    assert ids[0] == stored and ids[1] != stored
+    assert metadata_by_id(rag_service, [stored])[stored]["hit_count"] == 2
+    assert rag_service.dedup_stats()["exact_duplicates"] == 1
+    assert rag_service.dedup_stats()["inserted"] == 2
+
+
+def test_near_duplicates_are_merged_by_vector_similarity(make_rag):
+    rag_service = make_rag(deduplicate=True, dedup_similarity=0.95)
+    [stored] = rag_service.add_documents(["The user lives in Berlin"])
+
+    # Same words in another order: a different hash but the same hashed embedding
+    [near, other] = rag_service.add_documents(["In Berlin the user lives", "The user owns a red bicycle"])
+
+    assert near == stored and other != stored
+    assert metadata_by_id(rag_service, [stored])[stored]["hit_count"] == 2
+    assert rag_service.dedup_stats()["near_duplicates"] == 1
+
+
+def test_duplicates_within_one_batch_are_inserted_once(make_rag):
+    rag_service = make_rag(deduplicate=True, dedup_similarity=0.95)
+
+    ids = rag_service.add_documents([
+        "The user lives in Berlin", "the user lives in berlin!", "In Berlin the user lives", "The user likes tea"
+    ])
+
+    assert ids[0] == ids[1] == ids[2] and ids[3] != ids[0]
+    assert metadata_by_id(rag_service, [ids[0]])[ids[0]]["hit_count"] == 3
+    stats = rag_service.dedup_stats()
+    assert (stats["inserted"], stats["exact_duplicates"], stats["near_duplicates"]) == (2, 1, 1)
+    assert stats["rows_saved"] == 2 and stats["saved_fraction"] == 0.5
+
+
+def test_content_hashes_are_stored_in_an_indexed_field(make_rag, milvus_client):
+    rag_service = make_rag(deduplicate=True)
+    [stored] = rag_service.add_documents(["The user lives in Berlin."])
+
+    assert "content_hash" in milvus_client.list_indexes(collection_name=rag_service.collection_name)
+    rows = milvus_client.query(
+        collection_name=rag_service.collection_name, filter=f'content_hash == "{text_hash("the user lives in berlin")}"',
+        output_fields=["id"]
+    )
+    assert [row["id"] for row in rows] == [stored]
+    assert "content_hash" not in metadata_by_id(rag_service, [stored])[stored]
+
+
+def test_collections_without_a_hash_field_deduplicate_by_metadata(make_rag, milvus_client, collection_name):
+    schema = milvus_client.create_schema(auto_id=False, enable_dynamic_field=True)
+    schema.add_field("id", DataType.INT64, is_primary=True)
+    schema.add_field("vector", DataType.FLOAT_VECTOR, dim=64)
+    schema.add_field("text", DataType.VARCHAR, max_length=4096)
+    schema.add_field("metadata", DataType.JSON)
+    milvus_client.drop_collection(collection_name=collection_name)
+    milvus_client.create_collection(collection_name=collection_name, schema=schema)
+    milvus_client.create_index(collection_name=collection_name, index_params=build_index_params("FLAT"))
+
+    rag_service = make_rag(deduplicate=True, reset=False)
+    [stored] = rag_service.add_documents(["The user lives in Berlin."])
+
+    assert not rag_service.has_hash_field
+    assert rag_service.add_documents(["the user lives in berlin"]) == [stored]
+    assert rag_service.dedup_stats()["exact_duplicates"] == 1
+
+
+def test_without_deduplication_every_document_is_inserted(make_rag):
+    rag_service = make_rag()
+
+    ids = rag_service.add_documents(["The user lives in Berlin", "The user lives in Berlin"])
+
+    assert len(set(ids)) == 2
+    assert len(rag_service.get_documents(ids, output_fields=("id",))) == 2
+
+
+def test_text_starting_with_the_compression_marker_round_trips(make_rag):
+    rag_service = make_rag()
+    text = COMPRESSED_TEXT_MARKER + "not actually compressed"
+
+    [doc_id] = rag_service.add_documents([text])
+
+    assert rag_service.get_documents([doc_id])[0]["text"] == text
+    assert rag_service.search(text, top_k=1)[0]["text"] == text
+
+
+def index_type_of(rag_service):
+    return rag_service.client.describe_index(collection_name=rag_service.collection_name, index_name="vector")["index_type"]
+
+
+def test_outgrown_index_is_built_on_restart_while_another_process_serves_it(make_rag):
+    serving = make_rag(index_type="IVF_FLAT", index_build_threshold=10)
+    serving.add_documents([f"fact number {i}" for i in range(12)])
+    assert index_type_of(serving) == "FLAT"
+
+    # The collection stays loaded on the server across restarts
+    restarted = make_rag(index_type="IVF_FLAT", index_build_threshold=10, reset=False)
+
+    assert index_type_of(restarted) == "IVF_FLAT"
+    assert restarted.built_index_type == "IVF_FLAT"
+
+
+def test_only_the_build_lease_holder_builds(make_rag):
+    make_rag().add_documents([f"fact number {i}" for i in range(12)])
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    builder = RedisLease(redis_client, "milvus:index_build:test")
+    assert builder.acquire()
+
+    waiting = make_rag(index_type="IVF_FLAT", index_build_threshold=10, reset=False,
+                       index_build_lease=RedisLease(redis_client, "milvus:index_build:test"))
+
+    assert index_type_of(waiting) == "FLAT"
+    builder.release()
+    waiting.release()
+    assert waiting.load(wait=30)
+    assert index_type_of(waiting) == "IVF_FLAT"
+
+
+class ReleasedElsewhereClient:
+    """
+    Milvus Lite searches released collections; a server reports them not loaded.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.failures = 1
+        self.loads = 0
+
+    def search(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("collection not loaded[collection=test]")
+        return self.client.search(**kwargs)
+
+    def load_collection(self, **kwargs):
+        self.loads += 1
+        return self.client.load_collection(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_searches_load_a_collection_released_elsewhere_again(make_rag, milvus_client):
+    client = ReleasedElsewhereClient(milvus_client)
+    rag_service = make_rag(client=client)
+    rag_service.add_documents(["The user lives in Berlin"])
+
+    results = rag_service.search("Berlin", top_k=1)
+
+    assert results[0]["text"] == "The user lives in Berlin"
+    assert client.loads == 2
+
+
+@pytest.mark.parametrize("built, rows_at_build, row_count, expected", [
+    ("FLAT", 0, 9, False),           # below the build threshold
+    ("FLAT", 0, 10, True),           # threshold reached, configured type not built yet
+    ("IVF_FLAT", 10, 14, False),     # 4 new rows < 0.5 * 10
+    ("IVF_FLAT", 10, 15, True),      # 5 new rows reach the rebuild ratio
+    ("IVF_FLAT", 100, 20, False),    # rows were deleted since the build
+])
+def test_index_build_threshold_and_rebuild_ratio(make_rag, built, rows_at_build, row_count, expected):
+    rag_service = make_rag(index_type="IVF_FLAT", index_build_threshold=10, index_rebuild_ratio=0.5)
+    rag_service.built_index_type, rag_service.rows_at_build, rag_service.row_count = built, rows_at_build, row_count
+
+    assert rag_service._needs_index_build() is expected
+
+
+def test_flat_collections_never_need_a_build(make_rag):
+    rag_service = make_rag(index_type="FLAT", index_build_threshold=10)
+    rag_service.row_count = 10 ** 6
+
+    assert not rag_service._needs_index_build()
+
+
+def test_serving_collection_is_rebuilt_only_with_auto_rebuild(make_rag):
+    rag_service = make_rag(index_type="IVF_FLAT", index_build_threshold=10)
+    rag_service.add_documents([f"fact number {i}" for i in range(12)])
+    assert index_type_of(rag_service) == "FLAT"
+
+    rag_service.auto_rebuild = True
+    rag_service.add_documents(["one more fact"])
+    deadline = time.monotonic() + 30
+    while rag_service.built_index_type != "IVF_FLAT" and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert index_type_of(rag_service) == "IVF_FLAT"
+    assert rag_service.load(wait=30)
+    assert rag_service.rows_at_build == 13
+
+
+def test_lexical_index_picks_up_rows_other_processes_inserted(make_rag):
+    writer = make_rag(lexical_index=BM25Index())
+    reader = make_rag(lexical_index=BM25Index(), reset=False, lexical_refresh_seconds=None)
+    # The lexical index is built after load() returns
+    deadline = time.monotonic() + 10
+    while not reader.lexical_ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.add_documents(["The user plays the cello"])
+
+    assert reader.lexical_search("cello") == []
+    assert reader.refresh_lexical_index() == 1
+    assert [doc["text"] for doc in reader.lexical_search("cello")] == ["The user plays the cello"]
+    # Rows already indexed are not added again
+    assert reader.refresh_lexical_index() == 0
+
+
+def test_rerank_skips_candidates_deleted_since_the_search(make_rag):
+    rag_service = make_rag()
+    [kept, deleted] = rag_service.add_documents(["The user lives in Berlin", "The user likes tea"])
+    query = rag_service.encode_queries(["Where does the user live?"])[0]
+    candidates = [{"id": kept, "score": 0.1}, {"id": deleted, "score": 0.2}]
+
+    rag_service.delete_documents([deleted])
+
+    assert [result["id"] for result in rag_service._rerank(query, candidates, top_k=2)] == [kept]
+    rag_service.delete_documents([kept])
+    assert rag_service._rerank(query, candidates, top_k=2) == []
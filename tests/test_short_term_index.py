@@ -0,0 +1,45 @@
+import numpy as np
+from short_term_index import ShortTermVectorIndex
+
+
+def test_search_returns_closest_items_above_threshold():
+    index = ShortTermVectorIndex()
+    index.add(["a", "b", "c"], [[1, 0, 0], [0, 1, 0], [0.9, 0.1, 0]], [60, 60, 60], now=0)
+
+    results = index.search([1, 0, 0], top_k=2, min_similarity=0.5, now=1)
+
+    assert [key for key, _ in results] == ["a", "c"]
+    assert results[0][1] == 1.0
+    assert index.search([0, 0, 1], min_similarity=0.5, now=1) == []
+
+
+def test_expired_items_are_hidden_and_evicted():
+    index = ShortTermVectorIndex()
+    index.add(["short", "long"], [[1, 0], [0.8, 0.2]], [10, 100], now=0)
+
+    assert index.search([1, 0], now=20)[0][0] == "long"
+    assert index.evict_expired(now=20) == 1
+    assert len(index) == 1
+
+
+def test_remove_keeps_rows_contiguous():
+    index = ShortTermVectorIndex(initial_capacity=2)
+    keys = [f"k{i}" for i in range(10)]
+    index.add(keys, np.eye(10), [60] * 10, now=0)
+
+    index.remove("k3")
+    index.remove("k0")
+
+    assert len(index) == 8
+    for i in range(1, 10):
+        if i != 3:
+            assert index.search(np.eye(10)[i], now=1)[0][0] == f"k{i}"
+
+
+def test_max_items_evicts_soonest_expiring():
+    index = ShortTermVectorIndex(max_items=2)
+    index.add(["a", "b"], [[1, 0], [0, 1]], [10, 50], now=0)
+    index.add(["c"], [[1, 1]], [30], now=0)
+
+    assert len(index) == 2
+    assert index.search([1, 0], min_similarity=0.99, now=1) == []
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import fakeredis
+
+from short_term_store import ShortTermStore
+
+
+def make_store():
+    server = fakeredis.FakeServer()
+    return ShortTermStore(
+        fakeredis.FakeRedis(server=server, decode_responses=True),
+        async_redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    )
+
+
+def test_items_are_hashes_under_their_ttl():
+    store = make_store()
+    store.store_many([("I just had a coffee", 20.0, 30)])
+
+    key = store.item_key("I just had a coffee")
+    assert store.redis_client.hget(key, "text") == "I just had a coffee"
+    assert store.redis_client.hget(key, "importance") == "20.0"
+    assert 0 < store.redis_client.ttl(key) <= 30
+    assert store.stats() == {"items": 1, "expired_pending_cleanup": 0}
+
+
+def test_touch_counts_accesses_in_the_hash_and_the_index():
+    store = make_store()
+    store.store_many([("coffee", 20.0, 30)])
+
+    store.touch("coffee")
+    record = asyncio.run(store.atouch("coffee"))
+
+    assert record == {"text": "coffee", "importance": 20.0, "access_count": 2}
+    assert store.hot_ids(2) == [store.item_id("coffee")]
+    assert store.touch("tea") is None
+
+
+def test_storing_again_keeps_the_access_count():
+    store = make_store()
+    store.store_many([("coffee", 20.0, 30)])
+    store.touch("coffee")
+
+    store.store_many([("coffee", 40.0, 50)])
+
+    assert store.touch("coffee") == {"text": "coffee", "importance": 40.0, "access_count": 2}
+
+
+def test_touching_an_expired_item_drops_its_index_entries():
+    store = make_store()
+    store.store_many([("coffee", 20.0, 30)])
+    store.redis_client.delete(store.item_key("coffee"))
+
+    assert store.touch("coffee") is None
+    assert store.redis_client.zcard(store.access_key) == 0
+    assert store.redis_client.zcard(store.expiry_key) == 0
+
+
+def test_remove_expired_steps_past_items_that_are_still_alive():
+    store = make_store()
+    store.store_many([(f"item {i}", 20.0, 30) for i in range(5)])
+    expiring = [f"item {i}" for i in range(5, 10)]
+    store.store_many([(text, 20.0, 60) for text in expiring])
+    for text in expiring:
+        store.redis_client.delete(store.item_key(text))
+
+    # Every entry is due by then, but the first window holds only live items
+    removed = store.remove_expired(batch_size=2, now=time.time() + 120)
+
+    assert removed == 5
+    assert store.redis_client.zcard(store.expiry_key) == 5
+    assert store.touch("item 0")["access_count"] == 1
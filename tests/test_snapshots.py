@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from ids import SnowflakeIdGenerator
+from snapshots import export_snapshot, import_snapshot, iter_snapshot, read_snapshot_info
+
+
+class FakeRAG:
+    collection_name = "rag_collection"
+    embedding_model_id = "hashing-8"
+    dimension = 8
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.inserts = []
+        self.id_generator = SnowflakeIdGenerator()
+
+    def iter_documents(self, batch_size=1000, output_fields=(), filter=None):
+        for start in range(0, len(self.rows), batch_size):
+            yield self.rows[start:start + batch_size]
+
+    def insert_documents(self, ids, vectors, documents, metadata_list, upsert=False):
+        self.inserts.append(len(ids))
+        if upsert:
+            self.rows = [row for row in self.rows if row["id"] not in set(ids)]
+        self.rows.extend(
+            {"id": doc_id, "vector": np.array(vector), "text": text, "metadata": metadata}
+            for doc_id, vector, text, metadata in zip(ids, vectors, documents, metadata_list)
+        )
+
+
+def make_rows(count):
+    rng = np.random.default_rng(0)
+    return [
+        {"id": i + 1, "vector": rng.random(8, dtype=np.float32), "text": f"fact {i}",
+         "metadata": {"importance": float(i), "content_hash": f"h{i}"}}
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("name", ["memories.arrow", "memories.parquet"])
+def test_snapshots_round_trip_in_pages(tmp_path, name):
+    path = str(tmp_path / name)
+    source = FakeRAG(make_rows(25))
+
+    assert export_snapshot(source, path, batch_size=10) == 25
+    target = FakeRAG()
+    assert import_snapshot(target, path, batch_size=10) == 25
+
+    assert target.inserts == [10, 10, 5]
+    assert [row["id"] for row in target.rows] == [row["id"] for row in source.rows]
+    assert [row["metadata"] for row in target.rows] == [row["metadata"] for row in source.rows]
+    np.testing.assert_array_equal(
+        np.stack([row["vector"] for row in target.rows]), np.stack([row["vector"] for row in source.rows])
+    )
+    assert read_snapshot_info(path)["embedding_model_id"] == "hashing-8"
+
+
+def test_vectors_are_read_as_a_float32_matrix(tmp_path):
+    path = str(tmp_path / "memories.arrow")
+    export_snapshot(FakeRAG(make_rows(3)), path)
+
+    _, vectors, texts, _ = next(iter_snapshot(path))
+
+    assert vectors.shape == (3, 8) and vectors.dtype == np.float32
+    assert texts == ["fact 0", "fact 1", "fact 2"]
+
+
+def test_importing_again_replaces_rows_with_kept_ids(tmp_path):
+    path = str(tmp_path / "memories.arrow")
+    export_snapshot(FakeRAG(make_rows(3)), path)
+    target = FakeRAG()
+
+    import_snapshot(target, path)
+    import_snapshot(target, path)
+
+    assert [row["id"] for row in target.rows] == [1, 2, 3]
+
+
+def test_new_ids_can_be_assigned_on_import(tmp_path):
+    path = str(tmp_path / "memories.arrow")
+    export_snapshot(FakeRAG(make_rows(3)), path)
+    target = FakeRAG()
+
+    import_snapshot(target, path, keep_ids=False)
+
+    assert all(row["id"] > 3 for row in target.rows)
+
+
+def test_snapshots_of_another_embedding_model_are_rejected(tmp_path):
+    path = str(tmp_path / "memories.arrow")
+    export_snapshot(FakeRAG(make_rows(3)), path)
+    target = FakeRAG()
+    target.embedding_model_id = "other-model"
+
+    with pytest.raises(ValueError):
+        import_snapshot(target, path)
+    assert target.rows == []
@@ -0,0 +1,108 @@
+import time
+
+import fakeredis
+import pytest
+
+from tenants import DEFAULT_TENANT, InvalidTenantError, Tenant, TenantManager
+
+
+class FakeRAG:
+    def __init__(self, ready=False):
+        self.is_ready = ready
+        self.loads = 0
+
+    def load(self, wait=None):
+        self.loads += 1
+        self.is_ready = True
+        return True
+
+    def release(self):
+        self.is_ready = False
+        return True
+
+
+def make_manager(redis_client=None, **kwargs):
+    built = []
+
+    def build(tenant_id):
+        built.append(tenant_id)
+        return Tenant(tenant_id, FakeRAG(), None, None, None)
+
+    manager = TenantManager(
+        build,
+        default_tenant=Tenant(DEFAULT_TENANT, FakeRAG(ready=True), None, None, None),
+        redis_client=redis_client or fakeredis.FakeRedis(decode_responses=True),
+        **kwargs
+    )
+    return manager, built
+
+
+def test_tenants_are_created_once_and_loaded_on_use():
+    manager, built = make_manager()
+
+    tenant = manager.get("acme")
+    assert manager.get("acme") is tenant
+    assert built == ["acme"]
+    assert tenant.rag_service.loads == 1
+    assert manager.stats() == {"active": 2, "loaded": 2}
+
+
+def test_background_access_does_not_load():
+    manager, _ = make_manager()
+
+    tenant = manager.get("acme", load=False)
+
+    assert not tenant.rag_service.is_ready
+    assert manager.get_loaded("acme") is None
+
+
+@pytest.mark.parametrize("tenant_id", ["", "a/b", "x" * 65, None])
+def test_invalid_tenant_ids_are_rejected(tenant_id):
+    manager, built = make_manager()
+
+    with pytest.raises(InvalidTenantError):
+        manager.get(tenant_id)
+    assert built == []
+
+
+def test_known_tenants_include_those_registered_by_other_processes():
+    manager, _ = make_manager()
+    manager.get("acme")
+    manager.redis_client.sadd("tenants", "globex")
+
+    assert manager.known_tenants() == ["acme", DEFAULT_TENANT, "globex"]
+
+
+def test_idle_and_least_recently_used_tenants_are_released():
+    manager, _ = make_manager(max_loaded=1, idle_seconds=60)
+    for tenant_id in ("acme", "globex", "initech"):
+        manager.get(tenant_id)
+    manager.get("initech").last_used -= 120
+    manager.redis_client.zadd("tenants:last_used", {"initech": time.time() - 120})
+
+    released = manager.release_idle()
+
+    # initech is idle, acme the least recently used of the rest
+    assert sorted(released) == ["acme", "initech"]
+    assert manager.get_loaded("globex") is not None
+    assert manager.get_loaded(DEFAULT_TENANT) is not None
+    assert manager.redis_client.zrange("tenants:last_used", 0, -1) == ["globex"]
+
+
+def test_release_idle_judges_use_in_every_process():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    worker, _ = make_manager(redis_client=redis_client, idle_seconds=60)
+    leader, _ = make_manager(redis_client=redis_client, idle_seconds=60)
+    worker.get("acme")
+    leader.get("acme").last_used -= 120
+
+    # Still in use by the worker
+    assert leader.release_idle() == []
+
+    redis_client.zadd("tenants:last_used", {"acme": time.time() - 120})
+    worker.get("globex")
+    worker.get("globex")  # within the sharing interval, not written again
+
+    # Released for every process though only the worker loaded it
+    assert leader.release_idle() == ["acme"]
+    assert redis_client.zrange("tenants:last_used", 0, -1) == ["globex"]